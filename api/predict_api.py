@@ -1,19 +1,38 @@
 """
 MediGuard Prediction API
 REST API endpoint for disease prediction.
+
+Production: gunicorn api.predict_api:app (settings in gunicorn.conf.py)
 """
 
 import json
-from flask import Flask, request, jsonify
-from typing import Dict, Any
+import orjson
+from functools import lru_cache
+from flask import Flask, request
+from typing import Dict, Any, Tuple
 
 from mediguard.models.scaler import BiomarkerScaler
 from mediguard.models.predictor import MediGuardPredictor
 from mediguard.parsers.input_parser import BiomarkerInputParser
 from mediguard.knowledge.rag_engine import MedicalRAGEngine
+from mediguard.utils.json_provider import OrjsonProvider
+
+try:
+    import msgspec
+
+    class PredictRequest(msgspec.Struct):
+        """Validated /api/predict request body."""
+        biomarkers: Dict[str, float]
+
+    # strict=False keeps accepting numeric strings such as "14.5"
+    _predict_decoder = msgspec.json.Decoder(PredictRequest, strict=False)
+    MSGSPEC_AVAILABLE = True
+except ImportError:
+    MSGSPEC_AVAILABLE = False
 
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Initialize components
 scaler = BiomarkerScaler()
@@ -22,6 +41,81 @@ parser = BiomarkerInputParser()
 rag_engine = MedicalRAGEngine()
 
 
+# NumPy scalars/arrays from the scaler and predictor encode natively
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def ojsonify(obj: Any, status: int = 200):
+    """Serialize a response body with orjson (drop-in for jsonify)."""
+    return app.response_class(
+        orjson.dumps(obj, option=ORJSON_OPTIONS),
+        status=status,
+        mimetype="application/json"
+    )
+
+
+def _prediction_body(biomarker_values: Dict[str, Any]) -> bytes:
+    """Run the prediction pipeline and return the serialized response body."""
+    # Scale biomarkers
+    scaling_result = scaler.scale_all(biomarker_values)
+    scaled_values = scaling_result["scaled_values"]
+    warnings = scaling_result["warnings"]
+
+    # Make prediction
+    prediction_result = predictor.predict(scaled_values, biomarker_values)
+
+    # Retrieve references
+    references = rag_engine.retrieve_references(
+        prediction_result["prediction"],
+        max_results=3
+    )
+
+    return orjson.dumps({
+        "status": "success",
+        "prediction": prediction_result,
+        "warnings": warnings,
+        "references": references,
+        "raw_summary": scaling_result["raw_summary"],
+    }, option=ORJSON_OPTIONS)
+
+
+@lru_cache(maxsize=2048)
+def _cached_prediction_body(biomarker_items: Tuple[Tuple[str, Any], ...]) -> bytes:
+    """
+    Memoized _prediction_body keyed on the exact (id, value) pairs.
+
+    Values are not rounded: thresholds like troponin > 0.04 make any
+    rounding change the prediction. Validation errors are not cached.
+    """
+    return _prediction_body(dict(biomarker_items))
+
+
+def _decode_predict_request() -> Tuple[Dict[str, float], str]:
+    """Parse and type-check the request body in one pass with msgspec."""
+    try:
+        return _predict_decoder.decode(request.get_data()).biomarkers, ""
+    except msgspec.ValidationError as e:
+        return {}, f"Validation error: {str(e)}"
+    except msgspec.DecodeError:
+        return {}, "Request body must be valid JSON"
+
+
+def _validate_predict_request() -> Tuple[Dict[str, Any], str]:
+    """Fallback request validation when msgspec is not installed."""
+    data = request.get_json(silent=True)
+
+    if not data or "biomarkers" not in data:
+        return {}, "Missing 'biomarkers' field in request"
+
+    biomarker_values = data["biomarkers"]
+
+    # Validate input is a dictionary
+    if not isinstance(biomarker_values, dict):
+        return {}, "biomarkers must be a dictionary/object"
+
+    return biomarker_values, ""
+
+
 @app.route("/api/predict", methods=["POST"])
 def predict():
     """
@@ -51,53 +145,37 @@ def predict():
     }
     """
     try:
-        data = request.get_json()
-
-        if not data or "biomarkers" not in data:
-            return jsonify({
-                "error": "Missing 'biomarkers' field in request"
-            }), 400
-
-        biomarker_values = data["biomarkers"]
-
-        # Validate input is a dictionary
-        if not isinstance(biomarker_values, dict):
-            return jsonify({
-                "error": "biomarkers must be a dictionary/object"
-            }), 400
-
-        # Scale biomarkers
-        scaling_result = scaler.scale_all(biomarker_values)
-        scaled_values = scaling_result["scaled_values"]
-        warnings = scaling_result["warnings"]
-
-        # Make prediction
-        prediction_result = predictor.predict(scaled_values, biomarker_values)
-
-        # Retrieve references
-        references = rag_engine.retrieve_references(
-            prediction_result["prediction"],
-            max_results=3
-        )
-
-        # Return response
-        return jsonify({
-            "status": "success",
-            "prediction": prediction_result,
-            "warnings": warnings,
-            "references": references,
-            "raw_summary": scaling_result["raw_summary"],
-        }), 200
+        if MSGSPEC_AVAILABLE:
+            biomarker_values, error = _decode_predict_request()
+        else:
+            biomarker_values, error = _validate_predict_request()
+
+        if error:
+            return ojsonify({"error": error}, 400)
+
+        try:
+            cache_key = tuple(sorted(biomarker_values.items()))
+            hash(cache_key)
+        except TypeError:
+            # Unhashable values (lists, objects) skip the cache and fail validation
+            cache_key = None
+
+        if cache_key is not None:
+            body = _cached_prediction_body(cache_key)
+        else:
+            body = _prediction_body(biomarker_values)
+
+        return app.response_class(body, status=200, mimetype="application/json")
 
     except ValueError as e:
-        return jsonify({
+        return ojsonify({
             "error": f"Validation error: {str(e)}"
-        }), 400
+        }, 400)
 
     except Exception as e:
-        return jsonify({
+        return ojsonify({
             "error": f"Internal server error: {str(e)}"
-        }), 500
+        }, 500)
 
 
 @app.route("/api/biomarkers", methods=["GET"])
@@ -121,7 +199,7 @@ def get_biomarkers():
     }
     """
     biomarkers = scaler.get_all_biomarkers()
-    return jsonify({"biomarkers": biomarkers}), 200
+    return ojsonify({"biomarkers": biomarkers}, 200)
 
 
 @app.route("/api/template", methods=["GET"])
@@ -144,12 +222,13 @@ def get_template():
 @app.route("/api/health", methods=["GET"])
 def health():
     """Health check endpoint."""
-    return jsonify({
+    return ojsonify({
         "status": "healthy",
         "service": "mediguard-api",
         "version": "1.0.0"
-    }), 200
+    }, 200)
 
 
 if __name__ == "__main__":
+    # Development server only; use gunicorn in production
     app.run(host="0.0.0.0", port=5001, debug=False)
@@ -0,0 +1,35 @@
+"""
+Gunicorn configuration for MediGuard.
+
+Picked up automatically by gunicorn from the project root:
+    gunicorn wsgi:app                 # WhatsApp bot (Procfile)
+    gunicorn api.predict_api:app      # Prediction REST API
+"""
+
+import multiprocessing
+import os
+import sys
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+
+# WEB_CONCURRENCY is set by Heroku based on dyno size
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+
+# Threaded workers keep connections alive and suit the bot's background
+# threads; set GUNICORN_WORKER_CLASS=gevent for an async worker instead
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Load config, rule tables and compiled kernels once before forking
+preload_app = True
+
+timeout = 30
+keepalive = 5
+
+
+def post_worker_init(worker):
+    """Open each worker's own Groq connection before it takes traffic."""
+    llm_provider = sys.modules.get("mediguard.utils.llm_provider")
+    if llm_provider is not None:
+        llm_provider.warm_up()
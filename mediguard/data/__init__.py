@@ -0,0 +1,9 @@
+"""
+MediGuard Data Package
+Biomarker and disease category configuration.
+"""
+
+from ._loader import load_biomarker_config
+from ._order import BIOMARKER_INDEX, BIOMARKER_ORDER
+
+__all__ = ["load_biomarker_config", "BIOMARKER_ORDER", "BIOMARKER_INDEX"]
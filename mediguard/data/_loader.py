@@ -0,0 +1,29 @@
+"""
+Biomarker Configuration Loader
+Parses biomarkers.json once per process and shares the result.
+"""
+
+import os
+from functools import lru_cache
+from typing import Dict, Any
+
+import orjson
+
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "biomarkers.json")
+
+
+@lru_cache(maxsize=1)
+def load_biomarker_config() -> Dict[str, Any]:
+    """
+    Load the bundled biomarkers.json.
+
+    The parsed config is cached and shared by every caller (scaler,
+    predictor, bot), so it must be treated as read-only. Loading it before
+    gunicorn forks (--preload) lets all workers share the same pages.
+
+    Returns:
+        Dict with "biomarkers" and "disease_categories" lists
+    """
+    with open(DEFAULT_CONFIG_PATH, "rb") as f:
+        return orjson.loads(f.read())
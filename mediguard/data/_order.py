@@ -0,0 +1,19 @@
+"""
+Canonical Biomarker Order
+The 24 biomarker IDs in the order used for CSV input, model features and
+report output (the same order as biomarkers.json).
+"""
+
+from typing import Dict, Tuple
+
+
+BIOMARKER_ORDER: Tuple[str, ...] = (
+    "hemoglobin", "wbc_count", "platelet_count", "glucose", "creatinine",
+    "bun", "sodium", "potassium", "chloride", "calcium",
+    "alt", "ast", "bilirubin_total", "albumin", "total_protein",
+    "ldh", "troponin", "bnp", "crp", "esr",
+    "procalcitonin", "d_dimer", "inr", "lactate",
+)
+
+# Biomarker ID -> position in BIOMARKER_ORDER
+BIOMARKER_INDEX: Dict[str, int] = {bio_id: i for i, bio_id in enumerate(BIOMARKER_ORDER)}
@@ -3,9 +3,20 @@ Medical RAG (Retrieval-Augmented Generation) Engine
 Retrieves relevant medical references and documents.
 """
 
-import json
 import os
-from typing import List, Dict, Any, Optional
+import re
+import threading
+from collections import Counter
+from types import MappingProxyType
+from typing import FrozenSet, List, Dict, Any, Optional, Tuple
+
+from cachetools import LRUCache
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# query() results cached per distinct set of indexed query terms
+QUERY_CACHE_SIZE = 256
 
 
 class MedicalRAGEngine:
@@ -16,7 +27,35 @@ class MedicalRAGEngine:
 
     def __init__(self):
         """Initialize RAG engine with medical knowledge base."""
-        self.knowledge_base = self._load_knowledge_base()
+        # Static after load: freeze it so forked workers never write to
+        # (and un-share) the pages holding it
+        self.knowledge_base = MappingProxyType({
+            category: tuple(refs)
+            for category, refs in self._load_knowledge_base().items()
+        })
+        self._build_index()
+
+        self._query_cache: LRUCache = LRUCache(maxsize=QUERY_CACHE_SIZE)
+        self._query_cache_lock = threading.Lock()
+
+    def _build_index(self):
+        """Build a token -> reference inverted index for query()."""
+        self._refs: List[Dict[str, str]] = []
+        self._postings: Dict[str, List[int]] = {}
+
+        seen = set()
+        for refs in self.knowledge_base.values():
+            for ref in refs:
+                key = ref["title"] + ref["section"]
+                if key in seen:
+                    continue
+                seen.add(key)
+
+                ref_id = len(self._refs)
+                self._refs.append(ref)
+                text = f"{ref['title']} {ref['section']} {ref['content']}".lower()
+                for token in set(_TOKEN_RE.findall(text)):
+                    self._postings.setdefault(token, []).append(ref_id)
 
     def _load_knowledge_base(self) -> Dict[str, List[Dict[str, str]]]:
         """
@@ -132,16 +171,13 @@ class MedicalRAGEngine:
         Returns:
             List of reference dicts with title, section, content, citation
         """
-        if disease_category not in self.knowledge_base:
-            return []
-
-        refs = self.knowledge_base[disease_category]
-        return refs[:max_results]
+        return list(self.knowledge_base.get(disease_category, ())[:max_results])
 
     def query(self, query_text: str) -> List[Dict[str, str]]:
         """
         Query knowledge base with natural language.
-        Simple keyword matching; in production would use semantic search.
+        Keyword matching via the inverted index, ranked by the number of
+        matched query terms; in production would use semantic search.
 
         Args:
             query_text: Natural language query
@@ -149,32 +185,31 @@ class MedicalRAGEngine:
         Returns:
             List of relevant references
         """
-        query_lower = query_text.lower()
-        results = []
-
-        # Simple keyword matching across all categories
-        for category, refs in self.knowledge_base.items():
-            for ref in refs:
-                # Check if query keywords appear in reference
-                content_lower = (
-                    ref["title"] + " " +
-                    ref["section"] + " " +
-                    ref["content"]
-                ).lower()
-
-                if any(word in content_lower for word in query_lower.split()):
-                    results.append(ref)
-
-        # Remove duplicates and limit results
-        seen = set()
-        unique_results = []
-        for ref in results:
-            key = ref["title"] + ref["section"]
-            if key not in seen:
-                seen.add(key)
-                unique_results.append(ref)
-
-        return unique_results[:5]
+        # Results depend only on which indexed terms appear, so queries that
+        # differ in case, spacing, order or unknown words share an entry
+        terms = frozenset(
+            token for token in _TOKEN_RE.findall(query_text.lower())
+            if token in self._postings
+        )
+
+        with self._query_cache_lock:
+            ref_ids = self._query_cache.get(terms)
+        if ref_ids is None:
+            ref_ids = self._rank(terms)
+            with self._query_cache_lock:
+                self._query_cache[terms] = ref_ids
+
+        return [self._refs[ref_id] for ref_id in ref_ids]
+
+    def _rank(self, terms: FrozenSet[str]) -> Tuple[int, ...]:
+        """Top 5 reference ids for a set of indexed terms."""
+        hits = Counter()
+        for token in terms:
+            hits.update(self._postings[token])
+
+        # Most matched query terms first; ties keep knowledge-base order
+        ranked = sorted(hits.items(), key=lambda item: (-item[1], item[0]))
+        return tuple(ref_id for ref_id, _ in ranked[:5])
 
     def format_references(self, references: List[Dict[str, str]]) -> str:
         """
@@ -0,0 +1,76 @@
+"""
+Compiled Kernels
+Rule evaluation kernel for the triage predictor, JIT-compiled with numba
+when it is installed and falling back to vectorized NumPy otherwise.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+# Rule opcodes. The low bit selects the comparison (0: >, 1: <), the
+# remaining bits the left-hand side.
+OP_GT = 0           # raw[a] > thresh
+OP_LT = 1           # raw[a] < thresh
+OP_RATIO_GT = 2     # raw[a] / max(raw[b], const) > thresh
+OP_RATIO_LT = 3     # raw[a] / max(raw[b], const) < thresh
+OP_ANY_GT = 4       # raw[a] > thresh or raw[b] > thresh
+OP_ANY_LT = 5       # raw[a] < thresh or raw[b] < thresh
+
+_KIND_RATIO = 1
+_KIND_ANY = 2
+
+
+def _eval_rules_loop(raw, op, bio_a, bio_b, thresh, const, cat_idx, weight, n_cats):
+    """Accumulate rule weights per category in rule order."""
+    scores = np.zeros(n_cats)
+    for r in range(thresh.shape[0]):
+        kind = op[r] >> 1
+        less = (op[r] & 1) == 1
+        a = raw[bio_a[r]]
+        if kind == _KIND_RATIO:
+            a = a / max(raw[bio_b[r]], const[r])
+
+        hit = a < thresh[r] if less else a > thresh[r]
+        if not hit and kind == _KIND_ANY:
+            b = raw[bio_b[r]]
+            hit = b < thresh[r] if less else b > thresh[r]
+
+        if hit:
+            scores[cat_idx[r]] += weight[r]
+    return scores
+
+
+def _eval_rules_numpy(raw, op, bio_a, bio_b, thresh, const, cat_idx, weight, n_cats):
+    """Vectorized equivalent of _eval_rules_loop."""
+    kind = op >> 1
+    less = (op & 1) == 1
+    vals_a = raw[bio_a]
+    vals_b = raw[bio_b]
+
+    lhs = np.where(kind == _KIND_RATIO, vals_a / np.maximum(vals_b, const), vals_a)
+    hits = np.where(less, lhs < thresh, lhs > thresh)
+    hits |= (kind == _KIND_ANY) & np.where(less, vals_b < thresh, vals_b > thresh)
+
+    # np.add.at is unbuffered and applied in rule order
+    scores = np.zeros(n_cats)
+    np.add.at(scores, cat_idx, hits * weight)
+    return scores
+
+
+if NUMBA_AVAILABLE:
+    eval_rules = njit(cache=True)(_eval_rules_loop)
+
+    # Compile at import (before gunicorn forks) rather than on first request
+    eval_rules(
+        np.zeros(1), np.zeros(1, dtype=np.int8),
+        np.zeros(1, dtype=np.intp), np.zeros(1, dtype=np.intp),
+        np.zeros(1), np.ones(1), np.zeros(1, dtype=np.intp), np.zeros(1), 1
+    )
+else:
+    eval_rules = _eval_rules_numpy
@@ -3,11 +3,15 @@ MediGuard Predictor Module
 Machine learning model for disease prediction based on biomarkers.
 """
 
-import json
-import os
 import numpy as np
+import orjson
 from typing import Dict, List, Any, Optional, Tuple
 
+from mediguard.data import load_biomarker_config
+from mediguard.models._kernels import (
+    eval_rules, OP_GT, OP_LT, OP_RATIO_GT, OP_RATIO_LT, OP_ANY_GT, OP_ANY_LT
+)
+
 
 class MediGuardPredictor:
     """
@@ -15,6 +19,19 @@ class MediGuardPredictor:
     Uses a rule-based + ML hybrid approach for clinical triage.
     """
 
+    # Disease-specific key biomarkers
+    RELEVANCE_MAP = {
+        "sepsis": ("procalcitonin", "lactate", "wbc_count", "crp"),
+        "cardiac_event": ("troponin", "bnp", "ldh"),
+        "renal_failure": ("creatinine", "bun", "potassium"),
+        "liver_disease": ("alt", "ast", "bilirubin_total", "albumin", "inr"),
+        "metabolic_disorder": ("glucose", "sodium", "calcium", "potassium"),
+        "coagulopathy": ("inr", "d_dimer", "platelet_count"),
+        "anemia": ("hemoglobin",),
+        "infection": ("wbc_count", "crp", "esr", "procalcitonin"),
+        "normal": (),
+    }
+
     def __init__(self, biomarker_config_path: Optional[str] = None):
         """
         Initialize predictor with disease categories and rules.
@@ -23,29 +40,124 @@ class MediGuardPredictor:
             biomarker_config_path: Path to biomarkers.json config
         """
         if biomarker_config_path is None:
-            biomarker_config_path = os.path.join(
-                os.path.dirname(__file__),
-                "..",
-                "data",
-                "biomarkers.json"
-            )
-
-        with open(biomarker_config_path, "r") as f:
-            config = json.load(f)
+            config = load_biomarker_config()
+        else:
+            with open(biomarker_config_path, "rb") as f:
+                config = orjson.loads(f.read())
 
         self.disease_categories = {d["id"]: d for d in config["disease_categories"]}
         self.biomarkers = {b["id"]: b for b in config["biomarkers"]}
 
+        self._bio_idx = {bio_id: i for i, bio_id in enumerate(self.biomarkers)}
+        self._normal_mid = np.array([
+            (b["normal_range"]["min"] + b["normal_range"]["max"]) / 2
+            for b in self.biomarkers.values()
+        ], dtype=np.float64)
+
+        self._cat_ids = list(self.disease_categories)
+        self._cat_idx = {cat_id: i for i, cat_id in enumerate(self._cat_ids)}
+
+        # Returned as-is when no rule fires
+        self._all_normal = np.eye(1, len(self._cat_ids), self._cat_idx["normal"])[0]
+        self._all_normal.setflags(write=False)
+
+        # Configs without their own rule tables use the bundled rules
+        rules_config = config if "rules" in config else load_biomarker_config()
+        self._build_rule_table(rules_config)
+
+    def _build_rule_table(self, rules_config: Dict[str, Any]):
+        """
+        Compile the clinical triage rules from the config into aligned
+        arrays for the rule kernel.
+
+        "rules" lists threshold checks in evaluation order; entries naming a
+        "compound" rule refer to "compound_rules" (ratios, any-of checks).
+        Two-sided criteria are written as one rule per side.
+        """
+        bio_ids = list(self.biomarkers)
+        bio_index = {bio_id: i for i, bio_id in enumerate(bio_ids)}
+
+        # Value assumed for a missing biomarker (0 unless that would look abnormal)
+        defaults = rules_config.get("missing_defaults", {})
+        self._raw_defaults = [(bio_id, defaults.get(bio_id, 0)) for bio_id in bio_ids]
+
+        compound_specs = rules_config.get("compound_rules", {})
+        rule_op, rule_a, rule_b, rule_thresh, rule_const = [], [], [], [], []
+        rule_cat, rule_weight = [], []
+        for rule in rules_config["rules"]:
+            if "compound" in rule:
+                op, bio_a, bio_b, threshold, const = self._compile_compound_rule(
+                    compound_specs[rule["compound"]], bio_index
+                )
+            else:
+                op = OP_GT if rule["op"] == ">" else OP_LT
+                bio_a = bio_b = bio_index[rule["biomarker"]]
+                threshold, const = rule["threshold"], 1.0
+
+            rule_op.append(op)
+            rule_a.append(bio_a)
+            rule_b.append(bio_b)
+            rule_thresh.append(threshold)
+            rule_const.append(const)
+            rule_cat.append(self._cat_idx[rule["category"]])
+            rule_weight.append(rule["weight"])
+
+        self._rule_op = np.array(rule_op, dtype=np.int8)
+        self._rule_a = np.array(rule_a, dtype=np.intp)
+        self._rule_b = np.array(rule_b, dtype=np.intp)
+        self._rule_thresh = np.array(rule_thresh, dtype=np.float64)
+        self._rule_const = np.array(rule_const, dtype=np.float64)
+        self._rule_cat = np.array(rule_cat, dtype=np.intp)
+        self._rule_weight = np.array(rule_weight, dtype=np.float64)
+
+        # Read-only so workers forked from a preloaded app keep sharing them
+        for arr in (
+            self._rule_op, self._rule_a, self._rule_b, self._rule_thresh,
+            self._rule_const, self._rule_cat, self._rule_weight, self._normal_mid
+        ):
+            arr.setflags(write=False)
+
+    @staticmethod
+    def _compile_compound_rule(
+        spec: Dict[str, Any],
+        bio_index: Dict[str, int]
+    ) -> Tuple[int, int, int, float, float]:
+        """Encode a compound rule spec as (opcode, bio_a, bio_b, threshold, const)."""
+        less = spec["op"] == "<"
+
+        if spec["type"] == "ratio":
+            return (
+                OP_RATIO_LT if less else OP_RATIO_GT,
+                bio_index[spec["numerator"]],
+                bio_index[spec["denominator"]],
+                spec["threshold"],
+                spec.get("min_denominator", 1),
+            )
+
+        if spec["type"] == "any":
+            ids = spec["biomarkers"]
+            if not 1 <= len(ids) <= 2:
+                raise ValueError("'any' compound rules support one or two biomarkers")
+            return (
+                OP_ANY_LT if less else OP_ANY_GT,
+                bio_index[ids[0]],
+                bio_index[ids[-1]],
+                spec["threshold"],
+                1.0,
+            )
+
+        raise ValueError(f"Unknown compound rule type: {spec['type']}")
+
     def predict(
         self,
-        scaled_values: List[float],
+        scaled_values: np.ndarray,
         raw_values: Dict[str, float]
     ) -> Dict[str, Any]:
         """
         Predict disease category from biomarker values.
 
         Args:
-            scaled_values: List of 24 scaled biomarker values [0-1]
+            scaled_values: Array of 24 scaled biomarker values [0-1]
             raw_values: Dict of raw biomarker values
 
         Returns:
@@ -60,8 +172,9 @@ class MediGuardPredictor:
         # In production, this would be replaced with a trained ML model
 
         probabilities = self._compute_probabilities(raw_values)
-        prediction = max(probabilities, key=probabilities.get)
-        confidence = probabilities[prediction]
+        top = int(probabilities.argmax())
+        prediction = self._cat_ids[top]
+        confidence = float(probabilities[top])
 
         # Identify key biomarkers driving the prediction
         key_biomarkers = self._identify_key_biomarkers(raw_values, prediction)
@@ -69,110 +182,58 @@ class MediGuardPredictor:
         # Generate explanation
         explanation = self._generate_explanation(prediction, key_biomarkers, raw_values)
 
+        # Most likely first; stable so ties keep category order
+        ranked = np.argsort(-probabilities, kind="stable").tolist()
+        prob_list = probabilities.tolist()
+
         return {
             "prediction": prediction,
             "prediction_name": self.disease_categories[prediction]["name"],
             "confidence": round(confidence, 3),
             "severity": self.disease_categories[prediction]["severity"],
             "probabilities": {
-                cat_id: round(prob, 3)
-                for cat_id, prob in sorted(
-                    probabilities.items(),
-                    key=lambda x: x[1],
-                    reverse=True
-                )
+                self._cat_ids[i]: round(prob_list[i], 3) for i in ranked
             },
             "key_biomarkers": key_biomarkers,
             "explanation": explanation,
         }
 
-    def _compute_probabilities(self, raw_values: Dict[str, float]) -> Dict[str, float]:
+    def _compute_probabilities(self, raw_values: Dict[str, float]) -> np.ndarray:
         """
         Compute probability scores for each disease category.
-        Uses rule-based clinical criteria.
+        Uses rule-based clinical criteria, evaluated in a single pass over
+        the compiled rule table (see _kernels.eval_rules).
+
+        Returns:
+            Array of probabilities aligned with the category order
         """
-        scores = {cat_id: 0.0 for cat_id in self.disease_categories.keys()}
-
-        # Sepsis indicators
-        if raw_values.get("procalcitonin", 0) > 2.0:
-            scores["sepsis"] += 0.4
-        if raw_values.get("lactate", 0) > 4.0:
-            scores["sepsis"] += 0.3
-        if raw_values.get("wbc_count", 0) > 12.0 or raw_values.get("wbc_count", 0) < 4.0:
-            scores["sepsis"] += 0.2
-        if raw_values.get("crp", 0) > 100:
-            scores["sepsis"] += 0.1
-
-        # Cardiac event indicators
-        if raw_values.get("troponin", 0) > 0.04:
-            scores["cardiac_event"] += 0.5
-        if raw_values.get("bnp", 0) > 400:
-            scores["cardiac_event"] += 0.3
-        if raw_values.get("ldh", 0) > 500:
-            scores["cardiac_event"] += 0.2
-
-        # Renal failure indicators
-        if raw_values.get("creatinine", 0) > 2.0:
-            scores["renal_failure"] += 0.4
-        if raw_values.get("bun", 0) > 40:
-            scores["renal_failure"] += 0.3
-        if raw_values.get("potassium", 0) > 5.5:
-            scores["renal_failure"] += 0.2
-        if raw_values.get("creatinine", 0) / max(raw_values.get("bun", 1), 1) < 0.05:
-            scores["renal_failure"] += 0.1
-
-        # Liver disease indicators
-        if raw_values.get("alt", 0) > 200 or raw_values.get("ast", 0) > 200:
-            scores["liver_disease"] += 0.4
-        if raw_values.get("bilirubin_total", 0) > 2.0:
-            scores["liver_disease"] += 0.3
-        if raw_values.get("albumin", 0) < 3.0:
-            scores["liver_disease"] += 0.2
-        if raw_values.get("inr", 0) > 1.5:
-            scores["liver_disease"] += 0.1
-
-        # Metabolic disorder indicators
-        if raw_values.get("glucose", 0) > 200 or raw_values.get("glucose", 0) < 60:
-            scores["metabolic_disorder"] += 0.4
-        if abs(raw_values.get("sodium", 140) - 140) > 10:
-            scores["metabolic_disorder"] += 0.3
-        if raw_values.get("calcium", 9.5) < 7.0 or raw_values.get("calcium", 9.5) > 11.0:
-            scores["metabolic_disorder"] += 0.3
-
-        # Coagulopathy indicators
-        if raw_values.get("inr", 0) > 2.0:
-            scores["coagulopathy"] += 0.4
-        if raw_values.get("d_dimer", 0) > 2.0:
-            scores["coagulopathy"] += 0.3
-        if raw_values.get("platelet_count", 0) < 100:
-            scores["coagulopathy"] += 0.3
-
-        # Anemia indicators
-        if raw_values.get("hemoglobin", 0) < 10.0:
-            scores["anemia"] += 0.6
-        if raw_values.get("hemoglobin", 0) < 7.0:
-            scores["anemia"] += 0.4
-
-        # Infection indicators
-        if raw_values.get("wbc_count", 0) > 11.0:
-            scores["infection"] += 0.3
-        if raw_values.get("crp", 0) > 10:
-            scores["infection"] += 0.3
-        if raw_values.get("esr", 0) > 30:
-            scores["infection"] += 0.2
-        if raw_values.get("procalcitonin", 0) > 0.25:
-            scores["infection"] += 0.2
-
-        # Normalize scores to probabilities
-        total = sum(scores.values())
+        raw_arr = np.fromiter(
+            (raw_values.get(bio_id, default) for bio_id, default in self._raw_defaults),
+            dtype=np.float64,
+            count=len(self._raw_defaults)
+        )
+
+        # Scores accumulate in rule order so sums match sequential evaluation
+        scores = eval_rules(
+            raw_arr,
+            self._rule_op,
+            self._rule_a,
+            self._rule_b,
+            self._rule_thresh,
+            self._rule_const,
+            self._rule_cat,
+            self._rule_weight,
+            len(self._cat_ids)
+        )
+
+        # Normalize scores to probabilities (sequential sum, as before)
+        total = sum(scores.tolist())
         if total > 0:
-            probabilities = {k: v / total for k, v in scores.items()}
-        else:
-            # All normal
-            probabilities = {k: 0.0 for k in scores.keys()}
-            probabilities["normal"] = 1.0
+            scores /= total
+            return scores
 
-        return probabilities
+        # All normal
+        return self._all_normal
 
     def _identify_key_biomarkers(
         self,
@@ -184,27 +245,32 @@ class MediGuardPredictor:
 
         Returns list of dicts with biomarker info and direction (↑/↓)
         """
-        key_biomarkers = []
-
-        # Disease-specific key biomarkers
-        relevance_map = {
-            "sepsis": ["procalcitonin", "lactate", "wbc_count", "crp"],
-            "cardiac_event": ["troponin", "bnp", "ldh"],
-            "renal_failure": ["creatinine", "bun", "potassium"],
-            "liver_disease": ["alt", "ast", "bilirubin_total", "albumin", "inr"],
-            "metabolic_disorder": ["glucose", "sodium", "calcium", "potassium"],
-            "coagulopathy": ["inr", "d_dimer", "platelet_count"],
-            "anemia": ["hemoglobin"],
-            "infection": ["wbc_count", "crp", "esr", "procalcitonin"],
-            "normal": [],
-        }
-
-        relevant_ids = relevance_map.get(prediction, [])
-
-        for bio_id in relevant_ids:
-            if bio_id not in raw_values:
-                continue
+        relevant_ids = [
+            bio_id for bio_id in self.RELEVANCE_MAP.get(prediction, ())
+            if bio_id in raw_values
+        ]
+        if not relevant_ids:
+            return []
+
+        idx = np.array([self._bio_idx[bio_id] for bio_id in relevant_ids], dtype=np.intp)
+        vals = np.array([raw_values[bio_id] for bio_id in relevant_ids], dtype=np.float64)
+
+        # Deviation from the middle of the normal range
+        mid = self._normal_mid[idx]
+        # Rounded with Python's round, which differs from np.round on
+        # half-way values, so deviations (and their ranking) are unchanged
+        deviations = np.array([round(d, 2) for d in (np.abs(vals - mid) / mid).tolist()])
+
+        # Top 5 by deviation (most abnormal first); ties keep relevance order
+        k = min(5, len(relevant_ids))
+        top = np.arange(len(relevant_ids))
+        if len(relevant_ids) > k:
+            top = np.argpartition(-deviations, k - 1)[:k]
+        top = top[np.lexsort((top, -deviations[top]))]
 
+        key_biomarkers = []
+        for i in top.tolist():
+            bio_id = relevant_ids[i]
             bio = self.biomarkers[bio_id]
             raw_val = raw_values[bio_id]
 
@@ -219,10 +285,6 @@ class MediGuardPredictor:
                 direction = "→"
                 status = "NORMAL"
 
-            # Calculate deviation from normal
-            normal_mid = (bio["normal_range"]["min"] + bio["normal_range"]["max"]) / 2
-            deviation = abs(raw_val - normal_mid) / normal_mid
-
             key_biomarkers.append({
                 "id": bio_id,
                 "name": bio["name"],
@@ -231,13 +293,10 @@ class MediGuardPredictor:
                 "unit": bio["unit"],
                 "direction": direction,
                 "status": status,
-                "deviation": round(deviation, 2),
+                "deviation": deviations[i].item(),
             })
 
-        # Sort by deviation (most abnormal first)
-        key_biomarkers.sort(key=lambda x: x["deviation"], reverse=True)
-
-        return key_biomarkers[:5]  # Top 5
+        return key_biomarkers
 
     def _generate_explanation(
         self,
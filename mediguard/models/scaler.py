@@ -3,10 +3,13 @@ Biomarker Scaler Module
 Handles scaling and normalization of biomarker values.
 """
 
-import json
-import os
 from typing import Dict, List, Tuple, Any, Optional
 
+import numpy as np
+import orjson
+
+from mediguard.data import load_biomarker_config
+
 
 class BiomarkerScaler:
     """
@@ -22,18 +25,31 @@ class BiomarkerScaler:
             biomarker_config_path: Path to biomarkers.json config file
         """
         if biomarker_config_path is None:
-            biomarker_config_path = os.path.join(
-                os.path.dirname(__file__),
-                "..",
-                "data",
-                "biomarkers.json"
-            )
-
-        with open(biomarker_config_path, "r") as f:
-            config = json.load(f)
+            config = load_biomarker_config()
+        else:
+            with open(biomarker_config_path, "rb") as f:
+                config = orjson.loads(f.read())
 
         self.biomarkers = {b["id"]: b for b in config["biomarkers"]}
         self.biomarker_order = [b["id"] for b in config["biomarkers"]]
+        self._index = {bio_id: i for i, bio_id in enumerate(self.biomarker_order)}
+
+        # Range bounds aligned with biomarker_order for vectorized scaling
+        ordered = config["biomarkers"]
+        self._lo = np.array([b["critical_low"] for b in ordered], dtype=np.float64)
+        self._hi = np.array([b["critical_high"] for b in ordered], dtype=np.float64)
+        self._nmin = np.array([b["normal_range"]["min"] for b in ordered], dtype=np.float64)
+        self._nmax = np.array([b["normal_range"]["max"] for b in ordered], dtype=np.float64)
+        for arr in (self._lo, self._hi, self._nmin, self._nmax):
+            arr.setflags(write=False)
+
+        # Warning strings only need the raw value filled in per request
+        self._warn_tpl = [self._build_warning_templates(b) for b in ordered]
+
+        # Static raw_summary fields: (id, name, code, unit, normal_range)
+        self._summary_fields = tuple(
+            (b["id"], b["name"], b["code"], b["unit"], b["normal_range"]) for b in ordered
+        )
 
     def scale_value(self, biomarker_id: str, raw_value: float) -> Tuple[float, List[str]]:
         """
@@ -49,42 +65,62 @@ class BiomarkerScaler:
         if biomarker_id not in self.biomarkers:
             raise ValueError(f"Unknown biomarker: {biomarker_id}")
 
-        bio = self.biomarkers[biomarker_id]
-        warnings = []
+        i = self._index[biomarker_id]
+        lo, hi = self._lo[i], self._hi[i]
+
+        # Perform min-max scaling using critical ranges
+        scaled = float(min(1.0, max(0.0, (raw_value - lo) / (hi - lo))))
 
-        # Min-max scaling using critical ranges
-        min_val = bio["critical_low"]
-        max_val = bio["critical_high"]
+        warnings = self._format_warnings(
+            i,
+            raw_value,
+            raw_value < self._nmin[i],
+            raw_value > self._nmax[i],
+            raw_value < lo,
+            raw_value > hi,
+        )
+        return scaled, warnings
+
+    @staticmethod
+    def _build_warning_templates(bio: Dict[str, Any]) -> Tuple[str, str, str, str]:
+        """Precompute (below, above, critical low, critical high) templates for a biomarker."""
+        name = f"{bio['name']} ({bio['code']})".replace("{", "{{").replace("}", "}}")
+        unit = bio["unit"].replace("{", "{{").replace("}", "}}")
+        nmin = bio["normal_range"]["min"]
+        nmax = bio["normal_range"]["max"]
+        return (
+            f"⚠️ {name} is BELOW normal range ({{v}} {unit} < {nmin} {unit})",
+            f"⚠️ {name} is ABOVE normal range ({{v}} {unit} > {nmax} {unit})",
+            f"🚨 CRITICAL: {name} is dangerously LOW: {{v}} {unit}",
+            f"🚨 CRITICAL: {name} is dangerously HIGH: {{v}} {unit}",
+        )
+
+    def _format_warnings(
+        self,
+        index: int,
+        raw_value: Any,
+        below_normal: bool,
+        above_normal: bool,
+        crit_low: bool,
+        crit_high: bool,
+    ) -> List[str]:
+        """Build warning messages for one biomarker from precomputed range checks."""
+        below_tpl, above_tpl, crit_low_tpl, crit_high_tpl = self._warn_tpl[index]
+        warnings = []
 
         # Check for out-of-range values
-        if raw_value < bio["normal_range"]["min"]:
-            warnings.append(
-                f"⚠️ {bio['name']} ({bio['code']}) is BELOW normal range "
-                f"({raw_value} {bio['unit']} < {bio['normal_range']['min']} {bio['unit']})"
-            )
-        elif raw_value > bio["normal_range"]["max"]:
-            warnings.append(
-                f"⚠️ {bio['name']} ({bio['code']}) is ABOVE normal range "
-                f"({raw_value} {bio['unit']} > {bio['normal_range']['max']} {bio['unit']})"
-            )
+        if below_normal:
+            warnings.append(below_tpl.format(v=raw_value))
+        elif above_normal:
+            warnings.append(above_tpl.format(v=raw_value))
 
         # Critical value warnings
-        if raw_value < bio["critical_low"]:
-            warnings.append(
-                f"🚨 CRITICAL: {bio['name']} ({bio['code']}) is dangerously LOW: "
-                f"{raw_value} {bio['unit']}"
-            )
-        elif raw_value > bio["critical_high"]:
-            warnings.append(
-                f"🚨 CRITICAL: {bio['name']} ({bio['code']}) is dangerously HIGH: "
-                f"{raw_value} {bio['unit']}"
-            )
-
-        # Perform min-max scaling
-        scaled = (raw_value - min_val) / (max_val - min_val)
-        scaled = max(0.0, min(1.0, scaled))  # Clip to [0, 1]
+        if crit_low:
+            warnings.append(crit_low_tpl.format(v=raw_value))
+        elif crit_high:
+            warnings.append(crit_high_tpl.format(v=raw_value))
 
-        return scaled, warnings
+        return warnings
 
     def scale_all(self, biomarker_values: Dict[str, float]) -> Dict[str, Any]:
         """
@@ -95,36 +131,58 @@ class BiomarkerScaler:
 
         Returns:
             Dict containing:
-                - scaled_values: List of scaled values in standard order
+                - scaled_values: Array of scaled values in standard order
                 - warnings: List of warning messages
                 - raw_summary: Dict of raw values with metadata
         """
-        scaled_values = []
+        order = self.biomarker_order
+        try:
+            raw = np.fromiter(
+                (biomarker_values[bio_id] for bio_id in order),
+                dtype=np.float64,
+                count=len(order)
+            )
+        except KeyError as e:
+            raise ValueError(f"Missing biomarker value: {e.args[0]}")
+
+        # Min-max scaling using critical ranges, all biomarkers at once
+        scaled = np.clip((raw - self._lo) / (self._hi - self._lo), 0.0, 1.0)
+
+        below_normal = raw < self._nmin
+        above_normal = raw > self._nmax
+        crit_low = raw < self._lo
+        crit_high = raw > self._hi
+
+        # Only format warning strings for biomarkers that are out of range
         all_warnings = []
-        raw_summary = {}
-
-        for bio_id in self.biomarker_order:
-            if bio_id not in biomarker_values:
-                raise ValueError(f"Missing biomarker value: {bio_id}")
-
-            raw_val = biomarker_values[bio_id]
-            scaled_val, warnings = self.scale_value(bio_id, raw_val)
-
-            scaled_values.append(scaled_val)
-            all_warnings.extend(warnings)
-
-            bio = self.biomarkers[bio_id]
-            raw_summary[bio_id] = {
-                "name": bio["name"],
-                "code": bio["code"],
-                "raw_value": raw_val,
-                "unit": bio["unit"],
-                "scaled_value": round(scaled_val, 4),
-                "normal_range": bio["normal_range"],
+        flagged = np.flatnonzero(below_normal | above_normal | crit_low | crit_high)
+        for i in flagged:
+            all_warnings.extend(self._format_warnings(
+                i,
+                biomarker_values[order[i]],
+                below_normal[i],
+                above_normal[i],
+                crit_low[i],
+                crit_high[i],
+            ))
+
+        raw_summary = {
+            bio_id: {
+                "name": name,
+                "code": code,
+                "raw_value": biomarker_values[bio_id],
+                "unit": unit,
+                "scaled_value": scaled_val,
+                "normal_range": normal_range,
             }
+            for (bio_id, name, code, unit, normal_range), scaled_val
+            # Python's round (not ndarray.round) so half-way values and the
+            # float type match the per-biomarker scaling it replaced
+            in zip(self._summary_fields, (round(v, 4) for v in scaled.tolist()))
+        }
 
         return {
-            "scaled_values": scaled_values,
+            "scaled_values": scaled,
             "warnings": all_warnings,
             "raw_summary": raw_summary,
         }
@@ -1,14 +1,32 @@
 """
 MediGuard Parsers Package
 Input parsing, OCR, and biomarker extraction.
+
+OCR and LLM extraction are imported lazily (PEP 562) so that importing the
+text input parser doesn't pull in OCR and LLM client dependencies.
 """
 
+from importlib import import_module
+
 from .input_parser import BiomarkerInputParser
-from .lab_report_ocr import LabReportOCR
-from .biomarker_extractor import BiomarkerExtractor
+
+_LAZY_IMPORTS = {
+    "LabReportOCR": ".lab_report_ocr",
+    "BiomarkerExtractor": ".biomarker_extractor",
+    "batch_extract": ".lab_report_ocr",
+}
 
 __all__ = [
     "BiomarkerInputParser",
     "LabReportOCR",
     "BiomarkerExtractor",
+    "batch_extract",
 ]
+
+
+def __getattr__(name):
+    if name in _LAZY_IMPORTS:
+        value = getattr(import_module(_LAZY_IMPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
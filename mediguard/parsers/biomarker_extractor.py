@@ -3,18 +3,213 @@ Biomarker Extractor Module
 Extracts biomarker values from OCR-extracted text using LLM and regex.
 """
 
+import asyncio
 import os
 import re
-import json
+import threading
+from hashlib import blake2b
+from importlib.util import find_spec
+from pathlib import Path
 from typing import Dict, Optional, List, Tuple, Any
 
+import numpy as np
+import orjson
+from cachetools import TTLCache
+
+from mediguard.data import BIOMARKER_ORDER
 from mediguard.utils import llm_provider
 
 LLM_AVAILABLE = llm_provider.GROQ_AVAILABLE
 
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
+
+# OCR text length above which the RE2 engine is used when available
+RE2_MIN_TEXT_LENGTH = 8192
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# Longest extract_batch waits for a batch job before cancelling it and
+# extracting report by report instead
+BATCH_EXTRACT_TIMEOUT = float(os.getenv("BATCH_EXTRACT_TIMEOUT", "600"))
+
+# Semantic cache: looked up here, imported on first use (torch is heavy)
+SEMANTIC_CACHE_AVAILABLE = all(
+    find_spec(name) is not None for name in ("faiss", "sentence_transformers")
+)
+
+# Opt-in directory for the semantic cache index; it keeps extracted lab
+# values on disk across restarts, so it is off unless set
+SEMANTIC_CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR")
+SEMANTIC_CACHE_MODEL = os.getenv("SEMANTIC_CACHE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+# Only the start of the OCR text is embedded (report header and first rows)
+SEMANTIC_CACHE_CHARS = 1000
+# Neighbours checked per lookup; a hit must also carry the exact same numbers
+SEMANTIC_CACHE_NEIGHBOURS = 5
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+
+def _numbers_key(ocr_text: str) -> str:
+    """Hash of the numbers in a text, in order (the values a lab report carries)."""
+    return blake2b("|".join(_NUMBER_RE.findall(ocr_text)).encode(), digest_size=16).hexdigest()
+
 from mediguard.parsers.input_parser import BiomarkerInputParser
 
 
+# Optional colon/equals, the number, and an optional unit after a biomarker name
+_VALUE_PATTERN = (
+    r'\s*[:=]?\s*(\d+\.?\d*)'
+    r'\s*(?:g/dl|mg/dl|mmol/l|×10³/μl|/μl|pg/ml|ng/ml|ratio|mm/hr|μg/ml)?'
+)
+_VALUE_RE = re.compile('(?i)' + _VALUE_PATTERN)
+
+
+def _build_alias_regex(aliases: Dict[str, str], biomarker_ids: List[str]) -> Tuple[Dict[str, str], str]:
+    """
+    Build the alias -> ID map (including each ID itself) and one
+    case-insensitive regex matching any alias followed by a number.
+
+    Aliases are tried longest first so "troponin i" wins over "troponin".
+    The pattern sticks to syntax shared by re and RE2.
+    """
+    alias_to_id = dict(aliases)
+    for biomarker_id in biomarker_ids:
+        alias_to_id.setdefault(biomarker_id, biomarker_id)
+
+    names = sorted(alias_to_id, key=len, reverse=True)
+    name_pattern = "|".join(re.escape(name) for name in names)
+    pattern = rf'(?i)\b({name_pattern})\b' + _VALUE_PATTERN
+    return alias_to_id, pattern
+
+
+def _build_alias_automaton(alias_to_id: Dict[str, str]):
+    """Build an Aho-Corasick automaton over lowercase aliases -> (length, ID)."""
+    automaton = ahocorasick.Automaton()
+    for alias, biomarker_id in alias_to_id.items():
+        automaton.add_word(alias.lower(), (len(alias), biomarker_id))
+    automaton.make_automaton()
+    return automaton
+
+
+def _is_word_char(char: str) -> bool:
+    """Same notion of a word character as the regex \\b anchor."""
+    return char.isalnum() or char == "_"
+
+
+class _SemanticCache:
+    """
+    Nearest-neighbour cache from OCR text to extracted biomarker values.
+
+    Re-scans or photos of the same report give slightly different OCR text
+    but the same values. Texts are embedded with a small sentence-transformers
+    model into a FAISS inner-product index (cosine on normalized vectors).
+    The embedding mostly reflects the lab's template, so a neighbour at or
+    above the threshold is only reused if its text also contained exactly
+    the same numbers; another patient's report on the same template never is.
+    """
+
+    def __init__(self, cache_dir: str, threshold: float = SEMANTIC_CACHE_THRESHOLD):
+        self.cache_dir = Path(cache_dir)
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._model = None
+        self._index = None
+        # (numbers key, values) per indexed text
+        self._entries: List[Tuple[str, Dict[str, Optional[float]]]] = []
+
+    def _ensure_loaded(self) -> None:
+        """Load the embedding model and any persisted index (under the lock)."""
+        if self._model is not None:
+            return
+        import faiss
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(SEMANTIC_CACHE_MODEL, device="cpu")
+        dim = model.get_sentence_embedding_dimension()
+
+        index_path = self.cache_dir / "index.faiss"
+        values_path = self.cache_dir / "values.json"
+        index, entries = None, []
+        if index_path.exists() and values_path.exists():
+            try:
+                index = faiss.read_index(str(index_path))
+                entries = [tuple(entry) for entry in orjson.loads(values_path.read_bytes())]
+            except (OSError, RuntimeError, TypeError, orjson.JSONDecodeError) as e:
+                print(f"[WARN] Could not load semantic cache: {str(e)}")
+                index = None
+        # Caches written without numbers keys can't be verified and are dropped
+        if (
+            index is None or index.d != dim or index.ntotal != len(entries)
+            or not all(len(entry) == 2 and isinstance(entry[0], str) for entry in entries)
+        ):
+            index, entries = faiss.IndexFlatIP(dim), []
+
+        self._index, self._entries = index, entries
+        self._model = model
+
+    def _embed(self, ocr_text: str) -> np.ndarray:
+        """Unit-length float32 embedding of the start of the text, shape (1, dim)."""
+        return self._model.encode(
+            [ocr_text[:SEMANTIC_CACHE_CHARS]],
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+        ).astype(np.float32)
+
+    def get(self, ocr_text: str) -> Optional[Dict[str, Optional[float]]]:
+        """Return the values stored for a similar text with the same numbers, or None."""
+        with self._lock:
+            self._ensure_loaded()
+            if self._index.ntotal == 0:
+                return None
+        embedding = self._embed(ocr_text)
+        numbers = _numbers_key(ocr_text)
+        with self._lock:
+            scores, ids = self._index.search(embedding, SEMANTIC_CACHE_NEIGHBOURS)
+            for score, entry_id in zip(scores[0].tolist(), ids[0].tolist()):
+                # Neighbours come best first; -1 pads a short index
+                if entry_id < 0 or score < self.threshold:
+                    break
+                entry_numbers, values = self._entries[entry_id]
+                if entry_numbers == numbers:
+                    return dict(values)
+        return None
+
+    def put(self, ocr_text: str, values: Dict[str, Optional[float]]) -> None:
+        """Add an extraction result and persist the index."""
+        with self._lock:
+            self._ensure_loaded()
+        embedding = self._embed(ocr_text)
+        with self._lock:
+            self._index.add(embedding)
+            self._entries.append((_numbers_key(ocr_text), values))
+            self._persist()
+
+    def _persist(self) -> None:
+        """Write index and values atomically (temp file, then rename)."""
+        import faiss
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        index_path = self.cache_dir / "index.faiss"
+        values_path = self.cache_dir / "values.json"
+        index_tmp = index_path.with_suffix(".faiss.tmp")
+        values_tmp = values_path.with_suffix(".json.tmp")
+        try:
+            faiss.write_index(self._index, str(index_tmp))
+            values_tmp.write_bytes(orjson.dumps(self._entries))
+            os.replace(index_tmp, index_path)
+            os.replace(values_tmp, values_path)
+        except (OSError, RuntimeError) as e:
+            print(f"[WARN] Could not write semantic cache: {str(e)}")
+
+
 class BiomarkerExtractor:
     """
     Extracts biomarker values from OCR text.
@@ -22,18 +217,13 @@ class BiomarkerExtractor:
     """
 
     # Standard biomarker order (24 biomarkers)
-    BIOMARKER_ORDER = [
-        "hemoglobin", "wbc_count", "platelet_count", "glucose", "creatinine",
-        "bun", "sodium", "potassium", "chloride", "calcium",
-        "alt", "ast", "bilirubin_total", "albumin", "total_protein",
-        "ldh", "troponin", "bnp", "crp", "esr",
-        "procalcitonin", "d_dimer", "inr", "lactate"
-    ]
-
-    # Biomarker name variations and aliases
+    BIOMARKER_ORDER = BIOMARKER_ORDER
+    _BIOMARKER_SET = frozenset(BIOMARKER_ORDER)
+
+    # Biomarker name variations and aliases (standard IDs match themselves)
     BIOMARKER_ALIASES = {
         # Hemoglobin
-        "hgb": "hemoglobin", "hb": "hemoglobin", "hemo": "hemoglobin", "hgb": "hemoglobin",
+        "hgb": "hemoglobin", "hb": "hemoglobin", "hemo": "hemoglobin",
         # WBC
         "wbc": "wbc_count", "white blood cell": "wbc_count", "white blood cell count": "wbc_count",
         "leukocyte": "wbc_count", "leukocyte count": "wbc_count",
@@ -43,58 +233,93 @@ class BiomarkerExtractor:
         # Glucose
         "glu": "glucose", "blood sugar": "glucose", "bg": "glucose", "blood glucose": "glucose",
         # Creatinine
-        "creat": "creatinine", "cr": "creatinine", "creatinine": "creatinine",
+        "creat": "creatinine", "cr": "creatinine",
         # BUN
-        "bun": "bun", "blood urea nitrogen": "bun", "urea": "bun",
+        "blood urea nitrogen": "bun", "urea": "bun",
         # Sodium
-        "na": "sodium", "sodium": "sodium",
+        "na": "sodium",
         # Potassium
-        "k": "potassium", "potassium": "potassium",
+        "k": "potassium",
         # Chloride
-        "cl": "chloride", "chloride": "chloride",
+        "cl": "chloride",
         # Calcium
-        "ca": "calcium", "calcium": "calcium",
+        "ca": "calcium",
         # ALT
-        "alt": "alt", "alanine aminotransferase": "alt", "sgot": "alt",
+        "alanine aminotransferase": "alt", "sgot": "alt",
         # AST
-        "ast": "ast", "aspartate aminotransferase": "ast", "sgpt": "ast",
+        "aspartate aminotransferase": "ast", "sgpt": "ast",
         # Bilirubin
         "tbil": "bilirubin_total", "bilirubin": "bilirubin_total", "total bilirubin": "bilirubin_total",
         "tb": "bilirubin_total",
         # Albumin
-        "alb": "albumin", "albumin": "albumin",
+        "alb": "albumin",
         # Total Protein
         "tp": "total_protein", "protein": "total_protein", "total protein": "total_protein",
         # LDH
-        "ldh": "ldh", "lactate dehydrogenase": "ldh",
+        "lactate dehydrogenase": "ldh",
         # Troponin
-        "tni": "troponin", "troponin": "troponin", "troponin i": "troponin", "ctni": "troponin",
+        "tni": "troponin", "troponin i": "troponin", "ctni": "troponin",
         # BNP
-        "bnp": "bnp", "b-type natriuretic peptide": "bnp", "brain natriuretic peptide": "bnp",
+        "b-type natriuretic peptide": "bnp", "brain natriuretic peptide": "bnp",
         # CRP
-        "crp": "crp", "c-reactive protein": "crp",
+        "c-reactive protein": "crp",
         # ESR
-        "esr": "esr", "erythrocyte sedimentation rate": "esr", "sed rate": "esr",
+        "erythrocyte sedimentation rate": "esr", "sed rate": "esr",
         # Procalcitonin
-        "pct": "procalcitonin", "procalcitonin": "procalcitonin",
+        "pct": "procalcitonin",
         # D-Dimer
         "dd": "d_dimer", "ddimer": "d_dimer", "d-dimer": "d_dimer",
         # INR
-        "inr": "inr", "international normalized ratio": "inr",
+        "international normalized ratio": "inr",
         # Lactate
-        "lac": "lactate", "lactate": "lactate", "lactic acid": "lactate",
+        "lac": "lactate", "lactic acid": "lactate",
     }
 
-    def __init__(self, use_llm: bool = True):
+    # Single-pass extraction regex over all aliases
+    _ALIAS_TO_ID, _COMBINED_PATTERN = _build_alias_regex(BIOMARKER_ALIASES, BIOMARKER_ORDER)
+    _COMBINED_RE = re.compile(_COMBINED_PATTERN)
+    _COMBINED_RE2 = re2.compile(_COMBINED_PATTERN) if RE2_AVAILABLE else None
+    _ALIAS_AUTOMATON = _build_alias_automaton(_ALIAS_TO_ID) if AHOCORASICK_AVAILABLE else None
+
+    # Static part of the LLM prompt; the OCR text is appended per call
+    _PROMPT_PREFIX = (
+        "Extract all biomarker values from this lab report text.\n"
+        "Return ONLY a JSON object with exactly these keys (number or null): "
+        + orjson.dumps(dict.fromkeys(BIOMARKER_ORDER, 0)).decode()
+        + "\n\n"
+        "Rules:\n"
+        "- Extract numeric values only (no units in JSON)\n"
+        "- Use null for missing biomarkers\n"
+        "- Convert units to standard (e.g., g/dL for hemoglobin, mg/dL for glucose)\n"
+        "- Return ONLY the JSON object, no explanations\n\n"
+        "Lab Report Text:\n"
+    )
+
+    def __init__(self, use_llm: bool = True, semantic_cache_dir: Optional[str] = None):
         """
         Initialize biomarker extractor.
 
         Args:
             use_llm: Whether to use LLM for parsing (default: True)
+            semantic_cache_dir: Directory for the semantic (near-duplicate
+                report) cache (default: SEMANTIC_CACHE_DIR env var; disabled
+                if neither is set or faiss/sentence-transformers are missing)
         """
         self.use_llm = use_llm and LLM_AVAILABLE
         self.parser = BiomarkerInputParser()
 
+        # Successful LLM extractions keyed by OCR text hash (duplicate uploads, retries)
+        self._llm_cache = TTLCache(maxsize=512, ttl=600)
+        self._llm_cache_lock = threading.Lock()
+
+        semantic_cache_dir = semantic_cache_dir or SEMANTIC_CACHE_DIR
+        self._semantic_cache = None
+        if semantic_cache_dir and self.use_llm:
+            if SEMANTIC_CACHE_AVAILABLE:
+                self._semantic_cache = _SemanticCache(semantic_cache_dir)
+            else:
+                print("[WARN] Semantic cache needs faiss-cpu and sentence-transformers; disabled")
+
     def extract_from_text(self, ocr_text: str) -> Tuple[Optional[Dict[str, float]], List[str]]:
         """
         Extract biomarker values from OCR text.
@@ -147,95 +372,167 @@ class BiomarkerExtractor:
         if not LLM_AVAILABLE:
             raise RuntimeError("Groq API not configured")
 
+        # Only the first 4000 characters are sent to the LLM
+        ocr_text = ocr_text[:4000]
+        cache_key = blake2b(ocr_text.encode(), digest_size=16).hexdigest()
+        with self._llm_cache_lock:
+            cached = self._llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Near-duplicate of an earlier report (another scan/photo of it)
+        cached = self._semantic_lookup(ocr_text)
+        if cached is not None:
+            print("[INFO] Reusing biomarkers from a near-identical report")
+            with self._llm_cache_lock:
+                self._llm_cache[cache_key] = cached
+            return cached
+
         try:
-            # Create comprehensive prompt
-            prompt = f"""Extract all biomarker values from this lab report text. Return ONLY valid JSON with all 24 biomarkers.
-
-Required biomarkers:
-1. hemoglobin (HGB, Hb)
-2. wbc_count (WBC, White Blood Cell)
-3. platelet_count (PLT, Platelet)
-4. glucose (GLU, Blood Sugar)
-5. creatinine (CREAT, Cr)
-6. bun (BUN, Blood Urea Nitrogen)
-7. sodium (Na)
-8. potassium (K)
-9. chloride (Cl)
-10. calcium (Ca)
-11. alt (ALT, Alanine Aminotransferase)
-12. ast (AST, Aspartate Aminotransferase)
-13. bilirubin_total (TBIL, Total Bilirubin)
-14. albumin (ALB)
-15. total_protein (TP, Protein)
-16. ldh (LDH, Lactate Dehydrogenase)
-17. troponin (TnI, Troponin I)
-18. bnp (BNP, B-Type Natriuretic Peptide)
-19. crp (CRP, C-Reactive Protein)
-20. esr (ESR, Erythrocyte Sedimentation Rate)
-21. procalcitonin (PCT)
-22. d_dimer (DD, D-Dimer)
-23. inr (INR, International Normalized Ratio)
-24. lactate (LAC, Lactate)
-
-Lab Report Text:
-{ocr_text[:4000]}
-
-Return JSON format:
-{{
-  "hemoglobin": <number or null>,
-  "wbc_count": <number or null>,
-  "platelet_count": <number or null>,
-  ...
-}}
-
-Rules:
-- Extract numeric values only (no units in JSON)
-- Use null for missing biomarkers
-- Convert units to standard (e.g., g/dL for hemoglobin, mg/dL for glucose)
-- Return ONLY the JSON object, no explanations
-"""
+            prompt = self._build_llm_prompt(ocr_text)
 
             # Use Groq via llm_provider
-            response_text = llm_provider.generate_text(prompt, temperature=0.3)
+            response_text = llm_provider.generate_text(prompt, temperature=0.3, json_mode=True)
             
             if not response_text:
                 print("[WARN] LLM returned empty response")
                 return None
-            
-            response_text = response_text.strip()
-
-            # Extract JSON from response (may have markdown code blocks)
-            json_match = re.search(r'\{[^{}]*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-            else:
-                # Try to parse entire response as JSON
-                json_str = response_text
 
-            # Parse JSON
-            data = json.loads(json_str)
+            result = self._parse_llm_response(response_text)
 
-            # Convert to float values, handle null
-            result = {}
-            for biomarker_id in self.BIOMARKER_ORDER:
-                value = data.get(biomarker_id)
-                if value is not None:
-                    try:
-                        result[biomarker_id] = float(value)
-                    except (ValueError, TypeError):
-                        result[biomarker_id] = None
-                else:
-                    result[biomarker_id] = None
+            with self._llm_cache_lock:
+                self._llm_cache[cache_key] = result
+            self._semantic_store(ocr_text, result)
 
             return result
 
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             print(f"[WARN] Failed to parse LLM JSON response: {str(e)}")
             return None
         except Exception as e:
             print(f"[WARN] LLM extraction error: {str(e)}")
             return None
 
+    def extract_batch(self, ocr_texts: List[str]) -> List[Optional[Dict[str, float]]]:
+        """
+        Extract biomarkers from many reports with one Groq Batch API job.
+
+        Cached texts are answered directly; the rest are submitted together.
+        Falls back to one extract_with_llm call per text if the batch
+        cannot be submitted, fails, or does not complete within
+        BATCH_EXTRACT_TIMEOUT seconds (it is cancelled first).
+
+        Args:
+            ocr_texts: OCR-extracted texts
+
+        Returns:
+            One dictionary of biomarker values (or None) per text, in order
+        """
+        if not LLM_AVAILABLE:
+            raise RuntimeError("Groq API not configured")
+
+        texts = [text[:4000] for text in ocr_texts]
+        keys = [blake2b(text.encode(), digest_size=16).hexdigest() for text in texts]
+        results: List[Optional[Dict[str, float]]] = [None] * len(texts)
+
+        pending = []
+        with self._llm_cache_lock:
+            for index, key in enumerate(keys):
+                cached = self._llm_cache.get(key)
+                if cached is not None:
+                    results[index] = cached
+                else:
+                    pending.append(index)
+        if not pending:
+            return results
+
+        try:
+            responses = llm_provider.generate_text_batch(
+                [self._build_llm_prompt(texts[i]) for i in pending],
+                temperature=0.3,
+                timeout=BATCH_EXTRACT_TIMEOUT,
+                json_mode=True,
+            )
+            if responses is None:
+                raise RuntimeError("batch API unavailable")
+        except Exception as e:
+            print(f"[WARN] Batch extraction failed: {str(e)}, falling back to per-report calls")
+            for index in pending:
+                results[index] = self.extract_with_llm(texts[index])
+            return results
+
+        for index, response_text in zip(pending, responses):
+            if not response_text:
+                continue
+            try:
+                result = self._parse_llm_response(response_text)
+            except ValueError as e:
+                print(f"[WARN] Failed to parse LLM JSON response: {str(e)}")
+                continue
+            with self._llm_cache_lock:
+                self._llm_cache[keys[index]] = result
+            results[index] = result
+
+        return results
+
+    def _semantic_lookup(self, ocr_text: str) -> Optional[Dict[str, Optional[float]]]:
+        """Semantic cache lookup; cache errors never fail the extraction."""
+        if self._semantic_cache is None:
+            return None
+        try:
+            return self._semantic_cache.get(ocr_text)
+        except Exception as e:
+            print(f"[WARN] Semantic cache lookup failed: {str(e)}")
+            return None
+
+    def _semantic_store(self, ocr_text: str, result: Dict[str, Optional[float]]) -> None:
+        """Add an LLM extraction to the semantic cache, if enabled."""
+        if self._semantic_cache is None:
+            return
+        try:
+            self._semantic_cache.put(ocr_text, result)
+        except Exception as e:
+            print(f"[WARN] Semantic cache update failed: {str(e)}")
+
+    def _build_llm_prompt(self, ocr_text: str) -> str:
+        """Build the biomarker extraction prompt for (truncated) OCR text."""
+        return self._PROMPT_PREFIX + ocr_text
+
+    def _parse_llm_response(self, response_text: str) -> Dict[str, Optional[float]]:
+        """Parse an LLM JSON response into values for every biomarker."""
+        # JSON mode returns a bare object; otherwise slice out the outermost
+        # braces (e.g. from a markdown code block)
+        try:
+            data = orjson.loads(response_text)
+        except orjson.JSONDecodeError:
+            start, end = response_text.find("{"), response_text.rfind("}")
+            if start == -1 or end < start:
+                raise
+            data = orjson.loads(response_text[start:end + 1])
+        if not isinstance(data, dict):
+            raise ValueError("LLM response is not a JSON object")
+
+        # Convert to float values, handle null
+        result = {}
+        for biomarker_id in self.BIOMARKER_ORDER:
+            value = data.get(biomarker_id)
+            if value is not None:
+                try:
+                    result[biomarker_id] = float(value)
+                except (ValueError, TypeError):
+                    result[biomarker_id] = None
+            else:
+                result[biomarker_id] = None
+        return result
+
+    async def extract_with_llm_async(self, ocr_text: str) -> Optional[Dict[str, float]]:
+        """
+        Async variant of extract_with_llm.
+
+        The blocking Groq call runs in a worker thread, so several reports
+        can be awaited together with asyncio.gather.
+        """
+        return await asyncio.to_thread(self.extract_with_llm, ocr_text)
 
     def extract_with_regex(self, ocr_text: str) -> Optional[Dict[str, float]]:
         """
@@ -247,36 +544,14 @@ Rules:
         Returns:
             Dictionary of biomarker values or None
         """
-        result = {}
-        text_lower = ocr_text.lower()
-
         # Pattern: biomarker name followed by number and optional unit
         # Example: "Hemoglobin: 14.5 g/dL" or "HGB 14.5"
-        patterns = {}
-
-        for biomarker_id in self.BIOMARKER_ORDER:
-            aliases = [k for k, v in self.BIOMARKER_ALIASES.items() if v == biomarker_id]
-            aliases.append(biomarker_id)
-
-            # Create pattern for this biomarker
-            name_pattern = "|".join(re.escape(alias) for alias in aliases)
-            # Match: name, optional colon/equals, whitespace, number, optional unit
-            pattern = rf'\b(?:{name_pattern})\b\s*[:=]?\s*(\d+\.?\d*)\s*(?:g/dl|mg/dl|mmol/l|×10³/μl|/μl|pg/ml|ng/ml|ratio|mm/hr|μg/ml)?'
+        result = dict.fromkeys(self.BIOMARKER_ORDER)
 
-            matches = re.finditer(pattern, text_lower, re.IGNORECASE)
-            values = []
-            for match in matches:
-                try:
-                    value = float(match.group(1))
-                    values.append(value)
-                except ValueError:
-                    continue
-
-            # Take the first reasonable value found
-            if values:
-                result[biomarker_id] = values[0]
-            else:
-                result[biomarker_id] = None
+        # One pass over the text; keep the first value found per biomarker
+        for biomarker_id, value in self._iter_alias_values(ocr_text):
+            if result[biomarker_id] is None:
+                result[biomarker_id] = float(value)
 
         # Check if we found at least some values
         found_count = sum(1 for v in result.values() if v is not None)
@@ -285,6 +560,66 @@ Rules:
 
         return result
 
+    def _iter_alias_values(self, ocr_text: str):
+        """
+        Yield (biomarker_id, value_str) for each "alias <number>" in text order.
+
+        Uses the Aho-Corasick automaton when available, otherwise the
+        combined regex; both follow the regex's leftmost, longest-alias,
+        non-overlapping match semantics.
+        """
+        if self._ALIAS_AUTOMATON is not None:
+            yield from self._iter_alias_values_automaton(ocr_text)
+            return
+
+        # Linear-time RE2 only pays off once texts get long (multi-page reports)
+        pattern = self._COMBINED_RE
+        if self._COMBINED_RE2 is not None and len(ocr_text) > RE2_MIN_TEXT_LENGTH:
+            pattern = self._COMBINED_RE2
+
+        for match in pattern.finditer(ocr_text):
+            # IGNORECASE also matches Unicode case variants (e.g. "HEMOGLOBİN")
+            # whose .lower() isn't a known alias; those are skipped
+            biomarker_id = self._ALIAS_TO_ID.get(match.group(1).lower())
+            if biomarker_id is not None:
+                yield biomarker_id, match.group(2)
+
+    def _iter_alias_values_automaton(self, ocr_text: str):
+        """Aho-Corasick variant of _iter_alias_values."""
+        text = ocr_text.lower()
+        text_len = len(text)
+
+        # Alias hits on word boundaries that are followed by a number
+        candidates = []
+        for end, (length, biomarker_id) in self._ALIAS_AUTOMATON.iter(text):
+            start = end - length + 1
+            if start > 0 and _is_word_char(text[start - 1]):
+                continue
+            if end + 1 < text_len and _is_word_char(text[end + 1]):
+                continue
+            value = _VALUE_RE.match(text, end + 1)
+            if value:
+                candidates.append((start, -length, value.end(), biomarker_id, value.group(1)))
+
+        # Leftmost first, longest alias first, skipping hits inside an accepted match
+        consumed = 0
+        for start, _, match_end, biomarker_id, value in sorted(candidates):
+            if start >= consumed:
+                consumed = match_end
+                yield biomarker_id, value
+
+    def validate_values(self, values: Dict[str, Optional[float]]) -> Tuple[Optional[Dict[str, float]], List[str]]:
+        """
+        Validate biomarker values obtained elsewhere (e.g. LabReportOCR.extract_biomarkers).
+
+        Args:
+            values: Dictionary of extracted values (may contain None)
+
+        Returns:
+            Tuple of (validated_dict, error_messages)
+        """
+        return self._validate_extracted_values(values)
+
     def _validate_extracted_values(self, values: Dict[str, Optional[float]]) -> Tuple[Optional[Dict[str, float]], List[str]]:
         """
         Validate and normalize extracted biomarker values.
@@ -295,31 +630,46 @@ Rules:
         Returns:
             Tuple of (validated_dict, error_messages)
         """
-        validated = {}
-        errors = []
-        missing = []
+        order = self.BIOMARKER_ORDER
+        raw = [values.get(biomarker_id) for biomarker_id in order]
+        present = np.fromiter((value is not None for value in raw), dtype=bool, count=len(raw))
 
-        for biomarker_id in self.BIOMARKER_ORDER:
-            value = values.get(biomarker_id)
-            if value is None:
-                missing.append(biomarker_id)
+        # If too many missing, return None
+        n_missing = len(raw) - int(present.sum())
+        if n_missing > 19:  # Need at least 5 biomarkers
+            return None, [f"Too many missing biomarkers: {n_missing}/24"]
+
+        invalid = np.zeros(len(raw), dtype=bool)
+        try:
+            arr = np.array([np.nan if value is None else value for value in raw], dtype=np.float64)
+        except (ValueError, TypeError):
+            # Some value isn't numeric: convert one by one to find it
+            arr = np.full(len(raw), np.nan)
+            for i, value in enumerate(raw):
+                if value is not None:
+                    try:
+                        arr[i] = float(value)
+                    except (ValueError, TypeError):
+                        invalid[i] = True
+
+        # Basic range validation (very permissive); NaN compares False and passes
+        out_of_range = (arr < 0) | (arr > 100000)
+        floats = arr.tolist()
+
+        errors = []
+        for i in np.flatnonzero(invalid | out_of_range).tolist():
+            if invalid[i]:
+                errors.append(f"{order[i]}: invalid value {raw[i]}")
             else:
-                try:
-                    float_value = float(value)
-                    # Basic range validation (very permissive)
-                    if float_value < 0 or float_value > 100000:
-                        errors.append(f"{biomarker_id}: value {float_value} out of reasonable range")
-                    else:
-                        validated[biomarker_id] = float_value
-                except (ValueError, TypeError):
-                    errors.append(f"{biomarker_id}: invalid value {value}")
+                errors.append(f"{order[i]}: value {floats[i]} out of reasonable range")
 
-        # If too many missing, return None
-        if len(missing) > 19:  # Need at least 5 biomarkers
-            return None, [f"Too many missing biomarkers: {len(missing)}/24"]
+        validated = {
+            order[i]: floats[i]
+            for i in np.flatnonzero(present & ~invalid & ~out_of_range).tolist()
+        }
 
         # Fill missing with None (will be handled by parser)
-        for biomarker_id in self.BIOMARKER_ORDER:
+        for biomarker_id in order:
             if biomarker_id not in validated:
                 validated[biomarker_id] = None
 
@@ -336,5 +686,7 @@ Rules:
             Standard biomarker ID or None
         """
         text_lower = text.lower().strip()
+        if text_lower in self._BIOMARKER_SET:
+            return text_lower
         return self.BIOMARKER_ALIASES.get(text_lower)
 
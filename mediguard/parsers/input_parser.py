@@ -6,6 +6,13 @@ Parses biomarker values from WhatsApp messages.
 import re
 from typing import Dict, Optional, Tuple, List
 
+import orjson
+
+from mediguard.data import BIOMARKER_INDEX, BIOMARKER_ORDER
+
+# Separators between key=value pairs
+_SEP_RE = re.compile(r'[,\n]')
+
 
 class BiomarkerInputParser:
     """
@@ -16,13 +23,9 @@ class BiomarkerInputParser:
     """
 
     # Standard biomarker order (24 biomarkers)
-    BIOMARKER_ORDER = [
-        "hemoglobin", "wbc_count", "platelet_count", "glucose", "creatinine",
-        "bun", "sodium", "potassium", "chloride", "calcium",
-        "alt", "ast", "bilirubin_total", "albumin", "total_protein",
-        "ldh", "troponin", "bnp", "crp", "esr",
-        "procalcitonin", "d_dimer", "inr", "lactate"
-    ]
+    BIOMARKER_ORDER = BIOMARKER_ORDER
+    _BIOMARKER_SET = frozenset(BIOMARKER_ORDER)
+    _ORDER_INDEX = BIOMARKER_INDEX
 
     # Aliases for biomarker codes
     BIOMARKER_ALIASES = {
@@ -73,9 +76,8 @@ class BiomarkerInputParser:
 
     def _parse_json(self, text: str) -> Tuple[Optional[Dict[str, float]], List[str]]:
         """Parse JSON format input."""
-        import json
         try:
-            data = json.loads(text)
+            data = orjson.loads(text)
             if not isinstance(data, dict):
                 return None, ["JSON input must be a dictionary/object"]
 
@@ -98,32 +100,23 @@ class BiomarkerInputParser:
 
             return normalized, []
 
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             return None, [f"Invalid JSON format: {str(e)}"]
 
     def _parse_key_value(self, text: str) -> Tuple[Optional[Dict[str, float]], List[str]]:
         """Parse key=value or key:value format."""
-        # Split by comma or newline
-        pairs = re.split(r'[,\n]', text)
-
         result = {}
-        for pair in pairs:
-            pair = pair.strip()
-            if not pair:
-                continue
-
-            # Try = separator
+        # Segments are split out once and partitioned with str methods; a
+        # regex scanning for pairs would backtrack over separator-free segments
+        for pair in _SEP_RE.split(text):
+            # "=" takes precedence; segments with neither separator are skipped
             if "=" in pair:
-                parts = pair.split("=", 1)
+                key, _, value = pair.partition("=")
             elif ":" in pair:
-                parts = pair.split(":", 1)
+                key, _, value = pair.partition(":")
             else:
                 continue
-
-            if len(parts) != 2:
-                continue
-
-            key, value = parts[0].strip(), parts[1].strip()
+            key, value = key.strip(), value.strip()
 
             # Normalize biomarker name
             norm_key = self._normalize_biomarker_name(key)
@@ -145,7 +138,9 @@ class BiomarkerInputParser:
 
     def _parse_csv(self, text: str) -> Tuple[Optional[Dict[str, float]], List[str]]:
         """Parse CSV format (values in standard order)."""
-        values = [v.strip() for v in text.split(",")]
+        # float() ignores surrounding whitespace, so values are only
+        # stripped when reported in an error
+        values = text.split(",")
 
         if len(values) != len(self.BIOMARKER_ORDER):
             return None, [
@@ -153,13 +148,15 @@ class BiomarkerInputParser:
                 f"Got {len(values)}. Order: {', '.join(self.BIOMARKER_ORDER)}"
             ]
 
+        to_float = float
         result = {}
-        for i, biomarker_id in enumerate(self.BIOMARKER_ORDER):
+        for biomarker_id, value in zip(self.BIOMARKER_ORDER, values):
             try:
-                result[biomarker_id] = float(values[i])
-            except (ValueError, TypeError):
+                result[biomarker_id] = to_float(value)
+            except ValueError:
+                position = self._ORDER_INDEX[biomarker_id] + 1
                 return None, [
-                    f"Invalid numeric value at position {i+1} ({biomarker_id}): {values[i]}"
+                    f"Invalid numeric value at position {position} ({biomarker_id}): {value.strip()}"
                 ]
 
         return result, []
@@ -169,7 +166,7 @@ class BiomarkerInputParser:
         name_lower = name.lower().strip().replace(" ", "_").replace("-", "_")
 
         # Check if it's already a standard ID
-        if name_lower in self.BIOMARKER_ORDER:
+        if name_lower in self._BIOMARKER_SET:
             return name_lower
 
         # Check aliases
@@ -180,11 +177,10 @@ class BiomarkerInputParser:
 
     def _check_missing_biomarkers(self, parsed: Dict[str, float]) -> List[str]:
         """Check for missing required biomarkers."""
-        missing = []
-        for bio_id in self.BIOMARKER_ORDER:
-            if bio_id not in parsed:
-                missing.append(bio_id)
-        return missing
+        missing = self._BIOMARKER_SET - parsed.keys()
+        if not missing:
+            return []
+        return [bio_id for bio_id in self.BIOMARKER_ORDER if bio_id in missing]
 
     def get_template(self, format_type: str = "json") -> str:
         """
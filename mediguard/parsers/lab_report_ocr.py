@@ -3,25 +3,224 @@ Lab Report OCR Module
 Extracts text from PDF/image lab reports using hybrid approach (LLM + Tesseract).
 """
 
+import asyncio
+import hashlib
+import io
+import multiprocessing
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from importlib.util import find_spec
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import TYPE_CHECKING, Optional, Dict, Any, Iterator, List, Iterable
 
-try:
-    import pytesseract
-    from PIL import Image
-    from pdf2image import convert_from_path
-    TESSERACT_AVAILABLE = True
-except ImportError:
-    TESSERACT_AVAILABLE = False
+import orjson
+from cachetools import TTLCache
+
+# OCR dependencies are only looked up here; the methods that need them
+# import them on first use, keeping text-only processes light at startup
+TESSERACT_AVAILABLE = all(
+    find_spec(name) is not None for name in ("pytesseract", "PIL", "pdf2image")
+)
+if not TESSERACT_AVAILABLE:
     print("Warning: Tesseract OCR dependencies not installed. Install with: pip install pytesseract pillow pdf2image")
 
+# PyMuPDF renders PDFs in-process instead of via poppler's pdftoppm
+PYMUPDF_AVAILABLE = find_spec("pymupdf") is not None
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+from mediguard.parsers.input_parser import BiomarkerInputParser
 from mediguard.utils import llm_provider
 
 LLM_AVAILABLE = llm_provider.GROQ_AVAILABLE
 if not LLM_AVAILABLE:
     print("Warning: Groq API not available. Tesseract will be used as fallback.")
 
+# Groq Vision uploads: PDF render resolution,
+# maximum image side and JPEG quality
+LLM_PDF_DPI = 150
+LLM_MAX_SIDE = 2048
+LLM_JPEG_QUALITY = 85
+
+LLM_OCR_PROMPT = """Extract all text from this lab report image.
+
+RULES:
+- Return the raw text content exactly as it appears
+- Preserve all biomarker names and values
+- Preserve units of measurement
+- Preserve numbers and decimal values
+- Preserve table structures if present
+
+Return only the extracted text, no explanations."""
+
+LLM_BIOMARKER_PROMPT = (
+    "Read this lab report image and return the value of each biomarker as a JSON object. "
+    "Use numbers only (no units), converted to standard units (e.g., g/dL for hemoglobin, "
+    "mg/dL for glucose), and null for biomarkers not on the report."
+)
+_BIOMARKER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        biomarker_id: {"type": ["number", "null"]}
+        for biomarker_id in BiomarkerInputParser.BIOMARKER_ORDER
+    },
+    "required": list(BiomarkerInputParser.BIOMARKER_ORDER),
+}
+
+# Image formats load_image opens directly (PDFs are rendered first)
+IMAGE_SUFFIXES = frozenset({'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif'})
+
+# Tesseract: LSTM engine, one uniform text block (lab tables), keep column spacing,
+# and skip the inverted-text (white on black) retry pass
+TESSERACT_CONFIG = "--oem 1 --psm 6 -c preserve_interword_spaces=1 -c tessedit_do_invert=0"
+# PDFs are rendered straight to grayscale at Tesseract's recommended 300 DPI.
+# Larger images (phone photos) are downscaled to the long side of an A4 page
+# at that resolution, so rendered A4/Letter pages are never shrunk below it
+TESSERACT_PDF_DPI = 300
+TESSERACT_MAX_SIDE = 3510  # A4 at 300 DPI renders to 2480x3509
+TESSERACT_THRESHOLD = 140
+_BINARIZE_TABLE = [0 if p < TESSERACT_THRESHOLD else 255 for p in range(256)]
+
+# Multi-page PDFs: pages are preprocessed and OCR'd in worker processes, so
+# PIL work and the image hand-off to tesseract don't contend for the GIL.
+# Tesseract itself runs up to 4 threads per page, hence cores/4 workers.
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", str(max(1, (os.cpu_count() or 1) // 4))))
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "10"))
+_OCR_POOL: Optional[ProcessPoolExecutor] = None
+# Workers are started from a clean forkserver (spawn where unavailable), never
+# forked from a gunicorn worker: its reply, log-flush and HTTP pool threads
+# may hold locks that a forked child would inherit held and deadlock on
+_OCR_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+_OCR_POOL_LOCK = threading.Lock()
+
+# Optional persistent OCR cache (one JSON file per file hash). Off unless
+# set, since it keeps report text on disk across restarts.
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR")
+
+
+def _render_pdf_page(pdf_path: str, page_index: int = 0, dpi: int = 300) -> "Image.Image":
+    """
+    Render one PDF page to an RGB PIL image.
+
+    Uses PyMuPDF in-process when installed, otherwise pdf2image (poppler).
+
+    Args:
+        pdf_path: Path to PDF file
+        page_index: Zero-based page number
+        dpi: Render resolution
+
+    Returns:
+        PIL Image object
+    """
+    if PYMUPDF_AVAILABLE:
+        import pymupdf
+        from PIL import Image
+
+        with pymupdf.open(pdf_path) as doc:
+            if page_index >= doc.page_count:
+                raise ValueError("Failed to convert PDF to image")
+            pix = doc.load_page(page_index).get_pixmap(dpi=dpi, alpha=False)
+        return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+    from pdf2image import convert_from_path
+
+    page = page_index + 1
+    images = convert_from_path(pdf_path, first_page=page, last_page=page, dpi=dpi)
+    if not images:
+        raise ValueError("Failed to convert PDF to image")
+    return images[0]
+
+
+def _render_pdf_pages(
+    pdf_path: str,
+    dpi: int = 300,
+    max_pages: int = OCR_MAX_PAGES,
+    grayscale: bool = False,
+) -> List["Image.Image"]:
+    """
+    Render the first max_pages pages of a PDF to PIL images.
+
+    Args:
+        pdf_path: Path to PDF file
+        dpi: Render resolution
+        max_pages: Maximum number of pages to render
+        grayscale: Render single-channel ("L") instead of RGB pixmaps
+
+    Returns:
+        List of PIL Image objects, one per page
+    """
+    if PYMUPDF_AVAILABLE:
+        import pymupdf
+        from PIL import Image
+
+        colorspace, mode = (pymupdf.csGRAY, "L") if grayscale else (pymupdf.csRGB, "RGB")
+        images = []
+        with pymupdf.open(pdf_path) as doc:
+            for page_index in range(min(doc.page_count, max_pages)):
+                pix = doc.load_page(page_index).get_pixmap(dpi=dpi, colorspace=colorspace, alpha=False)
+                images.append(Image.frombytes(mode, (pix.width, pix.height), pix.samples))
+    else:
+        from pdf2image import convert_from_path
+
+        images = convert_from_path(
+            pdf_path, first_page=1, last_page=max_pages, dpi=dpi, grayscale=grayscale
+        )
+
+    if not images:
+        raise ValueError("Failed to convert PDF to image")
+    return images
+
+
+def _ocr_pool() -> ProcessPoolExecutor:
+    """
+    Shared OCR process pool, created on first use.
+
+    Created lazily so it is started inside each (forked) gunicorn worker
+    rather than inherited from the preloading master.
+    """
+    global _OCR_POOL
+    with _OCR_POOL_LOCK:
+        if _OCR_POOL is None:
+            _OCR_POOL = ProcessPoolExecutor(max_workers=OCR_CONCURRENCY, mp_context=_OCR_MP_CONTEXT)
+        return _OCR_POOL
+
+
+def _reset_ocr_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken pool (e.g. a worker was killed) so the next call starts a new one."""
+    global _OCR_POOL
+    with _OCR_POOL_LOCK:
+        if _OCR_POOL is pool:
+            _OCR_POOL = None
+    pool.shutdown(wait=False)
+
+
+def _preprocess_for_tesseract(image: "Image.Image") -> "Image.Image":
+    """Grayscale, downscale and binarize an image (see LabReportOCR.preprocess_for_tesseract)."""
+    from PIL import Image
+
+    image = image.convert("L")
+    if max(image.size) > TESSERACT_MAX_SIDE:
+        image.thumbnail((TESSERACT_MAX_SIDE, TESSERACT_MAX_SIDE), Image.Resampling.LANCZOS)
+    return image.point(_BINARIZE_TABLE, mode="1")
+
+
+def _tesseract_worker(image: "Image.Image") -> str:
+    """Preprocess one page image and run Tesseract on it (picklable for the pool)."""
+    import pytesseract
+
+    try:
+        return pytesseract.image_to_string(
+            _preprocess_for_tesseract(image), lang='eng', config=TESSERACT_CONFIG
+        )
+    except Exception as e:
+        # pytesseract's exceptions don't survive pickling back to the parent
+        raise RuntimeError(str(e)) from None
+
 
 class LabReportOCR:
     """
@@ -29,12 +228,14 @@ class LabReportOCR:
     Uses Groq Vision API (primary) with Tesseract OCR fallback.
     """
 
-    def __init__(self, use_llm: bool = True):
+    def __init__(self, use_llm: bool = True, cache_dir: Optional[str] = None):
         """
         Initialize OCR engine.
 
         Args:
             use_llm: Whether to use LLM (Groq) for extraction (default: True)
+            cache_dir: Directory for the persistent OCR cache
+                (default: OCR_CACHE_DIR env var; disabled if neither is set)
         """
         self.use_llm = use_llm and LLM_AVAILABLE
         self.tesseract_available = TESSERACT_AVAILABLE
@@ -49,6 +250,14 @@ class LabReportOCR:
         if self.tesseract_available:
             print("[OK] Lab Report OCR: Tesseract enabled (fallback)")
 
+        # OCR results keyed by file content hash (re-uploads, retries)
+        self._ocr_cache = TTLCache(maxsize=256, ttl=3600)
+        self._ocr_cache_lock = threading.Lock()
+        cache_dir = cache_dir or OCR_CACHE_DIR
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
     def extract_text(self, file_path: str) -> Dict[str, Any]:
         """
         Extract text from PDF/image lab report using hybrid approach.
@@ -62,10 +271,57 @@ class LabReportOCR:
                 - method: "groq" or "tesseract"
                 - metadata: Additional info
         """
-        path = Path(file_path)
-        if not path.exists():
-            raise FileNotFoundError(f"File not found: {file_path}")
+        # Hashing opens the file anyway, so a missing file surfaces here
+        # without a separate exists() stat
+        try:
+            with open(file_path, "rb") as f:
+                cache_key = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=16)).hexdigest()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"File not found: {file_path}") from None
+        with self._ocr_cache_lock:
+            cached = self._ocr_cache.get(cache_key)
+        if cached is None:
+            cached = self._read_disk_cache(cache_key)
+            if cached is not None:
+                with self._ocr_cache_lock:
+                    self._ocr_cache[cache_key] = cached
+        if cached is not None:
+            print("[INFO] Reusing cached OCR result for identical file")
+            return cached
+
+        result = self._extract_text_uncached(file_path)
+        with self._ocr_cache_lock:
+            self._ocr_cache[cache_key] = result
+        self._write_disk_cache(cache_key, result)
+        return result
+
+    def _read_disk_cache(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Load a persisted OCR result, or None if absent/unreadable."""
+        if not self.cache_dir:
+            return None
+        try:
+            return orjson.loads((self.cache_dir / f"{cache_key}.json").read_bytes())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+
+    def _write_disk_cache(self, cache_key: str, result: Dict[str, Any]) -> None:
+        """Persist an OCR result atomically (write to temp file, then rename)."""
+        if not self.cache_dir:
+            return
+        target = self.cache_dir / f"{cache_key}.json"
+        tmp = target.with_suffix(f".{threading.get_ident()}.tmp")
+        try:
+            tmp.write_bytes(orjson.dumps(result))
+            os.replace(tmp, target)
+        except (OSError, TypeError) as e:
+            print(f"[WARN] Could not write OCR cache entry: {str(e)}")
+            try:
+                tmp.unlink()
+            except OSError:
+                pass
 
+    def _extract_text_uncached(self, file_path: str) -> Dict[str, Any]:
+        """Run the LLM -> Tesseract OCR cascade without consulting the cache."""
         # Try LLM first (if enabled)
         if self.use_llm:
             try:
@@ -91,6 +347,15 @@ class LabReportOCR:
 
         raise RuntimeError("No OCR method available")
 
+    async def extract_text_async(self, file_path: str) -> Dict[str, Any]:
+        """
+        Async variant of extract_text.
+
+        The blocking Groq/Tesseract work runs in a worker thread, so several
+        reports can be awaited together with asyncio.gather.
+        """
+        return await asyncio.to_thread(self.extract_text, file_path)
+
     def extract_with_llm(self, file_path: str) -> Dict[str, Any]:
         """
         Extract text using Groq Vision API.
@@ -101,59 +366,102 @@ class LabReportOCR:
         Returns:
             Dictionary with extracted text and metadata
         """
-        if not LLM_AVAILABLE:
-            raise RuntimeError("Groq API not configured")
-
-        path = Path(file_path)
-        file_extension = path.suffix.lower()
-        temp_image_path = None
-
         try:
-            # For PDFs, convert to image first
-            if file_extension == '.pdf':
-                image = self.convert_pdf_to_image(file_path)
-                import tempfile
-                temp_image_path = tempfile.mktemp(suffix='.png')
-                image.save(temp_image_path)
-                file_to_process = temp_image_path
-            else:
-                file_to_process = file_path
-
-            # Create prompt for text extraction
-            prompt = """Extract all text from this lab report image.
-
-RULES:
-- Return the raw text content exactly as it appears
-- Preserve all biomarker names and values
-- Preserve units of measurement
-- Preserve numbers and decimal values
-- Preserve table structures if present
-
-Return only the extracted text, no explanations."""
-
-            # Use Groq Vision via llm_provider
-            extracted_text = llm_provider.generate_with_image(prompt, file_to_process)
+            extracted_text = "".join(self.stream_with_llm(file_path))
 
             return {
-                "text": extracted_text or "",
+                "text": extracted_text,
                 "method": "groq",
                 "metadata": {
                     "model": llm_provider.GROQ_VISION_MODEL,
-                    "file_type": file_extension,
+                    "file_type": Path(file_path).suffix.lower(),
                 }
             }
 
         except Exception as e:
             raise RuntimeError(f"Groq extraction failed: {str(e)}")
 
-        finally:
-            # Cleanup temp file
-            if temp_image_path:
-                try:
-                    os.unlink(temp_image_path)
-                except OSError:
-                    pass
+    def stream_with_llm(self, file_path: str) -> Iterator[str]:
+        """
+        Stream extracted text from Groq Vision as it is generated.
+
+        Args:
+            file_path: Path to PDF or image file
+
+        Yields:
+            Text chunks in order; joined they form extract_with_llm's text
+        """
+        if not LLM_AVAILABLE:
+            raise RuntimeError("Groq API not configured")
 
+        # Use Groq Vision via llm_provider
+        yield from llm_provider.stream_with_image(LLM_OCR_PROMPT, self._llm_image(file_path))
+
+    def extract_biomarkers(self, file_path: str) -> Optional[Dict[str, Optional[float]]]:
+        """
+        Extract biomarker values straight from the report image in one
+        schema-guided Groq Vision call (no separate OCR text round trip).
+
+        Args:
+            file_path: Path to PDF or image file
+
+        Returns:
+            Value (or None) for every biomarker, or None if the call fails
+            or the response has no usable values
+        """
+        if not self.use_llm:
+            return None
+
+        try:
+            data = llm_provider.generate_json_with_image(
+                LLM_BIOMARKER_PROMPT, self._llm_image(file_path), _BIOMARKER_SCHEMA
+            )
+        except Exception as e:
+            print(f"[WARN] Groq biomarker extraction failed: {str(e)}")
+            return None
+        if not data:
+            return None
+
+        values = {}
+        for biomarker_id in BiomarkerInputParser.BIOMARKER_ORDER:
+            try:
+                value = data.get(biomarker_id)
+                values[biomarker_id] = float(value) if value is not None else None
+            except (ValueError, TypeError):
+                values[biomarker_id] = None
+        if all(value is None for value in values.values()):
+            return None
+        return values
+
+    def _llm_image(self, file_path: str):
+        """
+        Image payload for Groq Vision: a downscaled grayscale in-memory JPEG
+        (PDFs rendered at a lower DPI); without PIL, images go unchanged.
+        """
+        if Path(file_path).suffix.lower() == '.pdf':
+            return self.encode_for_llm(self.convert_pdf_to_image(file_path, dpi=LLM_PDF_DPI))
+        if TESSERACT_AVAILABLE:
+            return self.encode_for_llm(self.load_image(file_path))
+        return file_path
+
+    def encode_for_llm(self, image: "Image.Image") -> io.BytesIO:
+        """
+        Shrink an image for upload: longest side <= LLM_MAX_SIDE, grayscale, JPEG.
+
+        Args:
+            image: PIL Image object
+
+        Returns:
+            In-memory JPEG
+        """
+        from PIL import Image
+
+        image = image.convert("L")
+        if max(image.size) > LLM_MAX_SIDE:
+            image.thumbnail((LLM_MAX_SIDE, LLM_MAX_SIDE), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=LLM_JPEG_QUALITY, optimize=True)
+        return buffer
 
     def extract_with_tesseract(self, file_path: str) -> Dict[str, Any]:
         """
@@ -169,27 +477,48 @@ Return only the extracted text, no explanations."""
             raise RuntimeError("Tesseract OCR not available")
 
         try:
-            # Load image (convert PDF if needed)
-            image = self.load_image(file_path)
+            # Load page images (all pages for PDFs)
+            pages = self.load_pages(file_path)
             path = Path(file_path)
 
-            # Extract text with Tesseract
-            print(f"[INFO] Running Tesseract OCR on {path.name}...")
-            text = pytesseract.image_to_string(image, lang='eng')
+            # Extract text with Tesseract, one task per page
+            print(f"[INFO] Running Tesseract OCR on {path.name} ({len(pages)} page(s))...")
+            if len(pages) == 1:
+                texts = [_tesseract_worker(pages[0])]
+            else:
+                pool = _ocr_pool()
+                try:
+                    texts = list(pool.map(_tesseract_worker, pages))
+                except BrokenProcessPool:
+                    _reset_ocr_pool(pool)
+                    raise
 
             return {
-                "text": text,
+                "text": "\n".join(texts),
                 "method": "tesseract",
                 "metadata": {
                     "file_type": path.suffix.lower(),
-                    "image_size": f"{image.size[0]}x{image.size[1]}",
+                    "image_size": f"{pages[0].size[0]}x{pages[0].size[1]}",
+                    "pages": len(pages),
                 }
             }
 
         except Exception as e:
             raise RuntimeError(f"Tesseract OCR failed: {str(e)}")
 
-    def load_image(self, file_path: str) -> Image.Image:
+    def preprocess_for_tesseract(self, image: "Image.Image") -> "Image.Image":
+        """
+        Grayscale, downscale and binarize an image for faster Tesseract OCR.
+
+        Args:
+            image: PIL Image object
+
+        Returns:
+            1-bit PIL Image no larger than TESSERACT_MAX_SIDE on either side
+        """
+        return _preprocess_for_tesseract(image)
+
+    def load_image(self, file_path: str) -> "Image.Image":
         """
         Load image from file path (supports PDF and image formats).
 
@@ -200,31 +529,51 @@ Return only the extracted text, no explanations."""
             PIL Image object
         """
         path = Path(file_path)
-
-        if not path.exists():
-            raise FileNotFoundError(f"File not found: {file_path}")
+        suffix = path.suffix.lower()
 
         # Handle PDF
-        if path.suffix.lower() == '.pdf':
-            print("[INFO] Converting PDF to image for OCR...")
-            images = convert_from_path(file_path, first_page=1, last_page=1, dpi=300)
-            if not images:
-                raise ValueError("Failed to convert PDF to image")
-            return images[0]
+        if suffix == '.pdf':
+            if not path.exists():
+                raise FileNotFoundError(f"File not found: {file_path}")
+            return self.convert_pdf_to_image(file_path)
 
-        # Handle images
-        elif path.suffix.lower() in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif']:
-            return Image.open(file_path)
+        # Handle images (Image.open raises for a missing file itself)
+        elif suffix in IMAGE_SUFFIXES:
+            from PIL import Image
+
+            try:
+                return Image.open(file_path)
+            except FileNotFoundError:
+                raise FileNotFoundError(f"File not found: {file_path}") from None
 
         else:
             raise ValueError(f"Unsupported file format: {path.suffix}")
 
-    def convert_pdf_to_image(self, pdf_path: str) -> Image.Image:
+    def load_pages(self, file_path: str) -> List["Image.Image"]:
+        """
+        Load every page of a report as images (up to OCR_MAX_PAGES for PDFs).
+
+        Args:
+            file_path: Path to file
+
+        Returns:
+            List of PIL Image objects
+        """
+        path = Path(file_path)
+        if path.suffix.lower() == '.pdf':
+            if not path.exists():
+                raise FileNotFoundError(f"File not found: {file_path}")
+            print("[INFO] Converting PDF pages to images...")
+            return _render_pdf_pages(file_path, dpi=TESSERACT_PDF_DPI, grayscale=True)
+        return [self.load_image(file_path)]
+
+    def convert_pdf_to_image(self, pdf_path: str, dpi: int = 300) -> "Image.Image":
         """
         Convert PDF to image for processing.
 
         Args:
             pdf_path: Path to PDF file
+            dpi: Render resolution
 
         Returns:
             PIL Image object
@@ -233,8 +582,26 @@ Return only the extracted text, no explanations."""
             raise RuntimeError("pdf2image not available")
 
         print("[INFO] Converting PDF to image...")
-        images = convert_from_path(pdf_path, first_page=1, last_page=1, dpi=300)
-        if not images:
-            raise ValueError("Failed to convert PDF to image")
-        return images[0]
+        return _render_pdf_page(pdf_path, page_index=0, dpi=dpi)
+
 
+async def batch_extract(
+    paths: Iterable[str],
+    ocr: Optional[LabReportOCR] = None,
+) -> List[Any]:
+    """
+    Extract text from several lab reports concurrently.
+
+    Args:
+        paths: Paths to PDF or image files
+        ocr: OCR engine to use (a new LabReportOCR if omitted)
+
+    Returns:
+        One extract_text result per path, in order. A report that fails
+        yields its exception instead of cancelling the rest of the batch.
+    """
+    ocr = ocr or LabReportOCR()
+    return await asyncio.gather(
+        *(ocr.extract_text_async(path) for path in paths),
+        return_exceptions=True,
+    )
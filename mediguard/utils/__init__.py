@@ -1,12 +1,22 @@
 """
 MediGuard Utilities Package
 Security, logging, formatting, media handling, and LLM utilities.
+
+Media handling and the LLM provider are imported lazily (PEP 562) so that
+importing e.g. mediguard.utils.security doesn't initialize the Groq client
+or load requests.
 """
 
+from importlib import import_module
+
 from .security import anonymize_user_id, secure_logger
 from .formatters import format_prediction_response, format_biomarker_summary
-from .media_handler import MediaHandler, extract_media_from_twilio_request
-from . import llm_provider
+
+_LAZY_IMPORTS = {
+    "MediaHandler": ".media_handler",
+    "MediaInfo": ".media_handler",
+    "extract_media_from_twilio_request": ".media_handler",
+}
 
 __all__ = [
     "anonymize_user_id",
@@ -14,7 +24,18 @@ __all__ = [
     "format_prediction_response",
     "format_biomarker_summary",
     "MediaHandler",
+    "MediaInfo",
     "extract_media_from_twilio_request",
     "llm_provider",
 ]
 
+
+def __getattr__(name):
+    if name == "llm_provider":
+        value = import_module(".llm_provider", __name__)
+    elif name in _LAZY_IMPORTS:
+        value = getattr(import_module(_LAZY_IMPORTS[name], __name__), name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
@@ -0,0 +1,70 @@
+"""
+Database Connection Module
+Per-thread SQLite connections tuned for many small writes.
+"""
+
+import atexit
+import os
+import sqlite3
+import threading
+from typing import Dict
+
+# WAL lets readers and the writer proceed concurrently, and with
+# synchronous=NORMAL a commit no longer waits for an fsync
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA journal_size_limit=6144000",
+)
+
+_local = threading.local()
+
+# Connections inherited across fork() must be neither used nor closed by the
+# child (e.g. gunicorn workers forked after the app is preloaded); they are
+# parked here so garbage collection doesn't close them either
+_inherited = []
+
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Get the calling thread's connection to a database, opening it on first use.
+
+    Connections are in autocommit mode (each statement is its own
+    transaction unless an explicit BEGIN is issued) and return sqlite3.Row
+    rows. They are never shared between threads.
+
+    Args:
+        db_path: Path to SQLite database
+
+    Returns:
+        Open sqlite3 connection
+    """
+    connections: Dict[str, sqlite3.Connection] = getattr(_local, "connections", None)
+    if connections is None or _local.pid != os.getpid():
+        if connections:
+            _inherited.append(connections)
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, isolation_level=None)
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        conn.row_factory = sqlite3.Row
+        connections[db_path] = conn
+    return conn
+
+
+def close_connections() -> None:
+    """Close the calling thread's connections (other threads' close when they exit)."""
+    connections = getattr(_local, "connections", None)
+    if connections and _local.pid == os.getpid():
+        for conn in connections.values():
+            conn.close()
+    _local.connections = None
+
+
+atexit.register(close_connections)
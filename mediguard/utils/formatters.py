@@ -3,8 +3,16 @@ Response Formatters Module
 Formats prediction responses for WhatsApp display.
 """
 
+from functools import lru_cache
+from itertools import islice
 from typing import Dict, List, Any
 
+from mediguard.data import load_biomarker_config
+
+_STATUS_ARROWS = ("↓", "→", "↑")
+# Probability bars, 0-20 blocks
+_BARS = tuple("█" * i for i in range(21))
+
 
 def format_prediction_response(
     prediction_result: Dict[str, Any],
@@ -44,10 +52,10 @@ def format_prediction_response(
 
     # Probability breakdown
     message_parts.append("\n*Probability Breakdown:*")
-    for disease_id, prob in list(prediction_result["probabilities"].items())[:5]:
+    for disease_id, prob in islice(prediction_result["probabilities"].items(), 5):
         if prob > 0.01:  # Only show probabilities > 1%
             disease_name = disease_id.replace("_", " ").title()
-            bar = "█" * int(prob * 20)  # Bar chart
+            bar = _BARS[min(20, int(prob * 20))]  # Bar chart
             message_parts.append(f"  {disease_name}: {prob*100:.1f}% {bar}")
 
     # Key biomarkers
@@ -65,9 +73,10 @@ def format_prediction_response(
     # Warnings
     if warnings:
         message_parts.append("\n*Warnings:*")
-        # Group warnings by severity
-        critical_warnings = [w for w in warnings if "CRITICAL" in w.upper()]
-        other_warnings = [w for w in warnings if w not in critical_warnings]
+        # Group warnings by severity in one pass
+        critical_warnings, other_warnings = [], []
+        for w in warnings:
+            (critical_warnings if "CRITICAL" in w.upper() else other_warnings).append(w)
 
         for w in critical_warnings[:5]:  # Limit to 5 critical
             message_parts.append(f"  {w}")
@@ -117,39 +126,37 @@ def format_biomarker_summary(raw_summary: Dict[str, Any]) -> str:
     """
     message_parts = ["*Biomarker Summary:*\n"]
 
-    # Group by category
-    categories = {}
-    for bio_id, info in raw_summary.items():
-        # Get category from biomarker data (would need to pass this)
-        # For now, simple formatting
-        categories.setdefault("All", []).append(info)
+    # Bundled biomarkers in name order; anything else falls back to sorting
+    order = _summary_order()
+    if raw_summary.keys() <= order.keys():
+        bio_infos = [raw_summary[bio_id] for bio_id in order if bio_id in raw_summary]
+    else:
+        bio_infos = sorted(raw_summary.values(), key=lambda x: x["name"])
 
-    for bio_info in sorted(raw_summary.values(), key=lambda x: x["name"]):
+    for bio_info in bio_infos:
         raw_val = bio_info["raw_value"]
-        unit = bio_info["unit"]
-        name = bio_info["name"]
-        code = bio_info["code"]
         normal = bio_info["normal_range"]
 
-        # Status indicator
-        if raw_val < normal["min"]:
-            status = "↓"
-        elif raw_val > normal["max"]:
-            status = "↑"
-        else:
-            status = "→"
+        # Status indicator: 0 below, 1 within, 2 above the normal range
+        status = _STATUS_ARROWS[1 - (raw_val < normal["min"]) + (raw_val > normal["max"])]
 
         message_parts.append(
-            f"{status} {code}: {raw_val} {unit} "
+            f"{status} {bio_info['code']}: {raw_val} {bio_info['unit']} "
             f"(normal: {normal['min']}-{normal['max']})"
         )
 
     return "\n".join(message_parts)
 
 
-def format_help_message() -> str:
-    """Format help message for MediGuard bot."""
-    return """*MediGuard AI - Clinical Triage Assistant*
+@lru_cache(maxsize=1)
+def _summary_order() -> Dict[str, None]:
+    """Bundled biomarker IDs sorted by display name (insertion-ordered dict)."""
+    biomarkers = sorted(load_biomarker_config()["biomarkers"], key=lambda b: b["name"])
+    return dict.fromkeys(bio["id"] for bio in biomarkers)
+
+
+# Fixed bot messages, built once at import
+_HELP_MESSAGE = """*MediGuard AI - Clinical Triage Assistant*
 
 *How to Submit Blood Test Values:*
 
@@ -192,19 +199,8 @@ Hemoglobin, WBC Count, Platelet Count, Glucose, Creatinine, BUN, Sodium, Potassi
 *Note:* This is an AI assistant for educational and triage purposes. Always consult a healthcare provider for medical decisions.
 """
 
-
-def format_template_message(format_type: str = "json") -> str:
-    """
-    Format template message with example values.
-
-    Args:
-        format_type: "json", "key_value", or "csv"
-
-    Returns:
-        Template message
-    """
-    if format_type == "json":
-        return """*JSON Template (copy and edit values):*
+_TEMPLATE_MESSAGES = {
+    "json": """*JSON Template (copy and edit values):*
 
 ```
 {
@@ -236,20 +232,16 @@ def format_template_message(format_type: str = "json") -> str:
 ```
 
 Replace values with actual test results and send.
-"""
-
-    elif format_type == "key_value":
-        return """*Key-Value Template (copy and edit values):*
+""",
+    "key_value": """*Key-Value Template (copy and edit values):*
 
 ```
 hemoglobin=14.5, wbc_count=7.2, platelet_count=250, glucose=95, creatinine=1.0, bun=15, sodium=138, potassium=4.2, chloride=102, calcium=9.5, alt=25, ast=30, bilirubin_total=0.8, albumin=4.0, total_protein=7.0, ldh=180, troponin=0.02, bnp=50, crp=1.5, esr=10, procalcitonin=0.03, d_dimer=0.3, inr=1.0, lactate=1.5
 ```
 
 Replace values with actual test results and send.
-"""
-
-    else:  # CSV
-        return """*CSV Template (copy and edit values):*
+""",
+    "csv": """*CSV Template (copy and edit values):*
 
 Order: Hemoglobin, WBC, Platelet, Glucose, Creatinine, BUN, Na, K, Cl, Ca, ALT, AST, T.Bili, Albumin, T.Protein, LDH, Troponin, BNP, CRP, ESR, PCT, D-Dimer, INR, Lactate
 
@@ -258,7 +250,26 @@ Order: Hemoglobin, WBC, Platelet, Glucose, Creatinine, BUN, Na, K, Cl, Ca, ALT,
 ```
 
 Replace values with actual test results and send.
-"""
+""",
+}
+
+
+def format_help_message() -> str:
+    """Format help message for MediGuard bot."""
+    return _HELP_MESSAGE
+
+
+def format_template_message(format_type: str = "json") -> str:
+    """
+    Format template message with example values.
+
+    Args:
+        format_type: "json", "key_value", or "csv"
+
+    Returns:
+        Template message (CSV for unknown types)
+    """
+    return _TEMPLATE_MESSAGES.get(format_type, _TEMPLATE_MESSAGES["csv"])
 
 
 def chunk_message(message: str, max_length: int = 4000) -> List[str]:
@@ -276,17 +287,31 @@ def chunk_message(message: str, max_length: int = 4000) -> List[str]:
         return [message]
 
     chunks = []
-    current_chunk = ""
+    lines: List[str] = []
+    current_length = 0  # length of the chunk so far, one newline per line
 
     for line in message.split("\n"):
-        if len(current_chunk) + len(line) + 1 > max_length:
-            chunks.append(current_chunk.rstrip())
-            current_chunk = line + "\n"
+        if len(line) > max_length:
+            # A line longer than a whole chunk is cut into full-size slices;
+            # the remainder is packed with the following lines as usual
+            if lines:
+                chunks.append("\n".join(lines).rstrip())
+                lines, current_length = [], 0
+            cut = len(line) - (len(line) % max_length or max_length)
+            chunks.extend(line[i:i + max_length] for i in range(0, cut, max_length))
+            line = line[cut:]
+
+        line_length = len(line) + 1
+        if lines and current_length + line_length > max_length:
+            chunks.append("\n".join(lines).rstrip())
+            lines = [line]
+            current_length = line_length
         else:
-            current_chunk += line + "\n"
+            lines.append(line)
+            current_length += line_length
 
-    if current_chunk:
-        chunks.append(current_chunk.rstrip())
+    if lines:
+        chunks.append("\n".join(lines).rstrip())
 
     # Add chunk indicators
     if len(chunks) > 1:
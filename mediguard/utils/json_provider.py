@@ -0,0 +1,38 @@
+"""
+Flask JSON Provider
+orjson-backed replacement for Flask's default JSON provider.
+"""
+
+from typing import Any, Union
+
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Serialize jsonify()/dict responses and parse request bodies with orjson.
+
+    Usage: app.json = OrjsonProvider(app)
+    """
+
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def _options(self) -> int:
+        if self.sort_keys:
+            return self.option | orjson.OPT_SORT_KEYS
+        return self.option
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        # Hand orjson's bytes straight to the response, skipping the str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self._options()),
+            mimetype=self.mimetype
+        )
@@ -2,20 +2,29 @@
 Groq LLM Provider - Centralized client with retry logic and caching.
 
 Features:
-- Singleton client initialization
-- Exponential backoff for rate limits (429)
+- Singleton client, initialized on first use
+- Jittered backoff for rate limits (429) with a circuit breaker
 - Vision/OCR support via base64
 - Structured JSON output
 - Backward compatibility alias
 """
 
+import functools
+import io
 import os
+import random
+import secrets
+import threading
 import time
 import base64
-import json
 import logging
+import mmap
+from importlib.util import find_spec
 from pathlib import Path
-from typing import Optional, Dict, Any
+from types import MappingProxyType
+from typing import Optional, Dict, Any, Iterator, List, Tuple, Union
+
+import orjson
 
 logger = logging.getLogger(__name__)
 
@@ -35,50 +44,175 @@ GROQ_VISION_MODEL = os.getenv("GROQ_VISION_MODEL", "meta-llama/llama-4-scout-17b
 GROQ_JSON_MODEL = os.getenv("GROQ_JSON_MODEL", "llama-3.3-70b-versatile")
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.5"))
 MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+# Idle pooled connections are kept this long (httpx default: 5s), so sparse
+# chat traffic reuses TCP+TLS instead of handshaking on every call
+KEEPALIVE_EXPIRY = float(os.getenv("GROQ_KEEPALIVE_EXPIRY", "120"))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+# Consecutive provider failures before calls fail fast, and for how long
+BREAKER_THRESHOLD = int(os.getenv("GROQ_BREAKER_THRESHOLD", "5"))
+BREAKER_COOLDOWN = float(os.getenv("GROQ_BREAKER_COOLDOWN", "30"))
+BATCH_COMPLETION_WINDOW = os.getenv("GROQ_BATCH_COMPLETION_WINDOW", "24h")
+BATCH_POLL_INTERVAL = float(os.getenv("GROQ_BATCH_POLL_INTERVAL", "30"))
 
 # =============================================================================
 # Client Initialization
 # =============================================================================
 
+# The groq SDK (~150 ms to import) is only imported when the client is
+# first needed; availability is decided from the key and an installed SDK
+GROQ_AVAILABLE = bool(GROQ_API_KEY) and find_spec("groq") is not None
 _client = None
-GROQ_AVAILABLE = False
+_client_lock = threading.Lock()
+_CONNECTION_ERRORS: tuple = ()
 
-try:
-    from groq import Groq
-    if GROQ_API_KEY:
-        _client = Groq(api_key=GROQ_API_KEY)
-        GROQ_AVAILABLE = True
-        logger.info("[GROQ] Client initialized successfully")
-    else:
-        logger.warning("[GROQ] API key not configured")
-except ImportError:
+if find_spec("groq") is None:
     logger.warning("[GROQ] SDK not installed. Install with: pip install groq")
-except Exception as e:
-    logger.error(f"[GROQ] Initialization failed: {e}")
+elif not GROQ_API_KEY:
+    logger.warning("[GROQ] API key not configured")
+
+
+def _build_http_client():
+    """Pooled HTTP client for the Groq SDK (HTTP/2 when 'h2' is installed)."""
+    import httpx
+    return httpx.Client(
+        http2=find_spec("h2") is not None,
+        limits=httpx.Limits(
+            max_connections=100,
+            max_keepalive_connections=20,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(60.0, connect=5.0),
+    )
+
+
+def _init_client():
+    """Import the SDK and build the client (once; None if that fails)."""
+    global _client, _CONNECTION_ERRORS, GROQ_AVAILABLE
+    with _client_lock:
+        if _client is None and GROQ_AVAILABLE:
+            try:
+                from groq import Groq, APIConnectionError
+                _CONNECTION_ERRORS = (APIConnectionError,)
+                _client = Groq(api_key=GROQ_API_KEY, http_client=_build_http_client())
+                logger.info("[GROQ] Client initialized successfully")
+            except Exception as e:
+                GROQ_AVAILABLE = False
+                logger.error(f"[GROQ] Initialization failed: {e}")
+        return _client
+
+
+# Optional image hosting: with GROQ_IMAGE_BUCKET set, vision images are
+# uploaded to S3 and passed to Groq as presigned URLs instead of inline base64
+IMAGE_BUCKET = os.getenv("GROQ_IMAGE_BUCKET")
+IMAGE_KEY_PREFIX = os.getenv("GROQ_IMAGE_KEY_PREFIX", "ocr/")
+IMAGE_URL_TTL = int(os.getenv("GROQ_IMAGE_URL_TTL", "300"))
+_s3_client = None
+
+# boto3 is imported on first upload, like the groq SDK
+BOTO3_AVAILABLE = find_spec("boto3") is not None
+if not BOTO3_AVAILABLE:
+    if IMAGE_BUCKET:
+        logger.warning("[GROQ] GROQ_IMAGE_BUCKET set but boto3 not installed; images sent inline")
+
+# Vision upload limit and MIME types by file suffix
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+_MIME_TYPES = MappingProxyType({
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.bmp': 'image/bmp',
+})
 
 
 # =============================================================================
 # Retry Decorator
 # =============================================================================
 
+class CircuitOpenError(RuntimeError):
+    """Raised without calling Groq while the circuit breaker is open."""
+
+
+class _CircuitBreaker:
+    """
+    Process-wide CLOSED -> OPEN -> HALF_OPEN breaker for Groq calls.
+
+    After `threshold` consecutive provider failures the breaker opens and
+    calls fail fast for `cooldown` seconds; then one probe call is let
+    through, and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "CLOSED"
+        self.fail_count = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == "CLOSED":
+                return
+            if self.state == "OPEN" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "HALF_OPEN"  # this caller is the probe
+                return
+            raise CircuitOpenError("Groq temporarily unavailable (circuit open)")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = "CLOSED"
+            self.fail_count = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.fail_count += 1
+            if self.state == "HALF_OPEN" or self.fail_count >= self.threshold:
+                if self.state != "OPEN":
+                    logger.warning(f"[GROQ] Circuit opened after {self.fail_count} failures")
+                self.state = "OPEN"
+                self.opened_at = time.monotonic()
+
+
+_breaker = _CircuitBreaker(BREAKER_THRESHOLD, BREAKER_COOLDOWN)
+
+
+def _is_provider_failure(error: Exception) -> bool:
+    """Rate limits, 5xx and connection errors (not bad requests)."""
+    status = getattr(error, 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, _CONNECTION_ERRORS)
+
+
 def _retry_with_backoff(func):
-    """Decorator for exponential backoff on 429/5xx errors."""
+    """Decorator for decorrelated-jitter backoff on 429/5xx/connection errors."""
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        last_error = None
+        delay = RETRY_BASE_DELAY
         for attempt in range(MAX_RETRIES):
+            _breaker.before_call()
             try:
-                return func(*args, **kwargs)
+                result = func(*args, **kwargs)
             except Exception as e:
-                last_error = e
+                if not _is_provider_failure(e):
+                    # Groq answered (e.g. a 400), so it is reachable; this
+                    # also settles a HALF_OPEN probe instead of leaving it open
+                    _breaker.record_success()
+                    raise
+                _breaker.record_failure()
+                if attempt == MAX_RETRIES - 1 or _breaker.state == "OPEN":
+                    raise
+                # Decorrelated jitter keeps workers from retrying in lockstep
+                delay = min(RETRY_MAX_DELAY, random.uniform(RETRY_BASE_DELAY, delay * 3))
                 status = getattr(e, 'status_code', None)
-                if status in (429, 500, 502, 503) and attempt < MAX_RETRIES - 1:
-                    delay = 2 ** attempt
-                    logger.warning(f"[GROQ] Retry {attempt + 1}/{MAX_RETRIES} in {delay}s (status {status})")
-                    time.sleep(delay)
-                    continue
-                raise
-        if last_error:
-            raise last_error
+                logger.warning(f"[GROQ] Retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s (status {status})")
+                time.sleep(delay)
+                continue
+            _breaker.record_success()
+            return result
         return None
     return wrapper
 
@@ -88,8 +222,8 @@ def _retry_with_backoff(func):
 # =============================================================================
 
 def get_client():
-    """Get the Groq client instance."""
-    return _client
+    """Get the Groq client instance (built on first call; None if unavailable)."""
+    return _client or _init_client()
 
 
 def is_available() -> bool:
@@ -97,12 +231,35 @@ def is_available() -> bool:
     return GROQ_AVAILABLE
 
 
+def warm_up() -> bool:
+    """
+    Open a pooled connection to Groq ahead of the first real request.
+
+    Lists models (no tokens billed) so TCP+TLS setup is paid at startup.
+    Call it after forking (e.g. per gunicorn worker), not in a parent process.
+
+    Returns:
+        True if the connection was established
+    """
+    client = get_client()
+    if client is None:
+        return False
+    try:
+        client.models.list()
+        logger.info("[GROQ] Connection warmed up")
+        return True
+    except Exception as e:
+        logger.warning(f"[GROQ] Warm-up failed: {e}")
+        return False
+
+
 @_retry_with_backoff
 def generate_text(
     prompt: str,
     temperature: Optional[float] = None,
     max_tokens: int = 4096,
     system_prompt: Optional[str] = None,
+    json_mode: bool = False,
 ) -> Optional[str]:
     """
     Generate text using Groq LLM.
@@ -112,11 +269,13 @@ def generate_text(
         temperature: Optional temperature (0.0-2.0)
         max_tokens: Maximum tokens in response
         system_prompt: Optional system prompt
+        json_mode: Constrain the response to a single JSON object
         
     Returns:
         Generated text or None
     """
-    if not GROQ_AVAILABLE or not _client:
+    client = get_client()
+    if client is None:
         logger.warning("[GROQ] generate_text called but client unavailable")
         return None
     
@@ -125,11 +284,13 @@ def generate_text(
         messages.append({"role": "system", "content": system_prompt})
     messages.append({"role": "user", "content": prompt})
     
-    response = _client.chat.completions.create(
+    extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+    response = client.chat.completions.create(
         messages=messages,
         model=GROQ_TEXT_MODEL,
         temperature=temperature if temperature is not None else TEMPERATURE,
         max_tokens=max_tokens,
+        **extra,
     )
     
     result = response.choices[0].message.content
@@ -137,77 +298,204 @@ def generate_text(
     return result
 
 
+def _hosted_image_url(data, mime_type: str) -> Optional[Tuple[str, str]]:
+    """
+    Upload image bytes to GROQ_IMAGE_BUCKET and return a short-lived
+    presigned URL and the object key, or None (caller falls back to inline
+    base64). The caller deletes the object once Groq has answered.
+    """
+    global _s3_client
+    if not IMAGE_BUCKET or not BOTO3_AVAILABLE:
+        return None
+    try:
+        if _s3_client is None:
+            import boto3
+            _s3_client = boto3.client("s3")
+        # A random key per upload, so deleting one request's copy never
+        # pulls the image out from under a concurrent request for the same file
+        key = f"{IMAGE_KEY_PREFIX}{secrets.token_hex(16)}"
+        _s3_client.put_object(Bucket=IMAGE_BUCKET, Key=key, Body=bytes(data), ContentType=mime_type)
+        url = _s3_client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": IMAGE_BUCKET, "Key": key},
+            ExpiresIn=IMAGE_URL_TTL,
+        )
+        return url, key
+    except Exception as e:
+        logger.warning(f"[GROQ] Image upload failed, sending inline: {e}")
+        return None
+
+
+def _delete_hosted_image(key: Optional[str]) -> None:
+    """Delete an uploaded lab-report image (no-op for inline images)."""
+    if key is None:
+        return
+    try:
+        _s3_client.delete_object(Bucket=IMAGE_BUCKET, Key=key)
+    except Exception as e:
+        logger.warning(f"[GROQ] Could not delete uploaded image {key}: {e}")
+
+
+def _image_url(data, mime_type: str) -> Tuple[str, Optional[str]]:
+    """
+    Hosted URL for the image if configured, else an inline base64 data URL.
+
+    Returns:
+        (url, uploaded object key or None)
+    """
+    hosted = _hosted_image_url(data, mime_type)
+    if hosted is not None:
+        return hosted
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}", None
+
+
+def _image_message(
+    prompt: str,
+    image: Union[str, Path, bytes, io.BytesIO],
+    mime_type: Optional[str] = None,
+) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    Validate an image and wrap it (hosted URL or base64) in a vision chat message.
+
+    Returns:
+        (message, uploaded object key to pass to _delete_hosted_image, or None)
+    """
+    if isinstance(image, (bytes, bytearray, io.BytesIO)):
+        # getbuffer() exposes BytesIO contents without copying them
+        raw = image.getbuffer() if isinstance(image, io.BytesIO) else image
+        if len(raw) > MAX_IMAGE_BYTES:
+            raise ValueError(f"Image too large: {len(raw) / 1024 / 1024:.1f}MB (max 20MB)")
+        mime_type = mime_type or 'image/jpeg'
+        image_url, hosted_key = _image_url(raw, mime_type)
+    else:
+        path = Path(image)
+        if not path.exists():
+            raise FileNotFoundError(f"Image not found: {image}")
+        if not path.is_file():
+            raise ValueError(f"Not a file: {image}")
+        
+        # Check file size (max 20MB)
+        size = path.stat().st_size
+        if size > MAX_IMAGE_BYTES:
+            raise ValueError(f"Image too large: {size / 1024 / 1024:.1f}MB (max 20MB)")
+        
+        mime_type = mime_type or _MIME_TYPES.get(path.suffix.lower(), 'image/png')
+        # Read straight from a memory map instead of a bytes copy
+        if size:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                image_url, hosted_key = _image_url(mm, mime_type)
+        else:
+            image_url, hosted_key = _image_url(b"", mime_type)
+    
+    message = {
+        "role": "user",
+        "content": [
+            {"type": "text", "text": prompt},
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": image_url
+                }
+            }
+        ]
+    }
+    return message, hosted_key
+
+
 @_retry_with_backoff
+def _vision_completion(
+    message: Dict[str, Any],
+    temperature: Optional[float],
+    max_tokens: int,
+    stream: bool,
+    response_format: Optional[Dict[str, Any]] = None,
+):
+    """Create a Groq Vision chat completion (a chunk iterator when streaming)."""
+    extra = {"response_format": response_format} if response_format else {}
+    return get_client().chat.completions.create(
+        messages=[message],
+        model=GROQ_VISION_MODEL,
+        temperature=temperature if temperature is not None else TEMPERATURE,
+        max_tokens=max_tokens,
+        stream=stream,
+        **extra,
+    )
+
+
 def generate_with_image(
     prompt: str,
-    image_path: str,
+    image: Union[str, Path, bytes, io.BytesIO],
     temperature: Optional[float] = None,
     max_tokens: int = 4096,
+    mime_type: Optional[str] = None,
 ) -> Optional[str]:
     """
     Generate text with image input using Groq Vision.
     
     Args:
         prompt: Text prompt
-        image_path: Path to image file
+        image: Path to image file, or encoded image bytes / BytesIO
         temperature: Optional temperature
         max_tokens: Maximum tokens
+        mime_type: MIME type (default: from file suffix, JPEG for bytes)
         
     Returns:
         Generated text or None
     """
-    if not GROQ_AVAILABLE or not _client:
+    client = get_client()
+    if client is None:
         logger.warning("[GROQ] generate_with_image called but client unavailable")
         return None
     
-    path = Path(image_path)
-    if not path.exists():
-        raise FileNotFoundError(f"Image not found: {image_path}")
-    if not path.is_file():
-        raise ValueError(f"Not a file: {image_path}")
-    
-    # Check file size (max 20MB)
-    if path.stat().st_size > 20 * 1024 * 1024:
-        raise ValueError(f"Image too large: {path.stat().st_size / 1024 / 1024:.1f}MB (max 20MB)")
-    
-    # Read and encode
-    with open(path, "rb") as f:
-        image_data = base64.b64encode(f.read()).decode('utf-8')
-    
-    # Determine MIME type
-    mime_map = {
-        '.jpg': 'image/jpeg',
-        '.jpeg': 'image/jpeg',
-        '.png': 'image/png',
-        '.gif': 'image/gif',
-        '.webp': 'image/webp',
-        '.bmp': 'image/bmp',
-    }
-    mime_type = mime_map.get(path.suffix.lower(), 'image/png')
-    
-    response = _client.chat.completions.create(
-        messages=[{
-            "role": "user",
-            "content": [
-                {"type": "text", "text": prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:{mime_type};base64,{image_data}"
-                    }
-                }
-            ]
-        }],
-        model=GROQ_VISION_MODEL,
-        temperature=temperature if temperature is not None else TEMPERATURE,
-        max_tokens=max_tokens,
-    )
+    message, hosted_key = _image_message(prompt, image, mime_type)
+    try:
+        response = _vision_completion(message, temperature, max_tokens, stream=False)
+    finally:
+        _delete_hosted_image(hosted_key)
     
     result = response.choices[0].message.content
     logger.debug(f"[GROQ] Vision generation: {len(result or '')} chars")
     return result
 
 
+def stream_with_image(
+    prompt: str,
+    image: Union[str, Path, bytes, io.BytesIO],
+    temperature: Optional[float] = None,
+    max_tokens: int = 4096,
+    mime_type: Optional[str] = None,
+) -> Iterator[str]:
+    """
+    Stream text generated from image input using Groq Vision.
+    
+    Same arguments as generate_with_image. The request is sent (with retries)
+    on the first next(); text chunks are yielded as they arrive, so callers
+    can start on partial output instead of waiting for the full response.
+    
+    Yields:
+        Generated text chunks (nothing if the client is unavailable)
+    """
+    client = get_client()
+    if client is None:
+        logger.warning("[GROQ] stream_with_image called but client unavailable")
+        return
+    
+    message, hosted_key = _image_message(prompt, image, mime_type)
+    # Also runs if the caller stops iterating early (generator close)
+    try:
+        stream = _vision_completion(message, temperature, max_tokens, stream=True)
+
+        total = 0
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                total += len(delta)
+                yield delta
+    finally:
+        _delete_hosted_image(hosted_key)
+    logger.debug(f"[GROQ] Vision stream: {total} chars")
+
+
 @_retry_with_backoff
 def generate_json(
     prompt: str,
@@ -225,12 +513,13 @@ def generate_json(
     Returns:
         Parsed JSON dict or None
     """
-    if not GROQ_AVAILABLE or not _client:
+    client = get_client()
+    if client is None:
         logger.warning("[GROQ] generate_json called but client unavailable")
         return None
     
     try:
-        response = _client.chat.completions.create(
+        response = client.chat.completions.create(
             messages=[
                 {"role": "system", "content": "Respond with valid JSON only. No explanations."},
                 {"role": "user", "content": prompt}
@@ -251,15 +540,170 @@ def generate_json(
         if not content:
             return None
         
-        result = json.loads(content)
+        result = orjson.loads(content)
         logger.debug("[GROQ] JSON generation successful")
         return result
         
-    except json.JSONDecodeError as e:
+    except orjson.JSONDecodeError as e:
         logger.error(f"[GROQ] JSON parse error: {e}")
         return None
 
 
+def generate_json_with_image(
+    prompt: str,
+    image: Union[str, Path, bytes, io.BytesIO],
+    schema: Dict[str, Any],
+    temperature: Optional[float] = None,
+    mime_type: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Generate structured JSON from image input in one Groq Vision call.
+    
+    Args:
+        prompt: Extraction prompt
+        image: Path to image file, or encoded image bytes / BytesIO
+        schema: JSON schema for output
+        temperature: Optional temperature (lower = more deterministic)
+        mime_type: MIME type (default: from file suffix, JPEG for bytes)
+        
+    Returns:
+        Parsed JSON dict or None
+    """
+    client = get_client()
+    if client is None:
+        logger.warning("[GROQ] generate_json_with_image called but client unavailable")
+        return None
+    
+    message, hosted_key = _image_message(prompt, image, mime_type)
+    try:
+        response = _vision_completion(
+            message,
+            temperature if temperature is not None else 0.3,
+            4096,
+            stream=False,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "extraction_result",
+                    "strict": False,
+                    "schema": schema,
+                }
+            },
+        )
+    finally:
+        _delete_hosted_image(hosted_key)
+    
+    content = response.choices[0].message.content
+    if not content:
+        return None
+    try:
+        result = orjson.loads(content)
+    except orjson.JSONDecodeError as e:
+        logger.error(f"[GROQ] JSON parse error: {e}")
+        return None
+    logger.debug("[GROQ] Vision JSON generation successful")
+    return result if isinstance(result, dict) else None
+
+
+def generate_text_batch(
+    prompts: List[str],
+    temperature: Optional[float] = None,
+    max_tokens: int = 4096,
+    poll_interval: Optional[float] = None,
+    timeout: Optional[float] = None,
+    json_mode: bool = False,
+) -> Optional[List[Optional[str]]]:
+    """
+    Generate text for many prompts through the Groq Batch API.
+
+    Submits one JSONL file, polls until the batch finishes and returns the
+    responses in prompt order. Batch jobs are billed at a discount but
+    complete within BATCH_COMPLETION_WINDOW rather than immediately.
+
+    Args:
+        prompts: User prompts
+        temperature: Optional temperature (0.0-2.0)
+        max_tokens: Maximum tokens per response
+        poll_interval: Seconds between status checks
+        timeout: Optional seconds to wait before cancelling the batch and
+            giving up
+        json_mode: Constrain each response to a single JSON object
+
+    Returns:
+        Generated texts (None for failed items), or None if unavailable
+
+    Raises:
+        RuntimeError: If the batch fails, expires or is cancelled
+        TimeoutError: If the batch is still running after timeout seconds
+            (it is cancelled first, so a fallback isn't billed twice)
+    """
+    client = get_client()
+    if client is None:
+        logger.warning("[GROQ] generate_text_batch called but client unavailable")
+        return None
+    if not prompts:
+        return []
+
+    lines = []
+    for index, prompt in enumerate(prompts):
+        body = {
+            "model": GROQ_TEXT_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature if temperature is not None else TEMPERATURE,
+            "max_tokens": max_tokens,
+        }
+        if json_mode:
+            body["response_format"] = {"type": "json_object"}
+        lines.append(orjson.dumps({
+            "custom_id": str(index),
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": body,
+        }))
+
+    batch_file = client.files.create(
+        file=("batch.jsonl", b"\n".join(lines)),
+        purpose="batch",
+    )
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window=BATCH_COMPLETION_WINDOW,
+    )
+    logger.info(f"[GROQ] Submitted batch {batch.id} with {len(prompts)} requests")
+
+    interval = poll_interval if poll_interval is not None else BATCH_POLL_INTERVAL
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        if deadline is not None and time.monotonic() >= deadline:
+            try:
+                client.batches.cancel(batch.id)
+            except Exception as e:
+                logger.warning(f"[GROQ] Could not cancel batch {batch.id}: {e}")
+            raise TimeoutError(f"Batch {batch.id} still {batch.status} after {timeout}s")
+        time.sleep(interval)
+        batch = client.batches.retrieve(batch.id)
+
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+
+    results: List[Optional[str]] = [None] * len(prompts)
+    output = client.files.content(batch.output_file_id).read()
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        item = orjson.loads(line)
+        response = item.get("response") or {}
+        if response.get("status_code") != 200:
+            continue
+        choices = (response.get("body") or {}).get("choices") or []
+        if choices:
+            results[int(item["custom_id"])] = choices[0]["message"]["content"]
+
+    logger.debug(f"[GROQ] Batch {batch.id}: {sum(r is not None for r in results)}/{len(prompts)} succeeded")
+    return results
+
+
 # =============================================================================
 # Backward Compatibility
 # =============================================================================
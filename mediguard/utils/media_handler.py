@@ -3,13 +3,96 @@ Media Handler Module
 Handles downloading and processing media files (PDF/images) from Twilio WhatsApp.
 """
 
+import html
+import logging
 import os
+import re
 import requests
 import tempfile
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, Tuple, Dict, Any
 from urllib.parse import urlparse
 
+logger = logging.getLogger(__name__)
+
+# Google Drive file ID in share, ?id= and /open?id= links
+_GDRIVE_ID_PATTERNS = (
+    re.compile(r'/file/d/([a-zA-Z0-9_-]+)'),  # Standard share link: /file/d/ID/view
+    re.compile(r'id=([a-zA-Z0-9_-]+)'),  # URL with id parameter: ?id=ID
+    re.compile(r'/open\?id=([a-zA-Z0-9_-]+)'),  # Open link format: /open?id=ID
+)
+# Real download link on Drive's virus-scan warning page (searched on raw bytes;
+# the link's file ID and confirm token are case-sensitive)
+_GDRIVE_DOWNLOAD_HREF_RE = re.compile(rb'href="([^"]*uc\?[^"]*)"', re.IGNORECASE)
+
+# User-facing replies for Google Drive links that can't be downloaded
+_GDRIVE_SIGN_IN_MESSAGE = (
+    "Google Drive file requires authentication and is not publicly accessible.\n\n"
+    "To fix:\n"
+    "1. Open the file in Google Drive\n"
+    "2. Click 'Share' button\n"
+    "3. Click 'Change to anyone with the link'\n"
+    "4. Set permission to 'Viewer'\n"
+    "5. Copy the link and try again\n\n"
+    "The file must be accessible without signing in."
+)
+
+_GDRIVE_VIRUS_SCAN_MESSAGE = (
+    "Google Drive file is too large or requires virus scan confirmation.\n\n"
+    "For large files:\n"
+    "1. Right-click file → 'Share' → 'Get link'\n"
+    "2. Set to 'Anyone with the link' → 'Viewer'\n"
+    "3. Try downloading manually first to confirm it works\n"
+    "4. Or convert PDF to images and send those instead"
+)
+
+_GDRIVE_AUTH_MESSAGE = (
+    "Google Drive file requires authentication.\n\n"
+    "To fix:\n"
+    "1. Right-click the file in Google Drive\n"
+    "2. Click 'Share' → 'Change to anyone with the link'\n"
+    "3. Set permission to 'Viewer' (not 'Restricted')\n"
+    "4. Copy the new link and try again\n\n"
+    "The file must be publicly accessible without sign-in."
+)
+
+_GDRIVE_NOT_PUBLIC_MESSAGE = (
+    "Google Drive file is not publicly accessible.\n\n"
+    "To fix:\n"
+    "1. Right-click the file in Google Drive\n"
+    "2. Select 'Share' → 'Change to anyone with the link'\n"
+    "3. Set permission to 'Viewer'\n"
+    "4. Copy the new link and try again"
+)
+
+# Twilio form fields for each attachment (a message carries at most 10)
+_MEDIA_FIELDS = tuple(
+    (f"MediaUrl{i}", f"MediaContentType{i}", f"MediaSid{i}") for i in range(10)
+)
+
+
+@dataclass(slots=True, frozen=True)
+class MediaInfo:
+    """Media attached to (or linked from) an incoming WhatsApp message."""
+
+    num_media: int
+    media_url: str
+    media_content_type: Optional[str]
+    media_sid: Optional[str]
+    message_type: str  # "media", "document" or "url" (link in message text)
+    filename: Optional[str] = None
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    """Write all of data to a raw file descriptor (os.write may write less)."""
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
 
 class MediaHandler:
     """
@@ -18,10 +101,34 @@ class MediaHandler:
     """
 
     # Supported file extensions
-    SUPPORTED_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif'}
-    SUPPORTED_PDF_EXTENSIONS = {'.pdf'}
+    SUPPORTED_IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif'})
+    SUPPORTED_PDF_EXTENSIONS = frozenset({'.pdf'})
     SUPPORTED_EXTENSIONS = SUPPORTED_IMAGE_EXTENSIONS | SUPPORTED_PDF_EXTENSIONS
 
+    # Canonical MIME type -> extension
+    CONTENT_TYPE_EXTENSIONS = {
+        'application/pdf': '.pdf',
+        'application/x-pdf': '.pdf',
+        'image/jpeg': '.jpg',
+        'image/jpg': '.jpg',
+        'image/png': '.png',
+        'image/gif': '.gif',
+        'image/bmp': '.bmp',
+        'image/tiff': '.tiff',
+    }
+
+    # Leading bytes of each supported format -> extension, keyed by first byte
+    # (the formats' signatures all start with distinct bytes)
+    MAGIC_BYTES = {
+        0x25: (b'%PDF', '.pdf'),
+        0xFF: (b'\xff\xd8\xff', '.jpg'),
+        0x89: (b'\x89PNG', '.png'),
+        0x47: (b'GIF', '.gif'),
+    }
+
+    # Download read size (few Python-level iterations per multi-MB file)
+    DOWNLOAD_CHUNK = 512 * 1024
+
     # Maximum file size (10MB)
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB in bytes
 
@@ -38,6 +145,25 @@ class MediaHandler:
         else:
             self.temp_dir = Path(tempfile.gettempdir()) / "mediguard_media"
             self.temp_dir.mkdir(parents=True, exist_ok=True)
+        # Plain-string form for the per-download os.* calls
+        self._temp_dir_str = str(self.temp_dir)
+
+        # One pooled session for all downloads: keep-alive per host, and
+        # backoff retries on 429/5xx (the last response is returned as-is)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=32,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset(['GET']),
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
 
     def download_media(
         self,
@@ -60,19 +186,17 @@ class MediaHandler:
             Returns (None, error_msg) on failure
         """
         try:
-            # Initialize variable at the start to avoid scope issues
-            first_chunk_for_file = None
             response = None
             
             # Check if this is a Twilio media URL (requires auth) or public URL
             is_twilio_url = "api.twilio.com" in media_url or "twilio.com" in media_url
             
-            print(f"[DEBUG] Downloading from {'Twilio' if is_twilio_url else 'public'} URL: {media_url[:100]}...")
+            logger.debug("Downloading from %s URL: %.100s...", 'Twilio' if is_twilio_url else 'public', media_url)
             
             # Download with or without authentication
             if is_twilio_url and account_sid and auth_token:
                 # Twilio media URL - requires authentication
-                response = requests.get(
+                response = self.session.get(
                     media_url,
                     auth=(account_sid, auth_token),
                     timeout=30,
@@ -80,44 +204,36 @@ class MediaHandler:
                 )
             else:
                 # Public URL - no authentication needed (workaround for PDF uploads)
-                print(f"[DEBUG] Downloading from public URL (no auth required)")
+                logger.debug("Downloading from public URL (no auth required)")
                 
                 # Handle Google Drive URLs - convert to direct download
                 if "drive.google.com" in media_url:
-                    print(f"[DEBUG] ========== GOOGLE DRIVE URL CONVERSION ==========")
-                    print(f"[DEBUG] Original URL: {media_url[:200]}...")
+                    logger.debug("Google Drive URL conversion, original URL: %.200s...", media_url)
                     
                     # Extract file ID from various Google Drive URL formats
-                    import re as url_re
-                    gd_patterns = [
-                        r'/file/d/([a-zA-Z0-9_-]+)',  # Standard share link: /file/d/ID/view
-                        r'id=([a-zA-Z0-9_-]+)',      # URL with id parameter: ?id=ID
-                        r'/open\?id=([a-zA-Z0-9_-]+)', # Open link format: /open?id=ID
-                    ]
                     file_id = None
                     original_url = media_url
                     
-                    for pattern in gd_patterns:
-                        match = url_re.search(pattern, media_url)
+                    for pattern in _GDRIVE_ID_PATTERNS:
+                        match = pattern.search(media_url)
                         if match:
                             file_id = match.group(1)
-                            print(f"[DEBUG] Extracted Google Drive file ID: {file_id}")
-                            print(f"[DEBUG] Pattern matched: {pattern}")
+                            logger.debug("Extracted Google Drive file ID %s (pattern %s)", file_id, pattern.pattern)
                             break
                     
                     if file_id:
                         # Try multiple Google Drive download URL formats
                         # Method 1: Standard direct download (works for files < 100MB)
                         direct_url = f"https://drive.google.com/uc?export=download&id={file_id}"
-                        print(f"[DEBUG] Converted to direct download URL: {direct_url}")
-                        print(f"[DEBUG] File ID: {file_id}")
+                        logger.debug("Converted to direct download URL: %s", direct_url)
                         media_url = direct_url
                     else:
-                        print(f"[ERROR] Could not extract file ID from Google Drive URL")
-                        print(f"[ERROR] URL: {original_url[:200]}...")
-                        print(f"[ERROR] Tried patterns: {gd_patterns}")
+                        logger.error(
+                            "Could not extract file ID from Google Drive URL %.200s (tried %s)",
+                            original_url, [p.pattern for p in _GDRIVE_ID_PATTERNS],
+                        )
                         # Continue with original URL - might work for some formats
-                        print(f"[WARN] Continuing with original URL (may fail)")
+                        logger.warning("Continuing with original URL (may fail)")
                 
                 # For Google Drive, we need to handle large files differently
                 headers = {
@@ -127,73 +243,53 @@ class MediaHandler:
                 
                 # For Google Drive, handle the virus scan warning for large files
                 if "drive.google.com" in media_url and "uc?export=download" in media_url:
-                    # First request to get the download link (may redirect for large files)
-                    session = requests.Session()
-                    initial_response = session.get(
-                        media_url,
-                        timeout=30,
-                        headers=headers,
-                        allow_redirects=False
-                    )
-                    
-                    # Check if we got a redirect (large file warning)
-                    if initial_response.status_code in [302, 303, 307, 308]:
-                        # Follow the redirect
-                        redirect_url = initial_response.headers.get('Location')
-                        if redirect_url:
-                            print(f"[DEBUG] Following Google Drive redirect: {redirect_url[:100]}...")
-                            media_url = redirect_url
-                    elif initial_response.status_code == 200:
-                        # Check if response is HTML (virus scan warning page)
-                        content_type = initial_response.headers.get('Content-Type', '').lower()
-                        if 'text/html' in content_type:
-                            # Read first few bytes to check
-                            try:
-                                content_preview = initial_response.content[:500].decode('utf-8', errors='ignore').lower()
-                                if 'virus scan' in content_preview or 'large file' in content_preview:
-                                    print(f"[WARN] Google Drive returned virus scan warning page")
-                                    # Try to extract the actual download link from the HTML
-                                    import re
-                                    download_match = re.search(r'href="([^"]*uc\?[^"]*)"', content_preview)
-                                    if download_match:
-                                        actual_url = download_match.group(1)
-                                        if not actual_url.startswith('http'):
-                                            actual_url = 'https://drive.google.com' + actual_url
-                                        print(f"[DEBUG] Found download link in warning page: {actual_url[:100]}...")
-                                        media_url = actual_url
-                            except Exception as e:
-                                print(f"[WARN] Could not parse Google Drive warning page: {str(e)}")
-                    
-                    # Now download the actual file
-                    response = session.get(
+                    # One request, following redirects; the hops are inspected afterwards
+                    response = self.session.get(
                         media_url,
                         timeout=60,  # Longer timeout for large files
                         stream=True,
                         headers=headers,
                         allow_redirects=True
                     )
-                    
-                    # Check if redirect led to sign-in page
-                    if response.status_code == 200:
-                        content_type = response.headers.get('Content-Type', '').lower()
-                        if 'text/html' in content_type:
-                            # Check if it's a sign-in page
-                            content_preview = response.content[:1000].decode('utf-8', errors='ignore').lower()
-                            if 'accounts.google.com' in content_preview or 'sign in' in content_preview:
-                                print(f"[ERROR] Google Drive redirect led to sign-in page - file is NOT publicly accessible")
-                                return None, (
-                                    "Google Drive file requires authentication and is not publicly accessible.\n\n"
-                                    "To fix:\n"
-                                    "1. Open the file in Google Drive\n"
-                                    "2. Click 'Share' button\n"
-                                    "3. Click 'Change to anyone with the link'\n"
-                                    "4. Set permission to 'Viewer'\n"
-                                    "5. Copy the link and try again\n\n"
-                                    "The file must be accessible without signing in."
-                                )
+                    for hop in response.history:
+                        logger.debug("Google Drive redirect: %.100s...", hop.headers.get('Location', ''))
+                        if 'accounts.google.com' in hop.headers.get('Location', ''):
+                            logger.error("Google Drive redirected to sign-in - file is NOT publicly accessible")
+                            response.close()
+                            return None, _GDRIVE_SIGN_IN_MESSAGE
+
+                    # Large files get a virus scan warning page linking to the real download
+                    confirm_url = None
+                    content_type = response.headers.get('Content-Type', '').lower()
+                    if response.status_code == 200 and 'text/html' in content_type:
+                        try:
+                            page_head = response.content[:4096]
+                            page_head_lower = page_head.lower()
+                            if b'virus scan' in page_head_lower or b'large file' in page_head_lower:
+                                logger.warning("Google Drive returned virus scan warning page")
+                                # Try to extract the actual download link from the HTML
+                                download_match = _GDRIVE_DOWNLOAD_HREF_RE.search(page_head)
+                                if download_match:
+                                    confirm_url = html.unescape(download_match.group(1).decode('ascii', errors='ignore'))
+                                    if not confirm_url.startswith('http'):
+                                        confirm_url = 'https://drive.google.com' + confirm_url
+                                    logger.debug("Found download link in warning page: %.100s...", confirm_url)
+                        except Exception as e:
+                            logger.warning("Could not parse Google Drive warning page: %s", e)
+
+                    if confirm_url:
+                        media_url = confirm_url
+                        response.close()
+                        response = self.session.get(
+                            media_url,
+                            timeout=60,
+                            stream=True,
+                            headers=headers,
+                            allow_redirects=True
+                        )
                 else:
                     # Regular public URL download
-                    response = requests.get(
+                    response = self.session.get(
                         media_url,
                         timeout=30,
                         stream=True,
@@ -207,37 +303,47 @@ class MediaHandler:
             
             response.raise_for_status()
             
-            # CRITICAL: Check if response is HTML (sign-in page or error page)
-            # This must happen BEFORE we try to save the file
-            # Note: first_chunk_for_file is already initialized at function start
-            content_type = response.headers.get('Content-Type', '').lower()
-            if 'text/html' in content_type:
-                # Read first chunk to check
-                first_chunk = next(response.iter_content(chunk_size=1024), b'')
-                content_str = first_chunk.decode('utf-8', errors='ignore').lower()
-                
-                if 'accounts.google.com' in content_str or 'sign in' in content_str:
-                    print(f"[ERROR] Downloaded content is Google sign-in page - file is NOT publicly accessible")
-                    return None, (
-                        "Google Drive file requires authentication and is not publicly accessible.\n\n"
-                        "To fix:\n"
-                        "1. Open the file in Google Drive\n"
-                        "2. Click 'Share' button\n"
-                        "3. Click 'Change to anyone with the link'\n"
-                        "4. Set permission to 'Viewer'\n"
-                        "5. Copy the link and try again\n\n"
-                        "The file must be accessible without signing in."
-                    )
-                
-                # Reset response for actual download
-                response = session.get(media_url, timeout=60, stream=True, headers=headers, allow_redirects=True) if 'session' in locals() else requests.get(media_url, timeout=60, stream=True, headers=headers, allow_redirects=True)
-                response.raise_for_status()
-
-            # Check file size
+            # Check file size. The GET is streamed, so only headers have been read
+            # here: rejecting now costs no more than a HEAD preflight would, and
+            # bodies without a Content-Length are capped while writing below.
             content_length = response.headers.get('Content-Length')
             if content_length and int(content_length) > self.MAX_FILE_SIZE:
+                response.close()
                 return None, f"File too large (max {self.MAX_FILE_SIZE / 1024 / 1024}MB)"
 
+            content_type = response.headers.get('Content-Type', '').lower()
+            mime_type = content_type.split(';', 1)[0].strip()
+            if mime_type.startswith('text/') or mime_type == 'application/xhtml+xml':
+                # A web page or text, not a lab report: a small peek is enough to
+                # explain why (sign-in, virus scan page), unless the server simply
+                # mislabelled a real file
+                first_chunk = next(response.iter_content(chunk_size=2048), b'')
+                if not self._sniff_extension(first_chunk):
+                    response.close()
+                    return None, (
+                        self._html_error_message(first_chunk, content_type)
+                        or f"Unsupported file type: {mime_type}. Supported: PDF, JPG, PNG, etc."
+                    )
+                chunks = response.iter_content(chunk_size=self.DOWNLOAD_CHUNK)
+                first_bytes = first_chunk[:1024]
+            else:
+                # Peek at the first chunk only: HTML error pages are rejected and the
+                # real file type is read from magic bytes before anything hits disk
+                chunks = response.iter_content(chunk_size=self.DOWNLOAD_CHUNK)
+                first_chunk = next(chunks, b'')
+                first_bytes = first_chunk[:1024]
+                # A recognized signature rules out an HTML page; only unknown
+                # content is searched for HTML markers
+                if not self._sniff_extension(first_bytes):
+                    html_error = self._html_error_message(first_bytes, content_type)
+                    if html_error:
+                        response.close()
+                        return None, html_error
+
+            actual_extension = self._sniff_extension(first_bytes)
+            if actual_extension:
+                logger.debug("Detected %s from magic bytes", actual_extension)
+
             # Determine file extension from Content-Type or URL (initial guess)
             initial_extension = file_extension
             if not initial_extension:
@@ -256,154 +362,110 @@ class MediaHandler:
                     else:
                         initial_extension = '.pdf'  # Default to PDF for unknown
 
-            # Validate extension
-            if initial_extension not in self.SUPPORTED_EXTENSIONS:
-                return None, f"Unsupported file type: {initial_extension}. Supported: PDF, JPG, PNG, etc."
-
-            # Create temporary file with initial extension
-            import uuid
-            temp_filename = f"lab_report_{uuid.uuid4().hex[:8]}{initial_extension}"
-            temp_file_path = self.temp_dir / temp_filename
+            # Content wins over headers/URL (e.g. PDFs served as .jpg)
+            if actual_extension and actual_extension != initial_extension:
+                logger.warning("File type mismatch! Initial: %s, Actual: %s", initial_extension, actual_extension)
+            elif not actual_extension:
+                logger.warning("Could not detect file type from magic bytes, using initial extension: %s", initial_extension)
+            extension = actual_extension or initial_extension
 
-            # Download file
-            # If we already peeked at first chunk (for HTML check), include it
-            first_chunk_data = first_chunk_for_file if first_chunk_for_file else None
-            
-            with open(temp_file_path, 'wb') as f:
-                if first_chunk_data:
-                    f.write(first_chunk_data)
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-            
-            # CRITICAL: Detect actual file type from content (magic bytes)
-            # This fixes the issue where PDFs are saved as .jpg
-            if temp_file_path.exists():
-                file_size = temp_file_path.stat().st_size
-                print(f"[DEBUG] Downloaded file size: {file_size} bytes")
-                
-                try:
-                    with open(temp_file_path, 'rb') as f:
-                        first_bytes = f.read(1024)
-                        content_str = first_bytes.decode('utf-8', errors='ignore').lower()
-                        
-                        print(f"[DEBUG] First 200 bytes (hex): {first_bytes[:200].hex()}")
-                        print(f"[DEBUG] First 200 bytes (text): {content_str[:200]}")
-                        
-                        # Detect actual file type from magic bytes
-                        actual_extension = None
-                        if first_bytes.startswith(b'%PDF'):
-                            actual_extension = '.pdf'
-                            print(f"[DEBUG] Detected PDF from magic bytes")
-                        elif first_bytes.startswith(b'\xff\xd8\xff'):
-                            actual_extension = '.jpg'
-                            print(f"[DEBUG] Detected JPEG from magic bytes")
-                        elif first_bytes.startswith(b'\x89PNG'):
-                            actual_extension = '.png'
-                            print(f"[DEBUG] Detected PNG from magic bytes")
-                        elif first_bytes.startswith(b'GIF'):
-                            actual_extension = '.gif'
-                            print(f"[DEBUG] Detected GIF from magic bytes")
-                        
-                        # If detected extension differs from initial, rename file
-                        if actual_extension and actual_extension != initial_extension:
-                            print(f"[WARN] File type mismatch! Initial: {initial_extension}, Actual: {actual_extension}")
-                            print(f"[INFO] Renaming file to correct extension...")
-                            try:
-                                new_temp_path = temp_file_path.with_suffix(actual_extension)
-                                if new_temp_path.exists():
-                                    new_temp_path.unlink()  # Remove if exists
-                                temp_file_path.rename(new_temp_path)
-                                temp_file_path = new_temp_path
-                                temp_filename = temp_file_path.name
-                                print(f"[OK] File renamed to: {temp_filename}")
-                            except Exception as rename_error:
-                                print(f"[ERROR] Failed to rename file: {str(rename_error)}")
-                                # Continue with original path - validation will handle it
-                        elif actual_extension:
-                            print(f"[OK] File type matches: {actual_extension}")
-                        else:
-                            print(f"[WARN] Could not detect file type from magic bytes, using initial extension: {initial_extension}")
-                        
-                        # Check for HTML content (Google Drive error pages)
-                        if b'<html' in first_bytes.lower() or b'<!doctype' in first_bytes.lower():
-                            print(f"[ERROR] Downloaded file is HTML, not a valid media file!")
-                            # Check for specific Google Drive error messages
-                            if 'drive.google.com' in content_str or 'virus scan warning' in content_str or 'sign in' in content_str.lower():
-                                temp_file_path.unlink()
-                                
-                                # Check for specific error types
-                                if 'virus scan warning' in content_str or 'large file' in content_str.lower():
-                                    return None, (
-                                        "Google Drive file is too large or requires virus scan confirmation.\n\n"
-                                        "For large files:\n"
-                                        "1. Right-click file → 'Share' → 'Get link'\n"
-                                        "2. Set to 'Anyone with the link' → 'Viewer'\n"
-                                        "3. Try downloading manually first to confirm it works\n"
-                                        "4. Or convert PDF to images and send those instead"
-                                    )
-                                elif 'sign in' in content_str.lower() or 'access denied' in content_str.lower():
-                                    return None, (
-                                        "Google Drive file requires authentication.\n\n"
-                                        "To fix:\n"
-                                        "1. Right-click the file in Google Drive\n"
-                                        "2. Click 'Share' → 'Change to anyone with the link'\n"
-                                        "3. Set permission to 'Viewer' (not 'Restricted')\n"
-                                        "4. Copy the new link and try again\n\n"
-                                        "The file must be publicly accessible without sign-in."
-                                    )
-                                else:
-                                    return None, (
-                                        "Google Drive file is not publicly accessible.\n\n"
-                                        "To fix:\n"
-                                        "1. Right-click the file in Google Drive\n"
-                                        "2. Select 'Share' → 'Change to anyone with the link'\n"
-                                        "3. Set permission to 'Viewer'\n"
-                                        "4. Copy the new link and try again"
-                                    )
-                            else:
-                                # HTML but not Google Drive - generic error
-                                temp_file_path.unlink()
-                                return None, "Downloaded file appears to be HTML. The file may require authentication or is not accessible."
-                except Exception as e:
-                    # If we can't read it, it might be locked - wait a moment and try again
-                    import time
-                    time.sleep(0.1)
-                    try:
-                        with open(temp_file_path, 'rb') as f:
-                            first_bytes = f.read(1024)
-                            content_str = first_bytes.decode('utf-8', errors='ignore').lower()
-                            
-                            if b'<html' in first_bytes.lower() or b'<!doctype' in first_bytes.lower():
-                                if 'drive.google.com' in content_str:
-                                    temp_file_path.unlink()
-                                    return None, (
-                                        "Google Drive file is not publicly accessible.\n\n"
-                                        "Please share the file with 'Anyone with the link' and try again."
-                                    )
-                                else:
-                                    temp_file_path.unlink()
-                                    return None, "Downloaded file appears to be HTML. The file may require authentication."
-                    except:
-                        pass  # Continue with validation
+            # Validate extension
+            if extension not in self.SUPPORTED_EXTENSIONS:
+                response.close()
+                return None, f"Unsupported file type: {extension}. Supported: PDF, JPG, PNG, etc."
+
+            # Create temporary file with the detected extension
+            temp_filename = f"lab_report_{os.urandom(4).hex()}{extension}"
+            temp_file_path = os.path.join(self._temp_dir_str, temp_filename)
+
+            # Stream the rest to disk, stopping as soon as the size limit is passed.
+            # Chunks go straight to the fd (no BufferedWriter copy); the file is
+            # created fresh (never through an existing path or symlink) and is
+            # private to this user since it holds a patient's report.
+            file_size = len(first_chunk)
+            fd = os.open(
+                temp_file_path,
+                os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0),
+                0o600,
+            )
+            try:
+                _write_all(fd, first_chunk)
+                for chunk in chunks:
+                    file_size += len(chunk)
+                    if file_size > self.MAX_FILE_SIZE:
+                        break
+                    _write_all(fd, chunk)
+            finally:
+                os.close(fd)
+            response.close()
 
             # Verify file was downloaded
-            if not temp_file_path.exists() or temp_file_path.stat().st_size == 0:
+            if file_size == 0:
+                os.unlink(temp_file_path)
                 return None, "Downloaded file is empty"
 
-            file_size = temp_file_path.stat().st_size
             if file_size > self.MAX_FILE_SIZE:
-                temp_file_path.unlink()  # Clean up
-                return None, f"File too large ({file_size / 1024 / 1024:.2f}MB, max {self.MAX_FILE_SIZE / 1024 / 1024}MB)"
+                os.unlink(temp_file_path)  # Clean up
+                return None, f"File too large (over {self.MAX_FILE_SIZE / 1024 / 1024}MB)"
 
-            print(f"[OK] Downloaded media: {temp_file_path.name} ({file_size / 1024:.2f}KB)")
-            return str(temp_file_path), None
+            logger.info("Downloaded media: %s (%.2fKB)", temp_filename, file_size / 1024)
+            return temp_file_path, None
 
         except requests.exceptions.RequestException as e:
             return None, f"Failed to download media: {str(e)}"
         except Exception as e:
             return None, f"Error downloading media: {str(e)}"
 
+    def _sniff_extension(self, first_bytes: bytes) -> Optional[str]:
+        """
+        Detect the file type from its leading magic bytes.
+
+        Args:
+            first_bytes: Start of the file content
+
+        Returns:
+            File extension (e.g., '.pdf', '.jpg') or None if unrecognized
+        """
+        if not first_bytes:
+            return None
+        entry = self.MAGIC_BYTES.get(first_bytes[0])
+        if entry and first_bytes.startswith(entry[0]):
+            return entry[1]
+        return None
+
+    def _html_error_message(self, first_bytes: bytes, content_type: str) -> Optional[str]:
+        """
+        Classify a downloaded HTML page (sign-in, virus scan warning, error page).
+
+        Args:
+            first_bytes: Start of the response body
+            content_type: Lowercased Content-Type header
+
+        Returns:
+            User-facing error message, or None if the content is not an HTML page
+        """
+        # All markers are ASCII, so the bytes are searched without decoding
+        page = first_bytes.lower()
+
+        if 'text/html' in content_type and (b'accounts.google.com' in page or b'sign in' in page):
+            logger.error("Downloaded content is Google sign-in page - file is NOT publicly accessible")
+            return _GDRIVE_SIGN_IN_MESSAGE
+
+        if b'<html' not in page and b'<!doctype' not in page:
+            return None
+
+        logger.error("Downloaded file is HTML, not a valid media file!")
+        # Check for specific Google Drive error messages
+        if b'drive.google.com' in page or b'virus scan warning' in page or b'sign in' in page:
+            if b'virus scan warning' in page or b'large file' in page:
+                return _GDRIVE_VIRUS_SCAN_MESSAGE
+            elif b'sign in' in page or b'access denied' in page:
+                return _GDRIVE_AUTH_MESSAGE
+            return _GDRIVE_NOT_PUBLIC_MESSAGE
+
+        # HTML but not Google Drive - generic error
+        return "Downloaded file appears to be HTML. The file may require authentication or is not accessible."
+
     def is_valid_lab_report(self, file_path: str) -> Tuple[bool, Optional[str]]:
         """
         Validate if file is a valid lab report (PDF or image).
@@ -416,7 +478,10 @@ class MediaHandler:
         """
         path = Path(file_path)
 
-        if not path.exists():
+        # One stat serves both the existence and the size check
+        try:
+            file_size = path.stat().st_size
+        except FileNotFoundError:
             return False, "File does not exist"
 
         # Check extension
@@ -425,7 +490,6 @@ class MediaHandler:
             return False, f"Unsupported file type: {extension}. Supported: {', '.join(self.SUPPORTED_EXTENSIONS)}"
 
         # Check file size
-        file_size = path.stat().st_size
         if file_size == 0:
             return False, "File is empty"
         if file_size > self.MAX_FILE_SIZE:
@@ -445,13 +509,13 @@ class MediaHandler:
         """
         try:
             path = Path(file_path)
-            if path.exists():
-                path.unlink()
-                print(f"[OK] Cleaned up temp file: {path.name}")
-                return True
+            path.unlink()
+            logger.info("Cleaned up temp file: %s", path.name)
+            return True
+        except FileNotFoundError:
             return False
         except Exception as e:
-            print(f"[WARN] Warning: Failed to cleanup temp file {file_path}: {str(e)}")
+            logger.warning("Failed to cleanup temp file %s: %s", file_path, e)
             return False
 
     def get_file_info(self, file_path: str) -> Dict[str, Any]:
@@ -465,19 +529,21 @@ class MediaHandler:
             Dictionary with file information
         """
         path = Path(file_path)
-        if not path.exists():
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
             return {"exists": False}
 
-        stat = path.stat()
+        extension = path.suffix.lower()
         return {
             "exists": True,
             "path": str(path),
             "name": path.name,
-            "extension": path.suffix.lower(),
+            "extension": extension,
             "size_bytes": stat.st_size,
             "size_mb": round(stat.st_size / 1024 / 1024, 2),
-            "is_pdf": path.suffix.lower() == '.pdf',
-            "is_image": path.suffix.lower() in self.SUPPORTED_IMAGE_EXTENSIONS,
+            "is_pdf": extension == '.pdf',
+            "is_image": extension in self.SUPPORTED_IMAGE_EXTENSIONS,
         }
 
     def _get_extension_from_content_type(self, content_type: str) -> Optional[str]:
@@ -490,6 +556,12 @@ class MediaHandler:
         Returns:
             File extension (e.g., '.pdf', '.jpg') or None
         """
+        # Common case: a well-formed MIME type, possibly with parameters
+        mime_type = content_type.split(';', 1)[0].strip().lower()
+        extension = self.CONTENT_TYPE_EXTENSIONS.get(mime_type)
+        if extension:
+            return extension
+
         content_type_lower = content_type.lower()
 
         # PDF
@@ -511,7 +583,7 @@ class MediaHandler:
         return None
 
 
-def extract_media_from_twilio_request(request_form: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+def extract_media_from_twilio_request(request_form: Dict[str, Any]) -> Optional[MediaInfo]:
     """
     Extract media information from Twilio webhook request.
     
@@ -524,17 +596,15 @@ def extract_media_from_twilio_request(request_form: Dict[str, Any]) -> Optional[
         request_form: Flask request.form dictionary
 
     Returns:
-        Dictionary with media info or None if no media
+        MediaInfo or None if no media
     """
-    print(f"\n[DEBUG] ========== EXTRACTING MEDIA ==========")
-    print(f"[DEBUG] ALL REQUEST KEYS: {list(request_form.keys())}")
-    print(f"[DEBUG] ALL REQUEST VALUES:")
-    for key, value in request_form.items():
-        if isinstance(value, str) and len(value) > 100:
-            print(f"[DEBUG]   {key}: {value[:100]}...")
-        else:
-            print(f"[DEBUG]   {key}: {value}")
-    print(f"[DEBUG] ========================================\n")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Extracting media, request fields:")
+        for key, value in request_form.items():
+            if isinstance(value, str) and len(value) > 100:
+                logger.debug("  %s: %.100s...", key, value)
+            else:
+                logger.debug("  %s: %s", key, value)
     
     # Check ALL possible field names Twilio might use
     # Twilio WhatsApp can use various field names for media/documents
@@ -544,7 +614,7 @@ def extract_media_from_twilio_request(request_form: Dict[str, Any]) -> Optional[
     try:
         num_media = int(num_media_str)
     except (ValueError, TypeError):
-        print(f"[DEBUG] Invalid NumMedia value: {num_media_str}, defaulting to 0")
+        logger.debug("Invalid NumMedia value: %s, defaulting to 0", num_media_str)
         num_media = 0
     
     # Method 2: Check for MediaUrl0 (most common)
@@ -560,31 +630,25 @@ def extract_media_from_twilio_request(request_form: Dict[str, Any]) -> Optional[
     # Method 4: Check MessageType
     message_type = request_form.get("MessageType", "").lower()
     
-    # Method 5: Check for any URL in any field (comprehensive search)
-    all_urls = []
-    for key, value in request_form.items():
-        if isinstance(value, str) and value.startswith("http"):
-            all_urls.append((key, value))
-            print(f"[DEBUG] Found URL in field '{key}': {value[:100]}...")
-    
     # Priority: Use MediaUrl0 if available, then DocumentUrl, then any URL found
     final_media_url = media_url or document_url
-    if not final_media_url and all_urls:
-        # Use first URL found
-        final_media_url = all_urls[0][1]
-        print(f"[DEBUG] Using URL from field '{all_urls[0][0]}'")
+    if not final_media_url:
+        # Method 5: First URL in any field (comprehensive search)
+        for key, value in request_form.items():
+            if isinstance(value, str) and value.startswith("http"):
+                final_media_url = value
+                logger.debug("Using URL from field '%s': %.100s...", key, value)
+                break
     
     final_content_type = media_content_type or document_content_type
     final_sid = media_sid or request_form.get("MessageSid")
     final_filename = document_filename or request_form.get("MediaFilename")
     
-    print(f"[DEBUG] Extraction Summary:")
-    print(f"[DEBUG]   NumMedia: {num_media}")
-    print(f"[DEBUG]   MessageType: {message_type}")
-    print(f"[DEBUG]   MediaUrl0: {media_url[:100] if media_url else 'None'}...")
-    print(f"[DEBUG]   DocumentUrl: {document_url[:100] if document_url else 'None'}...")
-    print(f"[DEBUG]   Final URL: {final_media_url[:100] if final_media_url else 'None'}...")
-    print(f"[DEBUG]   Content Type: {final_content_type}")
+    logger.debug(
+        "Extraction summary: NumMedia=%s MessageType=%s MediaUrl0=%.100s DocumentUrl=%.100s "
+        "final URL=%.100s content type=%s",
+        num_media, message_type, media_url, document_url, final_media_url, final_content_type,
+    )
     
     # If we found ANY URL, treat it as media (even if NumMedia=0)
     if final_media_url:
@@ -593,54 +657,57 @@ def extract_media_from_twilio_request(request_form: Dict[str, Any]) -> Optional[
             message_type == "document" or
             final_filename or
             (final_content_type and "pdf" in final_content_type.lower()) or
-            (final_media_url.lower().endswith('.pdf'))
+            (final_media_url[-4:].lower() == '.pdf')
         )
         
-        result = {
-            "num_media": num_media if num_media > 0 else 1,  # Set to 1 if we found URL but NumMedia=0
-            "media_url": final_media_url,
-            "media_content_type": final_content_type or _guess_content_type_from_url(final_media_url),
-            "media_sid": final_sid,
-            "message_type": "document" if is_document else "media",
-            "filename": final_filename,
-        }
-        print(f"[DEBUG] [OK] MEDIA DETECTED: {result}")
+        result = MediaInfo(
+            num_media=num_media if num_media > 0 else 1,  # Set to 1 if we found URL but NumMedia=0
+            media_url=final_media_url,
+            media_content_type=final_content_type or _guess_content_type_from_url(final_media_url),
+            media_sid=final_sid,
+            message_type="document" if is_document else "media",
+            filename=final_filename,
+        )
+        logger.debug("Media detected: %s", result)
         return result
     
     # If NumMedia > 0 but no URL found, that's an error
     if num_media > 0:
-        print(f"[WARN] NumMedia={num_media} but no MediaUrl0 found! Checking all MediaUrl fields...")
+        logger.warning("NumMedia=%s but no MediaUrl0 found! Checking all MediaUrl fields...", num_media)
         # Check MediaUrl1, MediaUrl2, etc. (for multiple media)
-        for i in range(num_media):
-            url_key = f"MediaUrl{i}"
-            if url_key in request_form:
-                media_url = request_form[url_key]
-                content_type = request_form.get(f"MediaContentType{i}")
-                print(f"[DEBUG] Found {url_key}: {media_url[:100]}...")
-                result = {
-                    "num_media": num_media,
-                    "media_url": media_url,
-                    "media_content_type": content_type,
-                    "media_sid": request_form.get(f"MediaSid{i}"),
-                    "message_type": "media",
-                }
-                print(f"[DEBUG] [OK] MEDIA DETECTED (from MediaUrl{i}): {result}")
+        for url_key, content_type_key, sid_key in _MEDIA_FIELDS[:num_media]:
+            media_url = request_form.get(url_key)
+            if media_url is not None:
+                logger.debug("Found %s: %.100s...", url_key, media_url)
+                result = MediaInfo(
+                    num_media=num_media,
+                    media_url=media_url,
+                    media_content_type=request_form.get(content_type_key),
+                    media_sid=request_form.get(sid_key),
+                    message_type="media",
+                )
+                logger.debug("Media detected (from %s): %s", url_key, result)
                 return result
     
-    print(f"[DEBUG] [ERROR] NO MEDIA DETECTED")
+    logger.debug("No media detected")
     return None
 
 
+# URL suffixes recognized by _guess_content_type_from_url
+_URL_SUFFIX_CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "gif": "image/gif",
+}
+
+
 def _guess_content_type_from_url(url: str) -> str:
     """Guess content type from URL extension."""
-    url_lower = url.lower()
-    if url_lower.endswith('.pdf'):
-        return "application/pdf"
-    elif url_lower.endswith(('.jpg', '.jpeg')):
-        return "image/jpeg"
-    elif url_lower.endswith('.png'):
-        return "image/png"
-    elif url_lower.endswith('.gif'):
-        return "image/gif"
-    return "application/octet-stream"
+    # Only the last 5 chars can hold a known suffix (".jpeg"); lowercase just those
+    _, dot, suffix = url[-5:].rpartition(".")
+    if not dot:
+        return "application/octet-stream"
+    return _URL_SUFFIX_CONTENT_TYPES.get(suffix.lower(), "application/octet-stream")
 
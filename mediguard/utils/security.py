@@ -3,17 +3,90 @@ Security Utilities Module
 Handles anonymization, secure logging, and data protection.
 """
 
+import atexit
+import functools
 import hashlib
-import json
 import os
-import sqlite3
-from datetime import datetime, timedelta
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, Optional, Tuple
 
+import orjson
+
+from mediguard.utils.db import get_connection
+
+# Log rows are queued in memory and written in one transaction per batch
+LOG_FLUSH_INTERVAL = 0.25  # seconds
+LOG_FLUSH_ROWS = 500
+# Rows kept per queue while the database is failing; the oldest are dropped
+LOG_MAX_PENDING = 50000
+
+# Event data fields that carry no PHI and may be logged
+_NON_PHI_FIELDS = frozenset({
+    "prediction",
+    "confidence",
+    "severity",
+    "event_type",
+    "timestamp",
+    "num_biomarkers",
+    "num_warnings",
+    "model_version",
+    "biomarker_count",
+    "warning_count",
+})
+
+# Non-PHI fields stored in their own mediguard_logs columns; any other allowed
+# field spills over into the event_data JSON
+_LOG_COLUMNS = (
+    ("prediction", "TEXT"),
+    ("confidence", "REAL"),
+    ("severity", "TEXT"),
+    ("num_biomarkers", "INTEGER"),
+    ("num_warnings", "INTEGER"),
+    ("model_version", "TEXT"),
+)
+_LOG_COLUMN_NAMES = tuple(name for name, _ in _LOG_COLUMNS)
+_INSERT_LOG_SQL = (
+    "INSERT INTO mediguard_logs (session_id, event_type, "
+    + ", ".join(_LOG_COLUMN_NAMES)
+    + ", event_data, created_at, retention_until) VALUES ("
+    + ", ".join("?" * (len(_LOG_COLUMNS) + 5))
+    + ")"
+)
+
+
+# (epoch second, its "YYYY-MM-DDTHH:MM:SS" text), reformatted once per second
+_iso_second: Tuple[int, str] = (0, "")
+
+
+def utcnow_iso() -> str:
+    """
+    Current UTC time as an ISO 8601 string with microseconds.
+
+    Same format as datetime.utcnow().isoformat(), but only the fractional
+    part is formatted on each call; the date and time are reused until the
+    second changes.
+
+    Returns:
+        Timestamp such as "2024-05-01T12:34:56.789012"
+    """
+    global _iso_second
+    sec, usec = divmod(time.time_ns() // 1000, 1_000_000)
+    cached = _iso_second
+    if cached[0] != sec:
+        cached = _iso_second = (
+            sec,
+            datetime.fromtimestamp(sec, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"),
+        )
+    return f"{cached[1]}.{usec:06d}"
+
 
 def anonymize_user_id(user_id: str, salt: Optional[str] = None) -> str:
     """
-    Anonymize user ID (phone number) using SHA-256 hashing.
+    Anonymize user ID (phone number) using keyed BLAKE2b hashing.
 
     Args:
         user_id: Original user identifier (WhatsApp phone number)
@@ -25,9 +98,18 @@ def anonymize_user_id(user_id: str, salt: Optional[str] = None) -> str:
     if salt is None:
         salt = os.getenv("ANONYMIZATION_SALT", "mediguard_default_salt_2024")
 
-    combined = f"{salt}:{user_id}"
-    hash_obj = hashlib.sha256(combined.encode("utf-8"))
-    return hash_obj.hexdigest()[:16]  # First 16 chars for brevity
+    return _hash_user_id(user_id, salt)
+
+
+@functools.lru_cache(maxsize=4096)
+def _hash_user_id(user_id: str, salt: str) -> str:
+    """BLAKE2b of a user ID keyed with the salt, cached since every message hashes its sender again."""
+    key = salt.encode("utf-8")
+    if len(key) > hashlib.blake2b.MAX_KEY_SIZE:
+        key = hashlib.blake2b(key).digest()
+    # 8-byte digest keeps the 16 hex chars used for session IDs
+    hash_obj = hashlib.blake2b(user_id.encode("utf-8"), digest_size=8, key=key)
+    return hash_obj.hexdigest()
 
 
 class SecureLogger:
@@ -37,6 +119,11 @@ class SecureLogger:
     - Removes PHI (Protected Health Information)
     - Implements data retention policies
     - Encrypts sensitive data at rest
+
+    Log and audit rows are buffered and written by a background thread every
+    LOG_FLUSH_INTERVAL seconds (or as soon as LOG_FLUSH_ROWS are pending),
+    so a request never waits on a database commit. Call flush() when rows
+    must be on disk before continuing.
     """
 
     def __init__(self, db_path: str):
@@ -47,11 +134,18 @@ class SecureLogger:
             db_path: Path to SQLite database
         """
         self.db_path = db_path
+        self._log_rows: deque = deque()
+        self._audit_rows: deque = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher_pid: Optional[int] = None
         self._init_db()
+        atexit.register(self.flush)
 
     def _init_db(self) -> None:
         """Initialize secure logging tables."""
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         cur = conn.cursor()
 
         # Main logging table (anonymized)
@@ -63,11 +157,32 @@ class SecureLogger:
                 event_type TEXT NOT NULL,
                 event_data TEXT,
                 created_at TEXT NOT NULL,
-                retention_until TEXT NOT NULL
+                retention_until TEXT NOT NULL,
+                prediction TEXT,
+                confidence REAL,
+                severity TEXT,
+                num_biomarkers INTEGER,
+                num_warnings INTEGER,
+                model_version TEXT
             )
             """
         )
 
+        # Databases created before the structured columns existed
+        existing = {row[1] for row in cur.execute("PRAGMA table_info(mediguard_logs)")}
+        for name, sql_type in _LOG_COLUMNS:
+            if name not in existing:
+                cur.execute(f"ALTER TABLE mediguard_logs ADD COLUMN {name} {sql_type}")
+
+        # ISO timestamps sort lexicographically, so cleanup's range delete
+        # only visits expired rows
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_mediguard_logs_retention
+            ON mediguard_logs (retention_until)
+            """
+        )
+
         # Audit trail (high-level only, no PHI)
         cur.execute(
             """
@@ -81,9 +196,6 @@ class SecureLogger:
             """
         )
 
-        conn.commit()
-        conn.close()
-
     def log_event(
         self,
         user_id: str,
@@ -103,25 +215,17 @@ class SecureLogger:
         session_id = anonymize_user_id(user_id)
         sanitized_data = self._remove_phi(event_data)
 
-        now = datetime.utcnow()
-        retention_until = now + timedelta(days=retention_days)
+        columns = tuple(sanitized_data.pop(name, None) for name in _LOG_COLUMN_NAMES)
+        retention_until = datetime.utcnow() + timedelta(days=retention_days)
 
-        conn = sqlite3.connect(self.db_path)
-        conn.execute(
-            """
-            INSERT INTO mediguard_logs (session_id, event_type, event_data, created_at, retention_until)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (
-                session_id,
-                event_type,
-                json.dumps(sanitized_data),
-                now.isoformat(),
-                retention_until.isoformat(),
-            ),
-        )
-        conn.commit()
-        conn.close()
+        self._enqueue(False, (
+            session_id,
+            event_type,
+            *columns,
+            orjson.dumps(sanitized_data).decode() if sanitized_data else None,
+            utcnow_iso(),
+            retention_until.isoformat(),
+        ))
 
     def audit(
         self,
@@ -139,21 +243,83 @@ class SecureLogger:
         """
         session_id = anonymize_user_id(user_id) if user_id else None
 
-        conn = sqlite3.connect(self.db_path)
-        conn.execute(
-            """
-            INSERT INTO mediguard_audit (action, session_id, timestamp, metadata)
-            VALUES (?, ?, ?, ?)
-            """,
-            (
-                action,
-                session_id,
-                datetime.utcnow().isoformat(),
-                json.dumps(metadata) if metadata else None,
-            ),
-        )
-        conn.commit()
-        conn.close()
+        self._enqueue(True, (
+            action,
+            session_id,
+            utcnow_iso(),
+            orjson.dumps(metadata).decode() if metadata else None,
+        ))
+
+    def _enqueue(self, audit: bool, row: Tuple[Any, ...]) -> None:
+        """Queue a log (or audit) row for the background flusher, starting it if needed."""
+        with self._lock:
+            # Look the queue up under the lock: flush() swaps it out
+            (self._audit_rows if audit else self._log_rows).append(row)
+            pending = len(self._log_rows) + len(self._audit_rows)
+            # Threads don't survive fork(), so (re)start the flusher in
+            # whichever process is logging
+            if self._flusher_pid != os.getpid():
+                self._flusher_pid = os.getpid()
+                threading.Thread(
+                    target=self._flush_loop, name="secure-logger-flush", daemon=True
+                ).start()
+
+        if pending >= LOG_FLUSH_ROWS:
+            self._wakeup.set()
+
+    def _flush_loop(self) -> None:
+        """Background thread: flush queued rows periodically."""
+        while True:
+            self._wakeup.wait(LOG_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[WARN] Failed to write secure log batch: {e}")
+
+    def flush(self) -> None:
+        """Write all queued log and audit rows in a single transaction."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._log_rows and not self._audit_rows:
+                    return
+                log_rows, self._log_rows = self._log_rows, deque()
+                audit_rows, self._audit_rows = self._audit_rows, deque()
+
+            try:
+                conn = get_connection(self.db_path)
+                conn.execute("BEGIN")
+                try:
+                    if log_rows:
+                        conn.executemany(_INSERT_LOG_SQL, log_rows)
+                    if audit_rows:
+                        conn.executemany(
+                            """
+                            INSERT INTO mediguard_audit (action, session_id, timestamp, metadata)
+                            VALUES (?, ?, ?, ?)
+                            """,
+                            audit_rows,
+                        )
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            except BaseException:
+                self._requeue(log_rows, audit_rows)
+                raise
+
+    def _requeue(self, log_rows: deque, audit_rows: deque) -> None:
+        """Put a batch that failed to write back ahead of rows queued since."""
+        with self._lock:
+            log_rows.extend(self._log_rows)
+            audit_rows.extend(self._audit_rows)
+            for name, rows in (("log", log_rows), ("audit", audit_rows)):
+                excess = len(rows) - LOG_MAX_PENDING
+                if excess > 0:
+                    for _ in range(excess):
+                        rows.popleft()
+                    print(f"[WARN] Secure log backlog full: dropped {excess} oldest {name} rows")
+            self._log_rows, self._audit_rows = log_rows, audit_rows
 
     def cleanup_expired_logs(self) -> int:
         """
@@ -162,16 +328,15 @@ class SecureLogger:
         Returns:
             Number of logs deleted
         """
-        now = datetime.utcnow().isoformat()
+        now = utcnow_iso()
 
-        conn = sqlite3.connect(self.db_path)
+        self.flush()
+        conn = get_connection(self.db_path)
         cur = conn.execute(
             "DELETE FROM mediguard_logs WHERE retention_until < ?",
             (now,)
         )
         deleted_count = cur.rowcount
-        conn.commit()
-        conn.close()
 
         return deleted_count
 
@@ -183,30 +348,26 @@ class SecureLogger:
         - Direct identifiers (names, phone numbers, addresses)
         - Keeps only aggregated/statistical data
         """
-        sanitized = {}
-
-        # Allowed non-PHI fields
-        allowed_fields = {
-            "prediction",
-            "confidence",
-            "severity",
-            "event_type",
-            "timestamp",
-            "num_biomarkers",
-            "num_warnings",
-            "model_version",
-        }
-
-        for key, value in data.items():
-            if key in allowed_fields:
-                sanitized[key] = value
-            elif key == "biomarker_count":
-                sanitized[key] = value
-            elif key == "warning_count":
-                sanitized[key] = value
-            # Skip raw biomarker values and other PHI
-
-        return sanitized
+        # Raw biomarker values and other PHI are dropped
+        return {key: data[key] for key in data.keys() & _NON_PHI_FIELDS}
+
+
+# SQL/script injection patterns, matched case-insensitively in a single pass
+_SUSPICIOUS_PATTERNS = (
+    "'; DROP TABLE",
+    "'; DELETE FROM",
+    "UNION SELECT",
+    "'; INSERT INTO",
+    "<script",
+    "javascript:",
+    "onerror=",
+)
+# One group per pattern, so a match names its pattern via lastindex even
+# when IGNORECASE matched a Unicode case variant (e.g. "UNİON")
+_SUSPICIOUS_RE = re.compile(
+    "|".join(f"({re.escape(pattern)})" for pattern in _SUSPICIOUS_PATTERNS),
+    re.IGNORECASE,
+)
 
 
 def validate_input_security(user_input: str) -> Tuple[bool, Optional[str]]:
@@ -229,21 +390,10 @@ def validate_input_security(user_input: str) -> Tuple[bool, Optional[str]]:
     if len(user_input) > 10000:
         return False, "Input too long (max 10000 characters)"
 
-    # SQL injection patterns
-    sql_patterns = [
-        "'; DROP TABLE",
-        "'; DELETE FROM",
-        "UNION SELECT",
-        "'; INSERT INTO",
-        "<script",
-        "javascript:",
-        "onerror=",
-    ]
-
-    user_input_upper = user_input.upper()
-    for pattern in sql_patterns:
-        if pattern.upper() in user_input_upper:
-            return False, f"Suspicious pattern detected: {pattern}"
+    match = _SUSPICIOUS_RE.search(user_input)
+    if match:
+        pattern = _SUSPICIOUS_PATTERNS[match.lastindex - 1]
+        return False, f"Suspicious pattern detected: {pattern}"
 
     return True, None
 
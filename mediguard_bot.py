@@ -4,17 +4,19 @@ Clinical triage and prediction system via WhatsApp.
 """
 
 import os
-import json
 import threading
 import re
 import sqlite3
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional, Tuple
 from pathlib import Path
+from xml.sax.saxutils import escape as xml_escape
 
+import orjson
 from dotenv import load_dotenv
-from flask import Flask, request
-from twilio.twiml.messaging_response import MessagingResponse
+from flask import Flask, abort, request
 from twilio.rest import Client
 
 from mediguard.models.scaler import BiomarkerScaler
@@ -23,7 +25,8 @@ from mediguard.parsers.input_parser import BiomarkerInputParser
 from mediguard.parsers.lab_report_ocr import LabReportOCR
 from mediguard.parsers.biomarker_extractor import BiomarkerExtractor
 from mediguard.knowledge.rag_engine import MedicalRAGEngine
-from mediguard.utils.security import SecureLogger, validate_input_security, anonymize_user_id
+from mediguard.utils.security import SecureLogger, validate_input_security, anonymize_user_id, utcnow_iso
+from mediguard.utils.db import get_connection
 from mediguard.utils.formatters import (
     format_prediction_response,
     format_biomarker_summary,
@@ -31,7 +34,8 @@ from mediguard.utils.formatters import (
     format_template_message,
     chunk_message,
 )
-from mediguard.utils.media_handler import MediaHandler, extract_media_from_twilio_request
+from mediguard.utils.media_handler import MediaHandler, MediaInfo, extract_media_from_twilio_request
+from mediguard.utils.json_provider import OrjsonProvider
 
 
 # ---------------------------
@@ -42,6 +46,17 @@ load_dotenv()
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "mediguard.db")
 
+# Session payloads are stored as orjson bytes (BLOB); rows written earlier as
+# JSON text load the same way
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+# URLs shared in chat: direct PDF/image links and Google Drive file links
+FILE_URL_RE = re.compile(r'https?://[^\s]+\.(pdf|jpg|jpeg|png|gif|bmp)(\?[^\s]*)?', re.IGNORECASE)
+GOOGLE_DRIVE_FILE_RE = re.compile(r'https?://drive\.google\.com/file/d/([a-zA-Z0-9_-]+)', re.IGNORECASE)
+
+# Verbose [DEBUG] request/response tracing (includes message content)
+_DEBUG = os.getenv("MEDIGUARD_DEBUG") == "1"
+
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TWILIO_WHATSAPP_FROM = os.getenv("TWILIO_WHATSAPP_FROM")
@@ -58,7 +73,34 @@ if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN:
 
 twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
+# Text replies are computed and sent off the request thread (threads start on
+# first submit, so creating this before gunicorn forks is safe)
+_reply_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("REPLY_WORKERS", "8")), thread_name_prefix="reply"
+)
+
+# Pending (body, bot number) messages per user. A user has an entry only
+# while a worker is draining it, so their replies are built and sent one at
+# a time, in arrival order
+_pending_replies: Dict[str, Deque[Tuple[str, str]]] = {}
+_pending_replies_lock = threading.Lock()
+# Messages a user can have waiting; further ones are dropped until they drain
+MAX_PENDING_REPLIES = int(os.getenv("MAX_PENDING_REPLIES", "10"))
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Twilio webhooks carry media URLs, never file bytes. The cap leaves room for
+# a maximum-length Body (1600 characters at up to 9 percent-encoded bytes
+# each, e.g. emoji) plus the other form fields
+WEBHOOK_MAX_CONTENT_LENGTH = 64 * 1024
+
+
+@app.before_request
+def limit_webhook_size():
+    """Refuse oversized /whatsapp posts with a 413 before the form is parsed."""
+    if request.path == "/whatsapp" and (request.content_length or 0) > WEBHOOK_MAX_CONTENT_LENGTH:
+        abort(413)
 
 # Initialize MediGuard components
 scaler = BiomarkerScaler()
@@ -75,15 +117,19 @@ biomarker_extractor = BiomarkerExtractor(use_llm=True)
 # Database Helpers
 # ---------------------------
 
+_DB_INITIALIZED = False
+
 def get_db_connection() -> sqlite3.Connection:
-    """Get database connection."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get this thread's (cached, WAL-mode) database connection."""
+    return get_connection(DB_PATH)
 
 
 def init_db() -> None:
-    """Initialize database tables."""
+    """Initialize database tables (once per process)."""
+    global _DB_INITIALIZED
+    if _DB_INITIALIZED:
+        return
+
     conn = get_db_connection()
     cur = conn.cursor()
 
@@ -101,11 +147,9 @@ def init_db() -> None:
         """
     )
 
-    conn.commit()
-    conn.close()
-
     # Initialize secure logging tables
     secure_logger._init_db()
+    _DB_INITIALIZED = True
 
 
 def get_session(user_id: str) -> sqlite3.Row:
@@ -115,41 +159,115 @@ def get_session(user_id: str) -> sqlite3.Row:
     row = cur.fetchone()
 
     if row is None:
-        conn.execute(
-            "INSERT INTO sessions (user_id, updated_at) VALUES (?, ?)",
-            (user_id, datetime.utcnow().isoformat()),
-        )
-        conn.commit()
-        cur = conn.execute("SELECT * FROM sessions WHERE user_id=?", (user_id,))
-        row = cur.fetchone()
+        # Create and read back in one statement; the no-op update on conflict
+        # makes RETURNING yield the row if another thread created it first.
+        # fetchall() runs the statement to completion so it commits now.
+        (row,) = conn.execute(
+            "INSERT INTO sessions (user_id, updated_at) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET user_id=excluded.user_id "
+            "RETURNING *",
+            (user_id, utcnow_iso()),
+        ).fetchall()
 
-    conn.close()
     assert row is not None
     return row
 
 
+# Mutable session columns. update_session() always runs the same UPDATE text,
+# so sqlite3's statement cache reuses one prepared statement; each column is
+# paired with a flag saying whether to overwrite it (NULL is a valid value).
+_SESSION_COLUMNS = (
+    "mode",
+    "last_prediction",
+    "last_references",
+    "pending_confirmation",
+    "pending_values",
+)
+_UPDATE_SESSION_SQL = (
+    "UPDATE sessions SET "
+    + ", ".join(f"{col}=CASE WHEN ? THEN ? ELSE {col} END" for col in _SESSION_COLUMNS)
+    + ", updated_at=? WHERE user_id=?"
+)
+
+
 def update_session(user_id: str, **kwargs: Any) -> None:
     """Update session data."""
     if not kwargs:
         return
 
-    columns = ", ".join([f"{k}=?" for k in kwargs.keys()])
-    values = list(kwargs.values())
-    values.extend([datetime.utcnow().isoformat(), user_id])
+    unknown = kwargs.keys() - set(_SESSION_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown session column(s): {', '.join(sorted(unknown))}")
+
+    values: List[Any] = []
+    for col in _SESSION_COLUMNS:
+        values.append(col in kwargs)
+        values.append(kwargs.get(col))
+    values.extend([utcnow_iso(), user_id])
 
     conn = get_db_connection()
-    conn.execute(
-        f"UPDATE sessions SET {columns}, updated_at=? WHERE user_id=?",
-        values,
-    )
-    conn.commit()
-    conn.close()
+    conn.execute(_UPDATE_SESSION_SQL, values)
+
+
+# Create tables at import so request handlers never touch the schema
+init_db()
 
 
 # ---------------------------
 # Bot Logic
 # ---------------------------
 
+# Chat commands: (handler name, handler(user_id, text_lower), reply if it fails)
+_START_COMMAND = (
+    "handle_start",
+    lambda user_id, text: handle_start(),
+    "Welcome to MediGuard AI! Type 'help' for instructions.",
+)
+_HELP_COMMAND = (
+    "format_help_message",
+    lambda user_id, text: format_help_message(),
+    "MediGuard AI - Clinical Triage Assistant\n\n"
+    "Send blood test values in JSON, key=value, or CSV format.\n"
+    "Type 'template' for an example.",
+)
+_TEMPLATE_COMMAND = (
+    "handle_template_request",
+    lambda user_id, text: handle_template_request(text),
+    "JSON Template:\n"
+    '{"hemoglobin": 14.5, "wbc_count": 7.2, ...}\n\n'
+    "Type 'help' for more formats.",
+)
+_RESET_COMMAND = (
+    "handle_reset",
+    lambda user_id, text: handle_reset(user_id),
+    "Session reset. You can start fresh now.",
+)
+_EXPLAIN_COMMAND = (
+    "handle_explain_more",
+    lambda user_id, text: handle_explain_more(user_id),
+    "No previous prediction found. Send your lab results first.",
+)
+_SOURCES_COMMAND = (
+    "handle_show_sources",
+    lambda user_id, text: handle_show_sources(user_id),
+    "No references available. Send your lab results first.",
+)
+
+# Exact (lowercased) messages, looked up in one dict probe
+_COMMANDS = {
+    **dict.fromkeys(("/start", "start", "hello", "hi"), _START_COMMAND),
+    **dict.fromkeys(("help", "/help"), _HELP_COMMAND),
+    **dict.fromkeys(("template", "get template", "show template"), _TEMPLATE_COMMAND),
+    **dict.fromkeys(("reset", "/reset", "clear"), _RESET_COMMAND),
+}
+
+# Keywords matched anywhere in the message, in priority order
+_KEYWORD_COMMANDS = (
+    ("explain more", _EXPLAIN_COMMAND),
+    ("show sources", _SOURCES_COMMAND),
+    ("references", _SOURCES_COMMAND),
+)
+
 def handle_message(user_id: str, text: str) -> str:
     """
     Robust message handler for MediGuard bot with comprehensive error handling.
@@ -176,13 +294,8 @@ def handle_message(user_id: str, text: str) -> str:
         if not isinstance(text, str):
             text = str(text)
         
-        # Sanitize: limit input size to prevent memory issues (max 50KB)
-        MAX_INPUT_SIZE = 50 * 1024  # 50KB
-        if len(text) > MAX_INPUT_SIZE:
-            text = text[:MAX_INPUT_SIZE]
-            print(f"[WARN] Input truncated to {MAX_INPUT_SIZE} chars for user {user_id}")
-        
-        # Security validation
+        # Security validation (rejects over-long input on its length alone,
+        # before any pattern scan, so it never reaches the parsers)
         is_valid, error_msg = validate_input_security(text)
         if not is_valid:
             secure_logger.audit("security_violation", user_id, {"reason": error_msg})
@@ -191,14 +304,14 @@ def handle_message(user_id: str, text: str) -> str:
         # Normalize text
         text_original = text
         text = text.strip()
-        text_lower = text.lower().strip()
+        text_lower = text.lower()
         
         # Log incoming message (with error handling)
         try:
             secure_logger.log_event(
                 user_id,
                 "message_received",
-                {"event_type": "user_message", "timestamp": datetime.utcnow().isoformat()},
+                {"event_type": "user_message", "timestamp": utcnow_iso()},
             )
         except Exception as log_err:
             print(f"[WARN] Failed to log message event: {str(log_err)}")
@@ -215,59 +328,23 @@ def handle_message(user_id: str, text: str) -> str:
     # ============================================================
     try:
         # Handle empty/whitespace-only messages
-        if not text or len(text.strip()) == 0:
+        if not text:
             return "I received an empty message. Type 'help' for instructions."
         
         # Commands (each wrapped in try-catch for robustness)
-        if text_lower in ["/start", "start", "hello", "hi"]:
-            try:
-                return handle_start()
-            except Exception as e:
-                print(f"[ERROR] Error in handle_start: {str(e)}")
-                return "Welcome to MediGuard AI! Type 'help' for instructions."
-
-        if text_lower in ["help", "/help"]:
-            try:
-                return format_help_message()
-            except Exception as e:
-                print(f"[ERROR] Error in format_help_message: {str(e)}")
-                return (
-                    "MediGuard AI - Clinical Triage Assistant\n\n"
-                    "Send blood test values in JSON, key=value, or CSV format.\n"
-                    "Type 'template' for an example."
-                )
-
-        if text_lower in ["template", "get template", "show template"]:
-            try:
-                return handle_template_request(text_lower)
-            except Exception as e:
-                print(f"[ERROR] Error in handle_template_request: {str(e)}")
-                return (
-                    "JSON Template:\n"
-                    '{"hemoglobin": 14.5, "wbc_count": 7.2, ...}\n\n'
-                    "Type 'help' for more formats."
-                )
-
-        if text_lower in ["reset", "/reset", "clear"]:
-            try:
-                return handle_reset(user_id)
-            except Exception as e:
-                print(f"[ERROR] Error in handle_reset: {str(e)}")
-                return "Session reset. You can start fresh now."
-
-        if "explain more" in text_lower:
-            try:
-                return handle_explain_more(user_id)
-            except Exception as e:
-                print(f"[ERROR] Error in handle_explain_more: {str(e)}")
-                return "No previous prediction found. Send your lab results first."
-
-        if "show sources" in text_lower or "references" in text_lower:
+        command = _COMMANDS.get(text_lower)
+        if command is None:
+            command = next(
+                (cmd for keyword, cmd in _KEYWORD_COMMANDS if keyword in text_lower),
+                None,
+            )
+        if command is not None:
+            name, handler, fallback = command
             try:
-                return handle_show_sources(user_id)
+                return handler(user_id, text_lower)
             except Exception as e:
-                print(f"[ERROR] Error in handle_show_sources: {str(e)}")
-                return "No references available. Send your lab results first."
+                print(f"[ERROR] Error in {name}: {str(e)}")
+                return fallback
     
     except Exception as e:
         print(f"[ERROR] Command processing error: {str(e)}")
@@ -279,12 +356,14 @@ def handle_message(user_id: str, text: str) -> str:
     # Layer 3: Biomarker Input Parsing (JSON/key-value/CSV)
     # ============================================================
     try:
-        print(f"[DEBUG] Attempting to parse biomarker input...")
+        if _DEBUG:
+            print(f"[DEBUG] Attempting to parse biomarker input...")
         parsed_values, parse_errors = parser.parse(text)
         
         if parsed_values is not None:
             # Successfully parsed biomarker values
-            print(f"[DEBUG] Successfully parsed biomarker input: {len(parsed_values)} values")
+            if _DEBUG:
+                print(f"[DEBUG] Successfully parsed biomarker input: {len(parsed_values)} values")
             try:
                 return handle_prediction_request(user_id, parsed_values)
             except Exception as e:
@@ -297,7 +376,8 @@ def handle_message(user_id: str, text: str) -> str:
                     "Type 'help' for instructions or 'template' for an example."
                 )
         else:
-            print(f"[DEBUG] Biomarker parsing failed: {parse_errors}")
+            if _DEBUG:
+                print(f"[DEBUG] Biomarker parsing failed: {parse_errors}")
     
     except Exception as e:
         print(f"[ERROR] Biomarker parsing error: {str(e)}")
@@ -312,20 +392,19 @@ def handle_message(user_id: str, text: str) -> str:
         # Only check for URLs if message contains URL-like patterns
         if "http://" in text or "https://" in text or "drive.google.com" in text:
             # Check for direct file URLs (PDF/image)
-            url_pattern = r'https?://[^\s]+\.(pdf|jpg|jpeg|png|gif|bmp)(\?[^\s]*)?'
-            url_match = re.search(url_pattern, text, re.IGNORECASE)
+            url_match = FILE_URL_RE.search(text)
             if url_match:
                 url = url_match.group(0).split('?')[0]  # Remove query params
                 print(f"[INFO] Detected file URL in message: {url[:100]}...")
                 try:
-                    fake_media_info = {
-                        "num_media": 1,
-                        "media_url": url,
-                        "media_content_type": "application/pdf" if url.lower().endswith('.pdf') else "image/jpeg",
-                        "media_sid": None,
-                        "message_type": "url",
-                        "filename": url.split('/')[-1].split('?')[0],
-                    }
+                    fake_media_info = MediaInfo(
+                        num_media=1,
+                        media_url=url,
+                        media_content_type="application/pdf" if url.lower().endswith('.pdf') else "image/jpeg",
+                        media_sid=None,
+                        message_type="url",
+                        filename=url.split('/')[-1].split('?')[0],
+                    )
                     return handle_media_upload(user_id, fake_media_info, {})
                 except Exception as e:
                     print(f"[ERROR] Error processing file URL: {str(e)}")
@@ -335,11 +414,10 @@ def handle_message(user_id: str, text: str) -> str:
                     )
             
             # Check for Google Drive URLs
-            google_drive_pattern = r'https?://drive\.google\.com/file/d/([a-zA-Z0-9_-]+)'
-            gd_match = re.search(google_drive_pattern, text, re.IGNORECASE)
+            gd_match = GOOGLE_DRIVE_FILE_RE.search(text)
             if gd_match:
                 file_id = gd_match.group(1)
-                original_url = text.strip()
+                original_url = text
                 print(f"[INFO] ========== GOOGLE DRIVE URL DETECTED ==========")
                 print(f"[INFO] Original URL: {original_url}")
                 print(f"[INFO] Extracted File ID: {file_id}")
@@ -348,14 +426,14 @@ def handle_message(user_id: str, text: str) -> str:
                 # This avoids double conversion issues
                 print(f"[INFO] Passing original URL to download handler (will convert internally)...")
                 try:
-                    fake_media_info = {
-                        "num_media": 1,
-                        "media_url": original_url,  # Pass original URL, let download_media convert it
-                        "media_content_type": "application/pdf",
-                        "media_sid": None,
-                        "message_type": "url",
-                        "filename": "lab_report.pdf",
-                    }
+                    fake_media_info = MediaInfo(
+                        num_media=1,
+                        media_url=original_url,  # Pass original URL, let download_media convert it
+                        media_content_type="application/pdf",
+                        media_sid=None,
+                        message_type="url",
+                        filename="lab_report.pdf",
+                    )
                     print(f"[INFO] Calling handle_media_upload with Google Drive URL...")
                     return handle_media_upload(user_id, fake_media_info, {})
                 except Exception as e:
@@ -378,7 +456,7 @@ def handle_message(user_id: str, text: str) -> str:
     # ============================================================
     try:
         # Only process as query if message is substantial (more than 10 chars)
-        if len(text.strip()) > 10:
+        if len(text) > 10:
             try:
                 return handle_query(text)
             except Exception as e:
@@ -465,21 +543,8 @@ def _fill_missing_biomarkers(biomarker_values: Dict[str, float]) -> Dict[str, fl
     Returns:
         Complete dictionary with all 24 biomarkers
     """
-    import json
-    import os
-    
-    # Load biomarker config for default values
-    biomarker_config_path = os.path.join(
-        os.path.dirname(__file__),
-        "mediguard",
-        "data",
-        "biomarkers.json"
-    )
-    
-    with open(biomarker_config_path, "r") as f:
-        config = json.load(f)
-    
-    biomarkers_config = {b["id"]: b for b in config["biomarkers"]}
+    # Biomarker config parsed once at startup by the scaler
+    biomarkers_config = scaler.biomarkers
     complete = biomarker_values.copy()
     
     # Fill missing with normal range midpoints
@@ -497,6 +562,18 @@ def _fill_missing_biomarkers(biomarker_values: Dict[str, float]) -> Dict[str, fl
     return complete
 
 
+@lru_cache(maxsize=None)
+def _category_references(category: str) -> Tuple[List[Dict[str, str]], bytes]:
+    """
+    References for a predicted category, with their serialized session form.
+
+    The knowledge base is static, so both are built once per category
+    (there are only a handful) and shared read-only by every request.
+    """
+    references = rag_engine.retrieve_references(category, max_results=3)
+    return references, orjson.dumps(references, option=_ORJSON_OPTIONS)
+
+
 def handle_prediction_request(user_id: str, biomarker_values: Dict[str, float]) -> str:
     """
     Handle prediction request with parsed biomarker values.
@@ -509,37 +586,42 @@ def handle_prediction_request(user_id: str, biomarker_values: Dict[str, float])
         Formatted prediction response
     """
     try:
-        print(f"[DEBUG] handle_prediction_request: Starting with {len(biomarker_values)} biomarkers")
+        if _DEBUG:
+            print(f"[DEBUG] handle_prediction_request: Starting with {len(biomarker_values)} biomarkers")
         
         # Scale biomarkers
-        print(f"[DEBUG] Scaling biomarkers...")
+        if _DEBUG:
+            print(f"[DEBUG] Scaling biomarkers...")
         scaling_result = scaler.scale_all(biomarker_values)
         scaled_values = scaling_result["scaled_values"]
         warnings = scaling_result["warnings"]
         raw_summary = scaling_result["raw_summary"]
-        print(f"[DEBUG] Scaling complete. Warnings: {len(warnings)}")
+        if _DEBUG:
+            print(f"[DEBUG] Scaling complete. Warnings: {len(warnings)}")
 
         # Make prediction
-        print(f"[DEBUG] Making prediction...")
+        if _DEBUG:
+            print(f"[DEBUG] Making prediction...")
         prediction_result = predictor.predict(scaled_values, biomarker_values)
-        print(f"[DEBUG] Prediction complete: {prediction_result.get('prediction_name', 'Unknown')}")
-        print(f"[DEBUG] Prediction confidence: {prediction_result.get('confidence', 0)*100:.1f}%")
+        if _DEBUG:
+            print(f"[DEBUG] Prediction complete: {prediction_result.get('prediction_name', 'Unknown')}")
+            print(f"[DEBUG] Prediction confidence: {prediction_result.get('confidence', 0)*100:.1f}%")
 
         # Retrieve medical references
-        print(f"[DEBUG] Retrieving medical references...")
-        references = rag_engine.retrieve_references(
-            prediction_result["prediction"],
-            max_results=3
-        )
-        print(f"[DEBUG] Retrieved {len(references)} references")
+        if _DEBUG:
+            print(f"[DEBUG] Retrieving medical references...")
+        references, references_json = _category_references(prediction_result["prediction"])
+        if _DEBUG:
+            print(f"[DEBUG] Retrieved {len(references)} references")
 
         # Store in session for follow-up queries
-        print(f"[DEBUG] Storing in session...")
+        if _DEBUG:
+            print(f"[DEBUG] Storing in session...")
         update_session(
             user_id,
             mode="reviewed",
-            last_prediction=json.dumps(prediction_result),
-            last_references=json.dumps(references),
+            last_prediction=orjson.dumps(prediction_result, option=_ORJSON_OPTIONS),
+            last_references=references_json,
         )
 
         # Log prediction (anonymized, no PHI)
@@ -556,14 +638,16 @@ def handle_prediction_request(user_id: str, biomarker_values: Dict[str, float])
         )
 
         # Format response
-        print(f"[DEBUG] Formatting response...")
+        if _DEBUG:
+            print(f"[DEBUG] Formatting response...")
         response = format_prediction_response(
             prediction_result,
             warnings,
             references
         )
-        print(f"[DEBUG] Response formatted. Length: {len(response)} characters")
-        print(f"[DEBUG] First 300 chars: {response[:300]}...")
+        if _DEBUG:
+            print(f"[DEBUG] Response formatted. Length: {len(response)} characters")
+            print(f"[DEBUG] First 300 chars: {response[:300]}...")
 
         if not response or len(response.strip()) == 0:
             print(f"[ERROR] format_prediction_response returned empty string!")
@@ -587,7 +671,7 @@ def handle_explain_more(user_id: str) -> str:
         return "No recent prediction to explain. Please submit biomarker values first."
 
     try:
-        prediction_result = json.loads(sess["last_prediction"])
+        prediction_result = orjson.loads(sess["last_prediction"])
 
         explanation = f"*🔍 Detailed Analysis*\n\n"
         explanation += f"*Prediction:* {prediction_result['prediction_name']}\n"
@@ -627,7 +711,7 @@ def handle_show_sources(user_id: str) -> str:
         return "No references available. Please submit biomarker values first."
 
     try:
-        references = json.loads(sess["last_references"])
+        references = orjson.loads(sess["last_references"])
         return rag_engine.format_references(references)
 
     except Exception as e:
@@ -663,18 +747,20 @@ def handle_query(query_text: str) -> str:
         return f"Error processing query: {str(e)}"
 
 
-def process_media_background(user_id: str, media_info: Dict[str, Any], request_form: Dict[str, Any]):
+def process_media_background(user_id: str, media_info: MediaInfo, request_form: Dict[str, Any]):
     """
     Background task to process media and send results via Twilio API.
     """
-    print(f"\n[DEBUG] ========== process_media_background START ==========")
-    print(f"[DEBUG] User ID: {user_id}")
+    if _DEBUG:
+        print(f"\n[DEBUG] ========== process_media_background START ==========")
+        print(f"[DEBUG] User ID: {user_id}")
     
     # Determine the correct 'from' number (bot's number)
     # We use the 'To' field from the incoming request to ensure we reply from the correct number
     # This fixes issues where TWILIO_WHATSAPP_FROM might be misconfigured
     bot_from_number = request_form.get("To", TWILIO_WHATSAPP_FROM)
-    print(f"[DEBUG] Using sender number: {bot_from_number}")
+    if _DEBUG:
+        print(f"[DEBUG] Using sender number: {bot_from_number}")
     
     try:
         # Log media upload
@@ -682,14 +768,14 @@ def process_media_background(user_id: str, media_info: Dict[str, Any], request_f
             user_id,
             "media_upload_received",
             {
-                "media_type": media_info.get("media_content_type"),
-                "num_media": media_info.get("num_media"),
-                "timestamp": datetime.utcnow().isoformat(),
+                "media_type": media_info.media_content_type,
+                "num_media": media_info.num_media,
+                "timestamp": utcnow_iso(),
             },
         )
 
         # Download media file
-        media_url = media_info.get("media_url")
+        media_url = media_info.media_url
         if not media_url:
             twilio_client.messages.create(
                 from_=bot_from_number,
@@ -698,7 +784,7 @@ def process_media_background(user_id: str, media_info: Dict[str, Any], request_f
             )
             return
             
-        media_content_type = media_info.get("media_content_type", "")
+        media_content_type = media_info.media_content_type or ""
         
         # Get file extension from content type
         file_extension = None
@@ -708,7 +794,7 @@ def process_media_background(user_id: str, media_info: Dict[str, Any], request_f
             file_extension = ".jpg"
 
         # Check if this is a URL-based upload
-        is_url_upload = media_info.get("message_type") == "url"
+        is_url_upload = media_info.message_type == "url"
         
         # Download
         file_path, error = media_handler.download_media(
@@ -753,24 +839,35 @@ def process_media_background(user_id: str, media_info: Dict[str, Any], request_f
         print(f"[INFO] Extracting text from lab report: {file_info['name']}")
 
         try:
-            ocr_result = ocr_engine.extract_text(file_path)
-            ocr_text = ocr_result.get("text", "")
-            ocr_method = ocr_result.get("method", "unknown")
+            # One Groq Vision call returning biomarker JSON; falls back to
+            # OCR text + extraction if it fails or finds too little
+            biomarker_values, extraction_errors = None, []
+            direct_values = ocr_engine.extract_biomarkers(file_path)
+            if direct_values:
+                biomarker_values, extraction_errors = biomarker_extractor.validate_values(direct_values)
+                ocr_method = "groq"
+                if biomarker_values:
+                    print("[OK] Direct biomarker extraction successful (groq)")
 
-            if not ocr_text or len(ocr_text.strip()) < 50:
-                media_handler.cleanup_temp_file(file_path)
-                secure_logger.audit("ocr_extraction_failed", user_id, {"method": ocr_method})
-                twilio_client.messages.create(
-                    from_=bot_from_number,
-                    to=user_id,
-                    body="Could not extract text from lab report.\n\nPlease try:\n- Send a clearer PDF/image\n- Ensure text is readable"
-                )
-                return
+            if not biomarker_values:
+                ocr_result = ocr_engine.extract_text(file_path)
+                ocr_text = ocr_result.get("text", "")
+                ocr_method = ocr_result.get("method", "unknown")
+
+                if not ocr_text or len(ocr_text.strip()) < 50:
+                    media_handler.cleanup_temp_file(file_path)
+                    secure_logger.audit("ocr_extraction_failed", user_id, {"method": ocr_method})
+                    twilio_client.messages.create(
+                        from_=bot_from_number,
+                        to=user_id,
+                        body="Could not extract text from lab report.\n\nPlease try:\n- Send a clearer PDF/image\n- Ensure text is readable"
+                    )
+                    return
 
-            print(f"[OK] OCR extraction successful ({ocr_method}): {len(ocr_text)} characters")
+                print(f"[OK] OCR extraction successful ({ocr_method}): {len(ocr_text)} characters")
 
-            # Extract biomarker values
-            biomarker_values, extraction_errors = biomarker_extractor.extract_from_text(ocr_text)
+                # Extract biomarker values
+                biomarker_values, extraction_errors = biomarker_extractor.extract_from_text(ocr_text)
 
             if not biomarker_values:
                 media_handler.cleanup_temp_file(file_path)
@@ -850,7 +947,7 @@ def process_media_background(user_id: str, media_info: Dict[str, Any], request_f
         )
 
 
-def handle_media_upload(user_id: str, media_info: Dict[str, Any], request_form: Dict[str, Any]) -> str:
+def handle_media_upload(user_id: str, media_info: MediaInfo, request_form: Dict[str, Any]) -> str:
     """
     Handle media upload by spawning a background thread.
     Returns empty TwiML immediately to avoid timeouts.
@@ -868,9 +965,101 @@ def handle_media_upload(user_id: str, media_info: Dict[str, Any], request_form:
     # Return empty TwiML to acknowledge receipt
     # We can optionally send a "Processing..." message here if desired, 
     # but for now we'll just let the background thread handle the response.
-    resp = MessagingResponse()
-    # resp.message("🔄 Processing your lab report... This may take a few seconds.")
-    return str(resp)
+    # return twiml_reply("🔄 Processing your lab report... This may take a few seconds.")
+    return EMPTY_TWIML
+
+
+def _build_reply(user_id: str, body: str) -> str:
+    """Run a text message through handle_message, never returning an empty reply."""
+    try:
+        reply_text = handle_message(user_id, body if body else "")
+        if _DEBUG:
+            print(f"[DEBUG] handle_message returned: {reply_text[:100] if reply_text else '(empty)'}...")
+    except Exception as e:
+        print(f"[ERROR] Error in handle_message: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        reply_text = f"Error processing message: {str(e)}. Please try again or type 'help'."
+
+    if not reply_text or len(reply_text.strip()) == 0:
+        print(f"[WARN] Empty reply text, sending default message")
+        reply_text = "I received your message but couldn't process it. Type 'help' for instructions."
+    return reply_text
+
+
+def _process_and_reply(user_id: str, body: str, bot_from_number: str) -> None:
+    """
+    Background task to answer a text message via Twilio API.
+    """
+    reply_text = _build_reply(user_id, body)
+    if reply_text == EMPTY_TWIML:
+        # A file URL: handle_media_upload's background thread replies
+        return
+    try:
+        chunks = chunk_message(reply_text, max_length=1500)
+        for chunk in chunks:
+            twilio_client.messages.create(from_=bot_from_number, to=user_id, body=chunk)
+        print(f"[OK] Sent response ({len(chunks)} chunk(s), total length: {len(reply_text)} chars)")
+    except Exception as e:
+        print(f"[ERROR] Error sending reply to {user_id}: {str(e)}")
+        import traceback
+        traceback.print_exc()
+
+
+def _submit_reply(user_id: str, body: str, bot_from_number: str) -> None:
+    """Queue a text message for a background reply, behind the user's earlier ones."""
+    with _pending_replies_lock:
+        pending = _pending_replies.get(user_id)
+        if pending is not None:
+            if len(pending) >= MAX_PENDING_REPLIES:
+                print(f"[WARN] Dropping message from {user_id}: {len(pending)} already queued")
+                return
+            pending.append((body, bot_from_number))
+            return
+        _pending_replies[user_id] = deque([(body, bot_from_number)])
+    _reply_executor.submit(_drain_replies, user_id)
+
+
+def _drain_replies(user_id: str) -> None:
+    """
+    Background task answering a user's queued messages in order.
+    """
+    while True:
+        with _pending_replies_lock:
+            pending = _pending_replies[user_id]
+            if not pending:
+                del _pending_replies[user_id]
+                return
+            body, bot_from_number = pending.popleft()
+        try:
+            _process_and_reply(user_id, body, bot_from_number)
+        except Exception as e:
+            print(f"[ERROR] Error replying to {user_id}: {str(e)}")
+            import traceback
+            traceback.print_exc()
+
+
+# TwiML is rendered from a template rather than with twilio's
+# MessagingResponse; the output is identical but skips building and
+# serializing an element tree
+_TWIML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>'
+EMPTY_TWIML = _TWIML_HEADER + "<Response />"
+
+
+def twiml_reply(*messages: str) -> str:
+    """
+    Render a TwiML response that sends the given messages.
+
+    Args:
+        messages: Message bodies, one <Message> each
+
+    Returns:
+        TwiML document string
+    """
+    if not messages:
+        return EMPTY_TWIML
+    body = "".join(f"<Message>{xml_escape(message)}</Message>" for message in messages)
+    return f"{_TWIML_HEADER}<Response>{body}</Response>"
 
 
 # ---------------------------
@@ -879,7 +1068,9 @@ def handle_media_upload(user_id: str, media_info: Dict[str, Any], request_form:
 
 @app.before_request
 def log_all_requests():
-    """Log ALL incoming requests for debugging."""
+    """Log ALL incoming requests for debugging (MEDIGUARD_DEBUG=1 only)."""
+    if not _DEBUG:
+        return
     print(f"\n{'='*60}")
     print(f"[DEBUG] ===== INCOMING REQUEST =====")
     print(f"[DEBUG] Method: {request.method}")
@@ -920,8 +1111,6 @@ def whatsapp_webhook():
         return "Webhook endpoint is active. Use POST for messages.", 200
     
     try:
-        init_db()  # Ensure tables exist
-
         from_number = request.form.get("From", "")
         body = request.form.get("Body", "").strip()
         user_id = from_number or "unknown"
@@ -937,51 +1126,51 @@ def whatsapp_webhook():
                 print(f"[WARN] Unknown error code: {error_code}")
 
         # DEBUG: Log all incoming request data
-        print(f"\n{'='*60}")
-        print(f"[DEBUG] WhatsApp Webhook Received")
-        print(f"[DEBUG] User ID: {user_id}")
-        print(f"[DEBUG] Body: {body[:100] if body else '(empty)'}")
-        print(f"[DEBUG] ErrorCode: {error_code if error_code else 'None'}")
-        print(f"[DEBUG] NumMedia: {request.form.get('NumMedia', '0')}")
-        print(f"[DEBUG] MediaUrl0: {request.form.get('MediaUrl0', 'None')[:100] if request.form.get('MediaUrl0') else 'None'}")
-        print(f"[DEBUG] MediaContentType0: {request.form.get('MediaContentType0', 'None')}")
-        print(f"[DEBUG] MessageType: {request.form.get('MessageType', 'None')}")
-        print(f"[DEBUG] All form keys: {list(request.form.keys())}")
-        print(f"[DEBUG] All form values:")
-        for key, value in request.form.items():
-            if isinstance(value, str) and len(value) > 100:
-                print(f"[DEBUG]   {key}: {value[:100]}...")
-            else:
-                print(f"[DEBUG]   {key}: {value}")
-        print(f"{'='*60}\n")
+        if _DEBUG:
+            print(f"\n{'='*60}")
+            print(f"[DEBUG] WhatsApp Webhook Received")
+            print(f"[DEBUG] User ID: {user_id}")
+            print(f"[DEBUG] Body: {body[:100] if body else '(empty)'}")
+            print(f"[DEBUG] ErrorCode: {error_code if error_code else 'None'}")
+            print(f"[DEBUG] NumMedia: {request.form.get('NumMedia', '0')}")
+            print(f"[DEBUG] MediaUrl0: {request.form.get('MediaUrl0', 'None')[:100] if request.form.get('MediaUrl0') else 'None'}")
+            print(f"[DEBUG] MediaContentType0: {request.form.get('MediaContentType0', 'None')}")
+            print(f"[DEBUG] MessageType: {request.form.get('MessageType', 'None')}")
+            print(f"[DEBUG] All form keys: {list(request.form.keys())}")
+            print(f"[DEBUG] All form values:")
+            for key, value in request.form.items():
+                if isinstance(value, str) and len(value) > 100:
+                    print(f"[DEBUG]   {key}: {value[:100]}...")
+                else:
+                    print(f"[DEBUG]   {key}: {value}")
+            print(f"{'='*60}\n")
 
         # Check for media attachments (PDF/image lab reports) FIRST
         # This must happen even if Body is empty (ErrorCode 11200 case)
         media_info = extract_media_from_twilio_request(dict(request.form))
         if media_info:
-            print(f"[INFO] [OK] Media detected! Type: {media_info.get('media_content_type', 'unknown')}")
-            print(f"[INFO] Media URL: {media_info.get('media_url', '')[:100]}...")
+            print(f"[INFO] [OK] Media detected! Type: {media_info.media_content_type or 'unknown'}")
+            print(f"[INFO] Media URL: {media_info.media_url[:100]}...")
             
             # If ErrorCode 11200, add warning to response
             if error_code == "11200":
                 print(f"[WARN] Processing media despite ErrorCode 11200 - Twilio retrieval failed, but URL may still be accessible")
             
             result = handle_media_upload(user_id, media_info, dict(request.form))
-            print(f"[DEBUG] handle_media_upload returned response (length: {len(result) if result else 0})")
+            if _DEBUG:
+                print(f"[DEBUG] handle_media_upload returned response (length: {len(result) if result else 0})")
             return result
         
         # Handle ErrorCode 11200 case (media upload failed by Twilio)
         if error_code == "11200" and not body:
             print(f"[ERROR] ErrorCode 11200: Twilio couldn't retrieve media and no body text")
-            resp = MessagingResponse()
-            resp.message(
+            return twiml_reply(
                 "I received your media upload, but Twilio couldn't retrieve it.\n\n"
                 "Please try:\n"
                 "- For PDFs: Send as image instead, or share via Google Drive link\n"
                 "- For images: Ensure file is under 10MB and in JPG/PNG format\n"
                 "- Or use 'template' command to enter values manually"
             )
-            return str(resp)
 
         # IMPORTANT: Process ALL text messages through handle_message
         # This allows JSON/key-value/CSV input to be parsed correctly
@@ -989,58 +1178,39 @@ def whatsapp_webhook():
         print(f"[INFO] No media detected, processing as text message")
         print(f"[INFO] Received message from {user_id}: {body[:50] if body else '(empty)'}...")
 
-        # Process text message
-        try:
-            reply_text = handle_message(user_id, body if body else "")
-            print(f"[DEBUG] handle_message returned: {reply_text[:100] if reply_text else '(empty)'}...")
-        except Exception as e:
-            print(f"[ERROR] Error in handle_message: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            reply_text = f"Error processing message: {str(e)}. Please try again or type 'help'."
+        # Reply through the REST API from a worker thread so the webhook
+        # returns immediately; without a sender to reply to, answer inline
+        if from_number:
+            bot_from_number = request.form.get("To", TWILIO_WHATSAPP_FROM)
+            _submit_reply(user_id, body, bot_from_number)
+            return EMPTY_TWIML
+
+        reply_text = _build_reply(user_id, body)
+        if reply_text == EMPTY_TWIML:
+            # A file URL: handle_media_upload's background thread replies
+            return EMPTY_TWIML
 
-        # Send response (chunked if necessary)
-        if not reply_text or len(reply_text.strip()) == 0:
-            print(f"[WARN] Empty reply text, sending default message")
-            reply_text = "I received your message but couldn't process it. Type 'help' for instructions."
-        
         try:
-            resp = MessagingResponse()
             chunks = chunk_message(reply_text, max_length=1500)
 
-            for chunk in chunks:
-                resp.message(chunk)
-
             print(f"[OK] Sent response ({len(chunks)} chunk(s), total length: {len(reply_text)} chars)")
-            response_str = str(resp)
-            print(f"[DEBUG] Response XML length: {len(response_str)}")
+            response_str = twiml_reply(*chunks)
+            if _DEBUG:
+                print(f"[DEBUG] Response XML length: {len(response_str)}")
             return response_str
         except Exception as e:
             print(f"[ERROR] Error creating response: {str(e)}")
             import traceback
             traceback.print_exc()
-            # Try to send at least an error message
-            try:
-                resp = MessagingResponse()
-                resp.message("Error processing your message. Please try again or type 'help'.")
-                return str(resp)
-            except Exception as e3:
-                print(f"[ERROR] Final fallback failed: {str(e3)}")
-                return '<?xml version="1.0" encoding="UTF-8"?><Response><Message>Error. Please try again.</Message></Response>'
+            # Send at least an error message
+            return twiml_reply("Error processing your message. Please try again or type 'help'.")
     
     except Exception as e:
         print(f"[ERROR] Error in whatsapp_webhook: {str(e)}")
         import traceback
         traceback.print_exc()
         # Return error response to Twilio
-        try:
-            resp = MessagingResponse()
-            resp.message("An error occurred processing your message. Please try again or type 'help'.")
-            return str(resp)
-        except Exception as e2:
-            print(f"[ERROR] Failed to create error response: {str(e2)}")
-            # Return minimal valid TwiML
-            return '<?xml version="1.0" encoding="UTF-8"?><Response><Message>Error. Please try again.</Message></Response>'
+        return twiml_reply("An error occurred processing your message. Please try again or type 'help'.")
 
 
 @app.route("/health", methods=["GET"])
@@ -1078,7 +1248,7 @@ def test_endpoint():
     return {
         "status": "ok",
         "message": "Server is running and accessible",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": utcnow_iso(),
         "method": request.method,
         "received_data": dict(request.form) if request.method == "POST" else {}
     }, 200
@@ -2,20 +2,57 @@
 Test Suite for MediGuard AI
 """
 
+import importlib
+import os
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
 import pytest
 import json
 from mediguard.models.scaler import BiomarkerScaler
 from mediguard.models.predictor import MediGuardPredictor
 from mediguard.parsers.input_parser import BiomarkerInputParser
+from mediguard.parsers.biomarker_extractor import BiomarkerExtractor
 from mediguard.knowledge.rag_engine import MedicalRAGEngine
-from mediguard.utils.security import anonymize_user_id, validate_input_security
+from mediguard.utils.security import SecureLogger, anonymize_user_id, validate_input_security
+from mediguard.utils.db import get_connection
 from mediguard.utils.formatters import format_prediction_response, chunk_message
+from mediguard.utils.media_handler import MediaHandler
+from mediguard.utils import llm_provider
 
 
 # ---------------------------
 # Fixtures
 # ---------------------------
 
+# Components are stateless after construction, so one instance serves every test
+
+@pytest.fixture(scope="session")
+def scaler():
+    """Shared BiomarkerScaler."""
+    return BiomarkerScaler()
+
+
+@pytest.fixture(scope="session")
+def predictor():
+    """Shared MediGuardPredictor."""
+    return MediGuardPredictor()
+
+
+@pytest.fixture(scope="session")
+def rag():
+    """Shared MedicalRAGEngine."""
+    return MedicalRAGEngine()
+
+
+@pytest.fixture(scope="session")
+def parser():
+    """Shared BiomarkerInputParser."""
+    return BiomarkerInputParser()
+
+
 @pytest.fixture
 def normal_values():
     """Normal biomarker values for testing."""
@@ -89,9 +126,8 @@ def test_scaler_initialization():
     assert "hemoglobin" in scaler.biomarkers
 
 
-def test_scaler_normal_values(normal_values):
+def test_scaler_normal_values(scaler, normal_values):
     """Test scaling of normal biomarker values."""
-    scaler = BiomarkerScaler()
     result = scaler.scale_all(normal_values)
 
     assert "scaled_values" in result
@@ -103,9 +139,8 @@ def test_scaler_normal_values(normal_values):
     assert len(result["warnings"]) == 0
 
 
-def test_scaler_abnormal_values(sepsis_values):
+def test_scaler_abnormal_values(scaler, sepsis_values):
     """Test scaling detects abnormal values."""
-    scaler = BiomarkerScaler()
     result = scaler.scale_all(sepsis_values)
 
     # Should generate warnings for abnormal values
@@ -116,9 +151,18 @@ def test_scaler_abnormal_values(sepsis_values):
     assert "CRITICAL" in warning_text or "HIGH" in warning_text or "LOW" in warning_text
 
 
-def test_scaler_missing_biomarker():
+def test_scaler_summary_rounding(scaler, normal_values):
+    """Test summary scaled values are Python floats rounded like round()."""
+    result = scaler.scale_all({**normal_values, "lactate": 13.815})
+    scaled = result["raw_summary"]["lactate"]["scaled_value"]
+
+    assert type(scaled) is float
+    assert scaled == round(result["scaled_values"][scaler.biomarker_order.index("lactate")].item(), 4)
+    assert scaled == 0.6907  # np.round gives 0.6908
+
+
+def test_scaler_missing_biomarker(scaler):
     """Test scaler raises error for missing biomarker."""
-    scaler = BiomarkerScaler()
     incomplete_values = {"hemoglobin": 14.5}
 
     with pytest.raises(ValueError, match="Missing biomarker"):
@@ -135,10 +179,8 @@ def test_predictor_initialization():
     assert len(predictor.disease_categories) == 9
 
 
-def test_predictor_normal_case(normal_values):
+def test_predictor_normal_case(scaler, predictor, normal_values):
     """Test prediction for normal values."""
-    scaler = BiomarkerScaler()
-    predictor = MediGuardPredictor()
 
     scaling_result = scaler.scale_all(normal_values)
     prediction = predictor.predict(
@@ -150,10 +192,8 @@ def test_predictor_normal_case(normal_values):
     assert prediction["confidence"] > 0.9
 
 
-def test_predictor_sepsis_case(sepsis_values):
+def test_predictor_sepsis_case(scaler, predictor, sepsis_values):
     """Test prediction for sepsis case."""
-    scaler = BiomarkerScaler()
-    predictor = MediGuardPredictor()
 
     scaling_result = scaler.scale_all(sepsis_values)
     prediction = predictor.predict(
@@ -167,7 +207,7 @@ def test_predictor_sepsis_case(sepsis_values):
     assert len(prediction["key_biomarkers"]) > 0
 
 
-def test_predictor_cardiac_case():
+def test_predictor_cardiac_case(scaler, predictor):
     """Test prediction for cardiac event."""
     cardiac_values = {
         "hemoglobin": 13.2,
@@ -196,8 +236,6 @@ def test_predictor_cardiac_case():
         "lactate": 2.0,
     }
 
-    scaler = BiomarkerScaler()
-    predictor = MediGuardPredictor()
 
     scaling_result = scaler.scale_all(cardiac_values)
     prediction = predictor.predict(
@@ -209,13 +247,23 @@ def test_predictor_cardiac_case():
     assert prediction["severity"] == "critical"
 
 
+def test_predictor_deviation_rounding(predictor, normal_values):
+    """Test key biomarker deviations are Python floats rounded like round()."""
+    raw_values = {**normal_values, "inr": 12.285}
+    key_biomarkers = predictor._identify_key_biomarkers(raw_values, "coagulopathy")
+
+    inr = next(kb for kb in key_biomarkers if kb["id"] == "inr")
+    assert type(inr["deviation"]) is float
+    assert inr["deviation"] == 11.29  # np.round gives 11.28
+    assert key_biomarkers[0]["id"] == "inr"
+
+
 # ---------------------------
 # BiomarkerInputParser Tests
 # ---------------------------
 
-def test_parser_json_format(normal_values):
+def test_parser_json_format(parser, normal_values):
     """Test parsing JSON format input."""
-    parser = BiomarkerInputParser()
     json_input = json.dumps(normal_values)
 
     parsed, errors = parser.parse(json_input)
@@ -225,9 +273,8 @@ def test_parser_json_format(normal_values):
     assert parsed == normal_values
 
 
-def test_parser_csv_format():
+def test_parser_csv_format(parser):
     """Test parsing CSV format input."""
-    parser = BiomarkerInputParser()
     csv_input = "14.5,7.2,250,95,1.0,15,138,4.2,102,9.5,25,30,0.8,4.0,7.0,180,0.02,50,1.5,10,0.03,0.3,1.0,1.5"
 
     parsed, errors = parser.parse(csv_input)
@@ -237,9 +284,8 @@ def test_parser_csv_format():
     assert len(parsed) == 24
 
 
-def test_parser_key_value_format():
+def test_parser_key_value_format(parser):
     """Test parsing key-value format input."""
-    parser = BiomarkerInputParser()
     kv_input = "hemoglobin=14.5, wbc_count=7.2, platelet_count=250, glucose=95, creatinine=1.0, bun=15, sodium=138, potassium=4.2, chloride=102, calcium=9.5, alt=25, ast=30, bilirubin_total=0.8, albumin=4.0, total_protein=7.0, ldh=180, troponin=0.02, bnp=50, crp=1.5, esr=10, procalcitonin=0.03, d_dimer=0.3, inr=1.0, lactate=1.5"
 
     parsed, errors = parser.parse(kv_input)
@@ -248,9 +294,40 @@ def test_parser_key_value_format():
     assert len(errors) == 0
 
 
-def test_parser_invalid_format():
+def test_parser_key_value_separators(parser):
+    """Test ':' pairs, newlines, segments without a separator and '=' precedence."""
+    values = {bio_id: float(i + 1) for i, bio_id in enumerate(parser.BIOMARKER_ORDER)}
+    lines = [f"{bio_id}: {value}" for bio_id, value in values.items()]
+    lines.insert(3, "fasting sample")
+
+    parsed, errors = parser.parse("\n".join(lines))
+    assert errors == []
+    assert parsed == values
+
+    parsed, errors = parser.parse("hb:x=14.5, wbc=7.2")
+    assert parsed is None
+    assert errors == ["Unknown biomarker: hb:x"]
+
+
+def test_parser_key_value_long_segment(parser):
+    """Test a long segment without separators is skipped in linear time."""
+    def best_time(length):
+        text = "a" * length + ",hb:1"
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            parsed, errors = parser.parse(text)
+            timings.append(time.perf_counter() - start)
+        assert parsed is None
+        assert "Missing" in errors[0]
+        return min(timings)
+
+    # 16x the input: ~16x the time if linear, ~256x if quadratic
+    assert best_time(16000) < best_time(1000) * 80
+
+
+def test_parser_invalid_format(parser):
     """Test parser handles invalid format."""
-    parser = BiomarkerInputParser()
     invalid_input = "this is not valid biomarker data"
 
     parsed, errors = parser.parse(invalid_input)
@@ -259,9 +336,8 @@ def test_parser_invalid_format():
     assert len(errors) > 0
 
 
-def test_parser_incomplete_data():
+def test_parser_incomplete_data(parser):
     """Test parser detects missing biomarkers."""
-    parser = BiomarkerInputParser()
     incomplete = json.dumps({"hemoglobin": 14.5, "wbc_count": 7.2})
 
     parsed, errors = parser.parse(incomplete)
@@ -271,6 +347,47 @@ def test_parser_incomplete_data():
     assert "Missing" in errors[0]
 
 
+# ---------------------------
+# BiomarkerExtractor Tests
+# ---------------------------
+
+def test_extractor_regex_extraction():
+    """Test regex extraction from OCR-style lab report text."""
+    extractor = BiomarkerExtractor(use_llm=False)
+    ocr_text = (
+        "Hemoglobin: 14.5 g/dL\nWBC 7.2\nPlatelets 250\nSodium 138 mmol/L\n"
+        "Troponin I 0.02 ng/mL\nC-Reactive Protein 12\nTotal Protein 7.0\n"
+        "Lactate Dehydrogenase 180\nLactate 1.5\n"
+    )
+
+    result = extractor.extract_with_regex(ocr_text)
+
+    assert result["hemoglobin"] == 14.5
+    assert result["troponin"] == 0.02
+    assert result["crp"] == 12.0
+    assert result["total_protein"] == 7.0  # not the "protein" inside CRP's name
+    assert result["ldh"] == 180.0
+    assert result["lactate"] == 1.5
+    assert result["glucose"] is None
+
+
+@pytest.mark.parametrize("use_automaton", [True, False])
+def test_extractor_unicode_case_variants(monkeypatch, use_automaton):
+    """Test aliases matched through Unicode case folding don't break extraction."""
+    extractor = BiomarkerExtractor(use_llm=False)
+    if use_automaton and extractor._ALIAS_AUTOMATON is None:
+        pytest.skip("pyahocorasick not installed")
+    if not use_automaton:
+        monkeypatch.setattr(extractor, "_ALIAS_AUTOMATON", None)
+    ocr_text = "HEMOGLOB\u0130N 14.5\nA\u017fT 30\nWBC 7.2\nSodium 138\nPlatelets 250\nLactate 1.5\nGlucose 95\n"
+
+    result = extractor.extract_with_regex(ocr_text)
+
+    assert result["wbc_count"] == 7.2
+    assert result["sodium"] == 138.0
+    assert result["lactate"] == 1.5
+
+
 # ---------------------------
 # MedicalRAGEngine Tests
 # ---------------------------
@@ -281,9 +398,8 @@ def test_rag_initialization():
     assert len(rag.knowledge_base) > 0
 
 
-def test_rag_retrieve_references():
+def test_rag_retrieve_references(rag):
     """Test retrieving references for disease category."""
-    rag = MedicalRAGEngine()
     refs = rag.retrieve_references("sepsis", max_results=2)
 
     assert len(refs) > 0
@@ -292,18 +408,24 @@ def test_rag_retrieve_references():
     assert "citation" in refs[0]
 
 
-def test_rag_query():
+def test_rag_query(rag):
     """Test natural language query."""
-    rag = MedicalRAGEngine()
     results = rag.query("troponin myocardial infarction")
 
     assert len(results) > 0
     assert any("troponin" in r["content"].lower() for r in results)
 
 
-def test_rag_format_references():
+def test_rag_query_ranking(rag):
+    """Test query ranks references by matched terms and ignores punctuation."""
+    results = rag.query("Is my hemoglobin low? Could it be anemia?")
+
+    assert results[0]["title"] == "Anemia Classification and Management"
+    assert rag.query("zzzz") == []
+
+
+def test_rag_format_references(rag):
     """Test reference formatting."""
-    rag = MedicalRAGEngine()
     refs = rag.retrieve_references("cardiac_event")
     formatted = rag.format_references(refs)
 
@@ -359,6 +481,40 @@ def test_input_validation_script_injection():
     assert "Suspicious pattern" in error
 
 
+def test_input_validation_case_variants():
+    """Test patterns are reported in canonical form for any case variant."""
+    is_valid, error = validate_input_security("1 uNiOn SeLeCt password")
+    assert is_valid is False
+    assert error == "Suspicious pattern detected: UNION SELECT"
+
+    # Non-ASCII case-fold matches (dotted capital I, long s) must not crash
+    is_valid, error = validate_input_security("1 UN\u0130ON SELECT password")
+    assert is_valid is False
+    assert error == "Suspicious pattern detected: UNION SELECT"
+
+    is_valid, error = validate_input_security("<\u017fcript>")
+    assert is_valid is False
+    assert error == "Suspicious pattern detected: <script"
+
+
+@pytest.mark.parametrize("pattern", [
+    "'; DROP TABLE", "'; DELETE FROM", "UNION SELECT", "'; INSERT INTO",
+    "<script", "javascript:", "onerror=",
+])
+def test_input_validation_each_pattern(pattern):
+    """Test every suspicious pattern is detected in any case and named canonically."""
+    for variant in (pattern, pattern.lower(), pattern.upper()):
+        is_valid, error = validate_input_security(f"hemoglobin=14.5 {variant} x")
+        assert is_valid is False
+        assert error == f"Suspicious pattern detected: {pattern}"
+
+
+def test_input_validation_benign_text():
+    """Test ordinary lab text isn't flagged by substring lookalikes."""
+    benign = "Selection: union of results, select hemoglobin; onerror handling, script=no"
+    assert validate_input_security(benign) == (True, None)
+
+
 def test_input_validation_length():
     """Test validation rejects excessive length."""
     too_long = "a" * 20000
@@ -368,6 +524,117 @@ def test_input_validation_length():
     assert "too long" in error
 
 
+def test_secure_logger_batches_writes(tmp_path):
+    """Test queued log and audit rows are written on flush."""
+    db_path = str(tmp_path / "logs.db")
+    logger = SecureLogger(db_path)
+
+    for _ in range(3):
+        logger.log_event("+15551234567", "input_received", {"num_biomarkers": 5, "name": "x"})
+    logger.audit("session_reset", "+15551234567")
+    logger.flush()
+
+    conn = get_connection(db_path)
+    rows = conn.execute("SELECT num_biomarkers, event_data FROM mediguard_logs").fetchall()
+    assert len(rows) == 3
+    assert rows[0]["num_biomarkers"] == 5
+    assert rows[0]["event_data"] is None
+    assert conn.execute("SELECT COUNT(*) FROM mediguard_audit").fetchone()[0] == 1
+
+
+def test_secure_logger_keeps_rows_on_failed_flush(tmp_path):
+    """Test a batch that fails to write is queued again, not dropped."""
+    db_path = str(tmp_path / "logs.db")
+    logger = SecureLogger(db_path)
+    conn = get_connection(db_path)
+
+    conn.execute("ALTER TABLE mediguard_audit RENAME TO mediguard_audit_moved")
+    logger.log_event("+15551234567", "input_received", {"num_biomarkers": 5})
+    logger.audit("session_reset", "+15551234567")
+    with pytest.raises(sqlite3.OperationalError):
+        logger.flush()
+
+    conn.execute("ALTER TABLE mediguard_audit_moved RENAME TO mediguard_audit")
+    logger.flush()
+    assert conn.execute("SELECT COUNT(*) FROM mediguard_logs").fetchone()[0] == 1
+    assert conn.execute("SELECT COUNT(*) FROM mediguard_audit").fetchone()[0] == 1
+
+
+# ---------------------------
+# LLM Provider Tests
+# ---------------------------
+
+class _StatusError(Exception):
+    """Exception carrying an HTTP status, like the Groq SDK's API errors."""
+
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def test_circuit_breaker_transitions(monkeypatch):
+    """Test open -> half-open -> closed/open, including non-provider probe errors."""
+    breaker = llm_provider._CircuitBreaker(threshold=2, cooldown=0.0)
+    monkeypatch.setattr(llm_provider, "_breaker", breaker)
+
+    outcomes = []
+
+    @llm_provider._retry_with_backoff
+    def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def trip():
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.state == "OPEN"
+
+    # A probe that gets a 400 proves Groq is reachable and closes the breaker
+    trip()
+    outcomes.append(_StatusError(400))
+    with pytest.raises(_StatusError):
+        call()
+    assert breaker.state == "CLOSED"
+
+    # A failing probe re-opens it without retrying
+    trip()
+    outcomes.append(_StatusError(503))
+    with pytest.raises(_StatusError):
+        call()
+    assert breaker.state == "OPEN"
+
+    # A successful probe closes it
+    outcomes.append("ok")
+    assert call() == "ok"
+    assert breaker.state == "CLOSED"
+
+    # Within the cooldown calls fail fast
+    breaker.cooldown = 3600.0
+    trip()
+    with pytest.raises(llm_provider.CircuitOpenError):
+        call()
+
+
+# ---------------------------
+# Media Handler Tests
+# ---------------------------
+
+def test_media_type_detection(tmp_path):
+    """Test file type detection from magic bytes and Content-Type."""
+    handler = MediaHandler(temp_dir=str(tmp_path))
+
+    assert handler._sniff_extension(b"%PDF-1.7\n") == ".pdf"
+    assert handler._sniff_extension(b"\xff\xd8\xff\xe0") == ".jpg"
+    assert handler._sniff_extension(b"\x89PNG\r\n\x1a\n") == ".png"
+    assert handler._sniff_extension(b"<html>") is None
+    assert handler._sniff_extension(b"") is None
+
+    assert handler._get_extension_from_content_type("Image/JPEG; charset=binary") == ".jpg"
+    assert handler._get_extension_from_content_type("application/octet-stream") is None
+
+
 # ---------------------------
 # Formatter Tests
 # ---------------------------
@@ -392,11 +659,8 @@ def test_chunk_message_long():
     assert f"({len(chunks)}/{len(chunks)})" in chunks[-1]
 
 
-def test_format_prediction_response(normal_values):
+def test_format_prediction_response(scaler, predictor, rag, normal_values):
     """Test prediction response formatting."""
-    scaler = BiomarkerScaler()
-    predictor = MediGuardPredictor()
-    rag = MedicalRAGEngine()
 
     scaling_result = scaler.scale_all(normal_values)
     prediction = predictor.predict(scaling_result["scaled_values"], normal_values)
@@ -418,12 +682,8 @@ def test_format_prediction_response(normal_values):
 # Integration Tests
 # ---------------------------
 
-def test_full_pipeline_normal(normal_values):
+def test_full_pipeline_normal(scaler, predictor, rag, parser, normal_values):
     """Test full prediction pipeline with normal values."""
-    parser = BiomarkerInputParser()
-    scaler = BiomarkerScaler()
-    predictor = MediGuardPredictor()
-    rag = MedicalRAGEngine()
 
     # Parse input
     json_input = json.dumps(normal_values)
@@ -446,12 +706,8 @@ def test_full_pipeline_normal(normal_values):
     assert len(references) > 0
 
 
-def test_full_pipeline_sepsis(sepsis_values):
+def test_full_pipeline_sepsis(scaler, predictor, rag, parser, sepsis_values):
     """Test full prediction pipeline with sepsis values."""
-    parser = BiomarkerInputParser()
-    scaler = BiomarkerScaler()
-    predictor = MediGuardPredictor()
-    rag = MedicalRAGEngine()
 
     # Parse input
     json_input = json.dumps(sepsis_values)
@@ -476,5 +732,139 @@ def test_full_pipeline_sepsis(sepsis_values):
     assert any("sepsis" in r["title"].lower() for r in references)
 
 
+
+# ---------------------------
+# Webhook Tests
+# ---------------------------
+
+@pytest.fixture(scope="module")
+def bot():
+    """The bot module, importable with placeholder Twilio credentials."""
+    os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACtest")
+    os.environ.setdefault("TWILIO_AUTH_TOKEN", "test")
+    return importlib.import_module("mediguard_bot")
+
+
+def test_webhook_replies_in_order_per_user(bot, monkeypatch):
+    """Test text replies are sent in the background, one user's in arrival order."""
+    sent = []
+    done = threading.Event()
+
+    def create(from_, to, body):
+        sent.append((from_, to, body))
+        if len(sent) == 3:
+            done.set()
+
+    def build_reply(user_id, body):
+        if body == "first":
+            time.sleep(0.2)  # a slow reply must not be overtaken
+        return f"reply to {body}"
+
+    monkeypatch.setattr(bot, "twilio_client", SimpleNamespace(messages=SimpleNamespace(create=create)))
+    monkeypatch.setattr(bot, "_build_reply", build_reply)
+
+    client = bot.app.test_client()
+    for body in ("first", "second", "third"):
+        response = client.post("/whatsapp", data={
+            "From": "whatsapp:+15550001111",
+            "To": "whatsapp:+15550002222",
+            "Body": body,
+        })
+        # Acknowledged immediately, without an inline reply
+        assert response.status_code == 200
+        assert response.get_data(as_text=True) == bot.EMPTY_TWIML
+
+    assert done.wait(5)
+    assert sent == [
+        ("whatsapp:+15550002222", "whatsapp:+15550001111", f"reply to {body}")
+        for body in ("first", "second", "third")
+    ]
+
+
+def test_webhook_file_url_not_sent_as_text(bot, monkeypatch):
+    """Test the media path's empty TwiML is never sent to the user as a message."""
+    sent = []
+    handled = threading.Event()
+
+    def handle_message(user_id, body):
+        # As when the text held a file URL handed to handle_media_upload
+        handled.set()
+        return bot.EMPTY_TWIML
+
+    monkeypatch.setattr(bot, "twilio_client", SimpleNamespace(messages=SimpleNamespace(
+        create=lambda from_, to, body: sent.append(body))))
+    monkeypatch.setattr(bot, "handle_message", handle_message)
+
+    client = bot.app.test_client()
+    response = client.post("/whatsapp", data={
+        "From": "whatsapp:+15550003333",
+        "To": "whatsapp:+15550002222",
+        "Body": "my report",
+    })
+    assert response.get_data(as_text=True) == bot.EMPTY_TWIML
+    assert handled.wait(5)
+    deadline = time.time() + 5
+    while "whatsapp:+15550003333" in bot._pending_replies and time.time() < deadline:
+        time.sleep(0.01)
+    assert sent == []
+
+    # Inline path (no sender) answers with the empty TwiML itself
+    response = client.post("/whatsapp", data={"Body": "my report"})
+    assert response.get_data(as_text=True) == bot.EMPTY_TWIML
+
+
+def test_webhook_pending_replies_capped(bot, monkeypatch):
+    """Test one sender cannot queue more than MAX_PENDING_REPLIES messages."""
+    sent = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def build_reply(user_id, body):
+        started.set()
+        release.wait(5)
+        return f"reply to {body}"
+
+    monkeypatch.setattr(bot, "twilio_client", SimpleNamespace(messages=SimpleNamespace(
+        create=lambda from_, to, body: sent.append(body))))
+    monkeypatch.setattr(bot, "_build_reply", build_reply)
+    monkeypatch.setattr(bot, "MAX_PENDING_REPLIES", 2)
+
+    client = bot.app.test_client()
+    form = {"From": "whatsapp:+15550004444", "To": "whatsapp:+15550002222"}
+    client.post("/whatsapp", data={**form, "Body": "0"})
+    assert started.wait(5)
+    for i in range(1, 6):
+        client.post("/whatsapp", data={**form, "Body": str(i)})
+    release.set()
+
+    deadline = time.time() + 5
+    while "whatsapp:+15550004444" in bot._pending_replies and time.time() < deadline:
+        time.sleep(0.01)
+    # The one in flight plus the two queued; the rest were dropped
+    assert sent == ["reply to 0", "reply to 1", "reply to 2"]
+
+
+def test_webhook_inline_reply_without_sender(bot, monkeypatch):
+    """Test a message without a From number is answered inline as TwiML."""
+    monkeypatch.setattr(bot, "_build_reply", lambda user_id, body: f"reply to <{body}>")
+
+    response = bot.app.test_client().post("/whatsapp", data={"Body": "hello"})
+
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == bot.twiml_reply("reply to <hello>")
+    assert "<Message>reply to &lt;hello&gt;</Message>" in response.get_data(as_text=True)
+
+
+def test_webhook_body_size_limit(bot, monkeypatch):
+    """Test only oversized /whatsapp posts are refused."""
+    monkeypatch.setattr(bot, "_build_reply", lambda user_id, body: "ok")
+    client = bot.app.test_client()
+
+    # A maximum-length WhatsApp message of 4-byte characters still fits
+    assert client.post("/whatsapp", data={"Body": "\U0001F600" * 1600}).status_code == 200
+    too_big = "x" * (bot.WEBHOOK_MAX_CONTENT_LENGTH + 1)
+    assert client.post("/whatsapp", data={"Body": too_big}).status_code == 413
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
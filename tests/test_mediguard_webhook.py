@@ -4,11 +4,15 @@ Quick test script for MediGuard bot webhook endpoints.
 Run this while mediguard_bot.py is running.
 """
 
+import orjson
 import requests
-import json
 
 BASE_URL = "http://localhost:5000"
 
+# One keep-alive connection reused by every probe
+SESSION = requests.Session()
+SESSION.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
 def test_endpoint(method, path, data=None, description=""):
     """Test an endpoint and print results."""
     print(f"\n{'='*60}")
@@ -19,9 +23,9 @@ def test_endpoint(method, path, data=None, description=""):
     
     try:
         if method == "GET":
-            response = requests.get(f"{BASE_URL}{path}", timeout=5)
+            response = SESSION.get(f"{BASE_URL}{path}", timeout=5)
         elif method == "POST":
-            response = requests.post(f"{BASE_URL}{path}", data=data, timeout=5)
+            response = SESSION.post(f"{BASE_URL}{path}", data=data, timeout=5)
         else:
             print(f"❌ Unknown method: {method}")
             return
@@ -30,10 +34,10 @@ def test_endpoint(method, path, data=None, description=""):
         print(f"Headers: {dict(response.headers)}")
         
         try:
-            content = response.json()
+            content = orjson.loads(response.content)
             print(f"Response (JSON):")
-            print(json.dumps(content, indent=2))
-        except:
+            print(orjson.dumps(content, option=orjson.OPT_INDENT_2).decode())
+        except orjson.JSONDecodeError:
             print(f"Response (Text):")
             print(response.text[:500])
         